@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+"""Benchmarks
+Times database operations before and after they were optimised, using a
+throwaway database filled with generated entries.
+
+Run with:
+    python3 benchmarks.py [number of entries]
+
+Created: 2026
+Last Update: 2026-10-19
+Author: Alex Koumparos
+"""
+from collections import OrderedDict
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+
+from peewee import *
+
+import db_manager
+
+
+def use_database(path):
+    """Switch the db_manager models over to the database at `path` (the
+    same way the unit tests switch in their own database).
+    """
+    db_manager.db = SqliteDatabase(path)
+    for model in db_manager.tables:
+        model._meta.database = db_manager.db
+
+
+def generate_entries(count, employees=100, years=30):
+    """Generates `count` random entries for `employees` different employees,
+    spread over `years` years.
+
+    Yields the entries as OrderedDicts.
+    """
+    first_day = datetime.date(2018 - years, 1, 1).toordinal()
+    for i in range(count):
+        yield OrderedDict([
+            ('name', 'Employee {}'.format(random.randrange(employees))),
+            ('date', datetime.date.fromordinal(
+                first_day + random.randrange(365 * years)
+            )),
+            ('task_name', 'Task {}'.format(random.randrange(count))),
+            ('duration', random.randrange(1, 480)),
+            ('notes', 'Generated entry {}'.format(i)),
+        ])
+
+
+def best_time(function, repeats):
+    """Calls `function` `repeats` times.
+
+    Returns the fastest call's time in milliseconds.
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+# Benchmarks
+# ----------
+# Each benchmark takes a DBManager connected to the generated database and
+# returns a list of (description, milliseconds) results.
+
+def benchmark_date_range(dbm, repeats=20):
+    """Compares fetching a month of entries by comparing the date strings
+    (as view_entries_for_date_range used to) with using the indexed
+    day_number column.
+    """
+    start = datetime.date(2010, 3, 1)
+    end = datetime.date(2010, 3, 31)
+    LogEntry = db_manager.LogEntry
+
+    def by_date_string():
+        query = (LogEntry
+                 .select(LogEntry.id)
+                 .where((LogEntry.date >= start) & (LogEntry.date <= end))
+                 .tuples())
+        return list(query)
+
+    def by_day_number():
+        query = (LogEntry
+                 .select(LogEntry.id)
+                 .where(
+                     (LogEntry.day_number >= db_manager.day_number(start)) &
+                     (LogEntry.day_number <= db_manager.day_number(end))
+                 )
+                 .tuples())
+        return list(query)
+
+    return [
+        ("date range, date strings", best_time(by_date_string, repeats)),
+        ("date range, day numbers", best_time(by_day_number, repeats)),
+    ]
+
+
+BENCHMARKS = [
+    benchmark_date_range,
+]
+
+
+def main(entries=100000):
+    """Generates a database of `entries` entries and prints the results of
+    every benchmark against it.
+    """
+    random.seed(1)
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'benchmark.db')
+    use_database(path)
+    dbm = db_manager.DBManager()
+    print("Generating {} entries...".format(entries))
+    dbm.upsert_entries(generate_entries(entries), batch_size=500)
+    for benchmark in BENCHMARKS:
+        for description, milliseconds in benchmark(dbm):
+            print("{:<40} {:>10.3f} ms".format(description, milliseconds))
+    db_manager.db.close()
+    os.remove(path)
+    os.rmdir(directory)
+
+# ---------------------------
+
+if __name__ == "__main__":
+
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,505 @@
+#!/usr/bin/env python3
+
+"""CSV Manager
+Imports work log entries from CSV files.
+
+Files are streamed a row at a time and written to the database in large
+batches, so even files far bigger than memory can be imported. Large files
+can instead be memory-mapped and split into chunks that are parsed in
+parallel by a pool of processes (see CsvManager.import_file_parallel).
+
+Created: 2026
+Last Update: 2026-10-19
+Author: Alex Koumparos
+"""
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import datetime
+import itertools
+import mmap
+import os
+
+from db_manager import DBManager, Employee, Task
+import wl_settings as settings
+
+
+# how much of a memory-mapped file is read between handing the pages that
+# have been read back to the OS
+RELEASE_SIZE = 4 * 1024 * 1024
+
+
+# Error codes for invalid rows (see CsvManager.validate_rows). Each is a
+# separate bit, so a row's code can record several problems at once
+INVALID_DATE = 1
+FUTURE_DATE = 2
+EARLY_DATE = 4
+INVALID_DURATION = 8
+NEGATIVE_DURATION = 16
+FIELD_TOO_LONG = 32
+MISSING_VALUES = 64
+
+ERROR_MESSAGES = OrderedDict([
+    (MISSING_VALUES, "the row is missing some values"),
+    (INVALID_DATE, "{date} is not a valid date"),
+    (FUTURE_DATE, "dates in the future are not permitted"),
+    (EARLY_DATE, "dates before {earliest_date} are not permitted"),
+    (INVALID_DURATION, "{duration} is not a whole number of minutes"),
+    (NEGATIVE_DURATION, "durations can't be negative"),
+    (FIELD_TOO_LONG, "the name and task name can't be longer than "
+                     "{max_length} characters"),
+])
+
+
+class CsvManager:
+    """Reads work log entries from CSV files and imports them into the
+    database.
+
+    A file must start with a header row containing the column names in
+    settings.HEADERS (in any order, other columns are ignored).
+    """
+    def __init__(self, date_formats=None, batch_size=5000,
+                 allow_future_dates=True, earliest_date=None):
+        """`date_formats` is a list of settings.DATE_FORMATS values that the
+        dates may be written in, tried in order (by default, all of them).
+
+        `batch_size` is the number of entries validated and written at a
+        time (each batch is written in one transaction).
+
+        Dates after today are rejected unless `allow_future_dates` is True,
+        and dates before `earliest_date` (a date, if given) are rejected.
+        """
+        if date_formats is None:
+            date_formats = list(settings.DATE_FORMATS.values())
+        self.date_formats = date_formats
+        self.batch_size = batch_size
+        self.allow_future_dates = allow_future_dates
+        self.earliest_date = earliest_date
+        # date string -> (error, date). Timesheets repeat the same few dates
+        # over and over so each one only needs parsing once
+        self.parsed_dates = {}
+
+    def import_file(self, file_path):
+        """Imports every valid entry in the CSV file at `file_path` that
+        isn't already in the database.
+
+        Raises ValueError if the header row is missing a column, or if the
+        file isn't valid CSV (e.g., a quoted field that never ends), in
+        which case the batches before the bad row have still been imported.
+
+        Returns an OrderedDict with the number of rows read, the number of
+        entries written, and a list of (line number, error) tuples for the
+        rows that couldn't be imported.
+        """
+        rows_read = 0
+        written = 0
+        errors = []
+        dbm = DBManager()
+        # a buffered text file already streams in constant memory, and is
+        # quicker line by line than reading through a memory map.
+        # utf-8-sig skips the byte order mark Excel starts its files with
+        with open(file_path, newline='', encoding='utf-8-sig') as csv_file:
+            reader = csv.reader(csv_file)
+            try:
+                header = next(reader, None)
+                if header is None:
+                    return OrderedDict([('rows', 0), ('written', 0),
+                                        ('errors', [])])
+                columns = self.header_columns(header)
+                for line_numbers, rows in self.read_batches(reader):
+                    rows_read += len(rows)
+                    codes, entries = self.validate_rows(rows, columns)
+                    errors.extend(self.describe_errors(line_numbers, rows,
+                                                       columns, codes))
+                    # each batch is written in one transaction, one insert
+                    # per entry (see DBManager.upsert_entries)
+                    written += dbm.upsert_entries(
+                        [entry for entry in entries if entry is not None]
+                    )
+            except csv.Error as err:
+                print("CSV format error!")
+                print("detailed error information:")
+                print("line {}: {}".format(reader.line_num, err))
+                raise ValueError("line {}: {}".format(reader.line_num, err))
+        return OrderedDict([
+            ('rows', rows_read),
+            ('written', written),
+            ('errors', errors),
+        ])
+
+    def import_file_parallel(self, file_path, workers=None,
+                             chunk_size=1024 * 1024):
+        """Imports every valid entry in the CSV file at `file_path` that
+        isn't already in the database, parsing and validating the file in
+        parallel.
+
+        The file is memory-mapped and split into chunks of about
+        `chunk_size` bytes, each ending at a line break, which are parsed by
+        a pool of `workers` processes (by default, one per CPU). Neither
+        this process nor the workers copy more than a line or a chunk of
+        the file at a time, and they hand the pages they've read back to
+        the OS, so even multi-gigabyte files don't grow their memory. The
+        parsed entries are all written by this process, a chunk per
+        transaction, while the workers carry on with the next chunks. Only
+        a few chunks are ever waiting to be written, so memory use stays
+        bounded.
+
+        Raises ValueError in the same cases as import_file.
+
+        Returns the same OrderedDict as import_file.
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        rows_read = 0
+        written = 0
+        errors = []
+        mapped_file = open_mapped(file_path)
+        if mapped_file is None:
+            return OrderedDict([('rows', 0), ('written', 0), ('errors', [])])
+        dbm = DBManager()
+        with mapped_file:
+            header_end = mapped_file.find(b'\n') + 1 or len(mapped_file)
+            header = next(
+                csv.reader([mapped_file[:header_end].decode('utf-8-sig')]),
+                None
+            )
+            if not header:
+                return OrderedDict([('rows', 0), ('written', 0),
+                                    ('errors', [])])
+            columns = self.header_columns(header)
+            # lines before the current chunk (starting with the header)
+            line_offset = 1
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                pending = deque()
+                chunks = chunk_boundaries(mapped_file, header_end,
+                                          chunk_size)
+                while True:
+                    for start, end in itertools.islice(
+                            chunks, 2 * workers - len(pending)):
+                        pending.append(executor.submit(
+                            parse_chunk, file_path, start, end, columns, self
+                        ))
+                    if not pending:
+                        break
+                    try:
+                        entries, chunk_errors, chunk_rows, chunk_lines = (
+                            pending.popleft().result()
+                        )
+                    except csv.Error as err:
+                        line_number = line_offset + err.line_number
+                        print("CSV format error!")
+                        print("detailed error information:")
+                        print("line {}: {}".format(line_number, err))
+                        raise ValueError("line {}: {}".format(line_number,
+                                                              err))
+                    rows_read += chunk_rows
+                    for line_number, error in chunk_errors:
+                        errors.append((line_offset + line_number, error))
+                    line_offset += chunk_lines
+                    written += dbm.upsert_entries(entries)
+        return OrderedDict([
+            ('rows', rows_read),
+            ('written', written),
+            ('errors', errors),
+        ])
+
+    def read_batches(self, reader):
+        """Reads the rows from the csv.reader `reader`, skipping blank ones.
+
+        Yields a (line numbers, rows) tuple for each batch of up to
+        `batch_size` rows.
+        """
+        line_numbers = []
+        rows = []
+        for row in reader:
+            if not row:
+                continue
+            line_numbers.append(reader.line_num)
+            rows.append(row)
+            if len(rows) == self.batch_size:
+                yield (line_numbers, rows)
+                line_numbers = []
+                rows = []
+        if rows:
+            yield (line_numbers, rows)
+
+    def header_columns(self, header):
+        """Takes the header row of a CSV file and finds the settings.HEADERS
+        columns in it.
+
+        Returns a list of the columns' positions, in settings.HEADERS order.
+        """
+        columns = []
+        for column_name in settings.HEADERS.values():
+            if column_name not in header:
+                print("Missing column error!")
+                print("detailed error information:")
+                print("no '{}' column in the header row".format(column_name))
+                raise ValueError(
+                    "no '{}' column in the header row".format(column_name)
+                )
+            columns.append(header.index(column_name))
+        return columns
+
+    def validate_rows(self, rows, columns):
+        """Validates a batch of CSV rows (lists of strings), given the
+        positions of the settings.HEADERS columns in them.
+
+        Rather than checking a row at a time, each check runs down a whole
+        column, and the dates and durations are only parsed and checked
+        once for each distinct value (timesheets repeat the same few over
+        and over).
+
+        Returns a tuple in the form (codes, entries) where:
+        - `codes` has an error code for each row: 0 if the row is valid,
+          otherwise the error flags (INVALID_DATE, etc.) OR-ed together;
+        - `entries` has an OrderedDict for each valid row and None for
+          each invalid one
+        """
+        width = max(columns) + 1
+        complete = [len(row) >= width for row in rows]
+        names, date_strings, task_names, duration_strings, notes = (
+            [row[column] if is_complete else ''
+             for row, is_complete in zip(rows, complete)]
+            for column in columns
+        )
+        dates, date_codes = self.validate_dates(date_strings)
+        durations, duration_codes = validate_durations(duration_strings)
+        too_long = [
+            longer_than(names, Employee.name.max_length),
+            longer_than(task_names, Task.name.max_length),
+        ]
+        length_codes = [FIELD_TOO_LONG if any(fields) else 0
+                        for fields in zip(*too_long)]
+        codes = [
+            (date_code | duration_code | length_code) if is_complete
+            else MISSING_VALUES
+            for is_complete, date_code, duration_code, length_code
+            in zip(complete, date_codes, duration_codes, length_codes)
+        ]
+        entries = [
+            None if code else OrderedDict([
+                (settings.HEADERS['user'], name),
+                (settings.HEADERS['date'], date),
+                (settings.HEADERS['task_name'], task_name),
+                (settings.HEADERS['duration'], duration),
+                (settings.HEADERS['notes'], note),
+            ])
+            for code, name, date, task_name, duration, note
+            in zip(codes, names, dates, task_names, durations, notes)
+        ]
+        return (codes, entries)
+
+    def validate_dates(self, date_strings):
+        """Parses and range checks a column of date strings.
+
+        Returns a tuple of the list of dates (None where invalid) and the
+        list of their error codes.
+        """
+        today = datetime.date.today()
+        checked = {}
+        for date_string in set(date_strings):
+            error, date = self.parse_date(date_string)
+            if date is None:
+                code = INVALID_DATE
+            elif not self.allow_future_dates and date > today:
+                code = FUTURE_DATE
+            elif self.earliest_date is not None and date < self.earliest_date:
+                code = EARLY_DATE
+            else:
+                code = 0
+            checked[date_string] = (date, code)
+        dates = [checked[value][0] for value in date_strings]
+        codes = [checked[value][1] for value in date_strings]
+        return (dates, codes)
+
+    def describe_errors(self, line_numbers, rows, columns, codes):
+        """Describes the problems with the invalid rows in a batch, given
+        their line numbers and error codes (see validate_rows).
+
+        Returns a list of (line number, error) tuples.
+        """
+        errors = []
+        for line_number, row, code in zip(line_numbers, rows, codes):
+            if not code:
+                continue
+            values = {
+                'date': row[columns[1]] if len(row) > columns[1] else '',
+                'duration': row[columns[3]] if len(row) > columns[3] else '',
+                'earliest_date': self.earliest_date,
+                'max_length': Task.name.max_length,
+            }
+            errors.append((line_number, "; ".join(
+                message.format(**values)
+                for flag, message in ERROR_MESSAGES.items() if code & flag
+            )))
+        return errors
+
+    def parse_date(self, date_string):
+        """Parses `date_string` using the first of `date_formats` it's valid
+        in.
+
+        Returns a tuple in the form (error, date) where:
+        - `error` is None if valid and a description of the error text if
+          invalid;
+        - `date` is a date object if valid and None if invalid
+        """
+        if date_string not in self.parsed_dates:
+            result = ("{} is not a valid date".format(date_string), None)
+            for date_format in self.date_formats:
+                try:
+                    date = datetime.datetime.strptime(
+                        date_string,
+                        date_format['datetime format']
+                    ).date()
+                except ValueError:
+                    continue
+                result = (None, date)
+                break
+            self.parsed_dates[date_string] = result
+        return self.parsed_dates[date_string]
+
+
+# -- Helper Functions --
+
+
+def validate_durations(duration_strings):
+    """Parses and checks a column of durations (whole numbers of minutes).
+
+    Returns a tuple of the list of durations (None where invalid) and the
+    list of their error codes.
+    """
+    checked = {}
+    for duration_string in set(duration_strings):
+        try:
+            duration = int(duration_string)
+        except ValueError:
+            checked[duration_string] = (None, INVALID_DURATION)
+            continue
+        checked[duration_string] = (
+            duration, NEGATIVE_DURATION if duration < 0 else 0
+        )
+    durations = [checked[value][0] for value in duration_strings]
+    codes = [checked[value][1] for value in duration_strings]
+    return (durations, codes)
+
+
+def longer_than(values, max_length):
+    """Returns a list of whether each of `values` is longer than
+    `max_length`.
+    """
+    return [len(value) > max_length for value in values]
+
+
+def open_mapped(file_path):
+    """Memory-maps the file at `file_path` for reading.
+
+    Returns the mmap, or None if the file is empty (an empty file can't be
+    mapped).
+    """
+    with open(file_path, 'rb') as mapped_source:
+        if os.fstat(mapped_source.fileno()).st_size == 0:
+            return None
+        # the map stays valid after the file is closed
+        return mmap.mmap(mapped_source.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def mapped_lines(mapped_file, start, end):
+    """Yields the lines between byte offsets `start` and `end` of the
+    memory-mapped file `mapped_file`, as strings.
+
+    Only the current line is copied out of the map, and pages that have
+    been read are handed back to the OS as it goes (see release_pages), so
+    reading even a huge file adds little to the process's memory.
+    """
+    released = start
+    position = start
+    while position < end:
+        line_end = mapped_file.find(b'\n', position, end) + 1 or end
+        yield mapped_file[position:line_end].decode('utf-8')
+        position = line_end
+        if position - released >= RELEASE_SIZE:
+            released = release_pages(mapped_file, released, position)
+
+
+def release_pages(mapped_file, start, end):
+    """Tells the OS that the pages of `mapped_file` between byte offsets
+    `start` and `end` won't be needed again, so they stop counting towards
+    the process's memory (they're read back in from the file if they are
+    used after all). Does nothing where madvise isn't available.
+
+    Returns the offset up to which pages were released (`end` rounded down
+    to a page boundary), to pass as `start` next time.
+    """
+    start -= start % mmap.PAGESIZE
+    end -= end % mmap.PAGESIZE
+    if end > start and hasattr(mmap, 'MADV_DONTNEED'):
+        mapped_file.madvise(mmap.MADV_DONTNEED, start, end - start)
+    return end
+
+
+def chunk_boundaries(mapped_file, start, chunk_size):
+    """Splits the memory-mapped file `mapped_file`, from byte offset
+    `start` to the end, into chunks of about `chunk_size` bytes.
+
+    Each chunk ends at a line break that isn't inside a quoted field (a
+    quoted field can itself contain line breaks), so every chunk holds
+    whole rows.
+
+    Yields a (start, end) tuple of byte offsets for each chunk.
+    """
+    size = len(mapped_file)
+    released = start
+    in_quotes = False
+    while start < size:
+        end = min(start + chunk_size, size)
+        # every quote character opens or closes a quoted field ("" inside
+        # a field is two of them, so doesn't change anything)
+        in_quotes ^= mapped_file[start:end].count(b'"') % 2 == 1
+        # carry on to the end of the line, and of the row if it's in the
+        # middle of a quoted field
+        while end < size and (in_quotes or mapped_file[end - 1] != ord('\n')):
+            line_end = mapped_file.find(b'\n', end) + 1 or size
+            in_quotes ^= mapped_file[end:line_end].count(b'"') % 2 == 1
+            end = line_end
+        yield (start, end)
+        start = end
+        if start - released >= RELEASE_SIZE:
+            released = release_pages(mapped_file, released, start)
+
+
+def parse_chunk(file_path, start, end, columns, csv_manager):
+    """Parses and validates (see CsvManager.validate_rows) the rows between
+    byte offsets `start` and `end` of the CSV file at `file_path`. Runs in
+    the import's worker processes.
+
+    Returns a tuple of:
+    - the list of valid entries;
+    - a list of (line number, error) tuples for the invalid rows, numbered
+      from the start of the chunk;
+    - the number of rows read;
+    - the number of lines in the chunk.
+
+    A csv.Error raised by a row that isn't valid CSV is given the row's
+    line number, from the start of the chunk, as its `line_number`.
+    """
+    entries = []
+    errors = []
+    rows_read = 0
+    with open_mapped(file_path) as mapped_file:
+        reader = csv.reader(mapped_lines(mapped_file, start, end))
+        try:
+            for line_numbers, rows in csv_manager.read_batches(reader):
+                rows_read += len(rows)
+                codes, batch_entries = csv_manager.validate_rows(rows,
+                                                                 columns)
+                errors.extend(csv_manager.describe_errors(line_numbers, rows,
+                                                          columns, codes))
+                entries.extend(entry for entry in batch_entries
+                               if entry is not None)
+        except csv.Error as err:
+            # the exception's attributes go back to the importing process
+            # with it
+            err.line_number = reader.line_num
+            raise
+    return (entries, errors, rows_read, reader.line_num)
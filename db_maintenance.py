@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+"""DB Maintenance
+Keeps the database in good shape after heavy use: refreshes the query
+planner's statistics, returns free pages to the file system and
+checkpoints the write-ahead log, each only when it's due according to the
+thresholds in wl_settings.
+
+Can be run from the Options menu or as a script:
+    python3 db_maintenance.py [--force]
+
+Created: 2026
+Last Update: 2026-10-19
+Author: Alex Koumparos
+"""
+from collections import OrderedDict
+import os
+import sys
+import time
+
+import db_manager
+import wl_settings as settings
+
+
+class DBMaintenance:
+    """Runs the database maintenance steps and reports on them."""
+    def __init__(self):
+        # connects to the database and creates the tables if need be
+        db_manager.DBManager()
+        self.db = db_manager.db
+
+    def run(self, force=False):
+        """Runs every maintenance step, each of which does nothing unless
+        it's due (or `force` is True).
+
+        Returns an OrderedDict report with the database size (in bytes)
+        before and after, and the name, outcome and time taken (in seconds)
+        of each step.
+        """
+        report = OrderedDict([
+            ('size before', self.database_size()),
+            ('steps', []),
+            ('size after', None),
+        ])
+        for step in [self.analyze, self.vacuum, self.optimize,
+                     self.checkpoint]:
+            start = time.perf_counter()
+            outcome = step(force)
+            report['steps'].append(OrderedDict([
+                ('step', step.__name__),
+                ('outcome', outcome),
+                ('seconds', time.perf_counter() - start),
+            ]))
+        report['size after'] = self.database_size()
+        return report
+
+    # Maintenance Steps
+    # -----------------
+    # each returns a description of what it did
+    def analyze(self, force=False):
+        """Rebuilds the query planner's statistics with ANALYZE if there
+        aren't any yet, or the number of log entries has changed by more
+        than ANALYZE_CHANGE_RATIO since they were gathered.
+        """
+        entries = db_manager.LogEntry.select().count()
+        analyzed = self.analyzed_entries()
+        if analyzed is None:
+            reason = "no statistics yet"
+        else:
+            change = abs(entries - analyzed) / max(analyzed, 1)
+            reason = "entries changed by {:.0%}".format(change)
+            if not force and change <= settings.ANALYZE_CHANGE_RATIO:
+                return "skipped, {} (threshold {:.0%})".format(
+                    reason, settings.ANALYZE_CHANGE_RATIO
+                )
+        self.db.execute_sql('ANALYZE')
+        return "analyzed, {}".format(reason)
+
+    def vacuum(self, force=False):
+        """Returns up to VACUUM_MAX_PAGES free pages to the file system with
+        an incremental vacuum, once more than VACUUM_FREE_RATIO of the
+        database's pages are free.
+
+        Incremental vacuums need the database to be in incremental
+        auto-vacuum mode. The first time, the database is switched over,
+        which takes one full VACUUM (rewriting the whole file).
+        """
+        free_pages = self.pragma('freelist_count')
+        free_ratio = free_pages / max(self.pragma('page_count'), 1)
+        if not force and free_ratio <= settings.VACUUM_FREE_RATIO:
+            return "skipped, {:.0%} of pages free (threshold {:.0%})".format(
+                free_ratio, settings.VACUUM_FREE_RATIO
+            )
+        # 2 = INCREMENTAL
+        if self.pragma('auto_vacuum') != 2:
+            self.db.execute_sql('PRAGMA auto_vacuum = INCREMENTAL')
+            self.db.execute_sql('VACUUM')
+            return ("full vacuum (switched to incremental auto-vacuum), "
+                    "freed {} pages".format(free_pages))
+        # the pragma frees one page per step, but python's sqlite3 only
+        # steps statements that don't return anything once, so it's run
+        # once per page (in one transaction, so the file is written once)
+        with self.db.atomic():
+            for _ in range(min(free_pages, settings.VACUUM_MAX_PAGES)):
+                self.db.execute_sql('PRAGMA incremental_vacuum(1)')
+        return "freed {} pages".format(
+            free_pages - self.pragma('freelist_count')
+        )
+
+    def optimize(self, force=False):
+        """Runs PRAGMA optimize, which lets sqlite refresh any statistics it
+        thinks are out of date. This is cheap so it's always run.
+        """
+        self.db.execute_sql('PRAGMA optimize')
+        return "optimized"
+
+    def checkpoint(self, force=False):
+        """Copies the write-ahead log back into the database and truncates
+        it, once it's bigger than WAL_CHECKPOINT_SIZE bytes. Does nothing
+        unless the database is in WAL mode.
+        """
+        if self.db.execute_sql('PRAGMA journal_mode').fetchone()[0] != 'wal':
+            return "skipped, not in WAL mode"
+        wal_size = self.wal_size()
+        if not force and wal_size <= settings.WAL_CHECKPOINT_SIZE:
+            return "skipped, log is {} bytes (threshold {})".format(
+                wal_size, settings.WAL_CHECKPOINT_SIZE
+            )
+        busy, log_pages, copied_pages = self.db.execute_sql(
+            'PRAGMA wal_checkpoint(TRUNCATE)'
+        ).fetchone()
+        if busy:
+            return "incomplete, the database is busy"
+        return "checkpointed {} pages".format(copied_pages)
+
+    # Helper Methods
+    # --------------
+    def pragma(self, name):
+        """Returns the (single) value of the pragma `name`."""
+        return self.db.execute_sql('PRAGMA {}'.format(name)).fetchone()[0]
+
+    def database_size(self):
+        """Returns the size of the database in bytes (including any
+        write-ahead log).
+        """
+        return (self.pragma('page_count') * self.pragma('page_size') +
+                self.wal_size())
+
+    def wal_size(self):
+        """Returns the size of the database's write-ahead log in bytes (0 if
+        there isn't one).
+        """
+        wal_path = self.db.database + '-wal'
+        if not os.path.exists(wal_path):
+            return 0
+        return os.path.getsize(wal_path)
+
+    def analyzed_entries(self):
+        """Returns the number of log entries there were when ANALYZE last
+        ran, or None if it hasn't been run (since there were any entries).
+        """
+        has_statistics = self.db.execute_sql(
+            "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+        ).fetchone()
+        if not has_statistics:
+            return None
+        # the first number of each index's statistics is the table's size
+        row = self.db.execute_sql(
+            "SELECT stat FROM sqlite_stat1 WHERE tbl = 'logentry' LIMIT 1"
+        ).fetchone()
+        if row is None:
+            return None
+        return int(row[0].split()[0])
+
+
+# -- Helper Functions --
+
+
+def report_lines(report):
+    """Formats a maintenance report (see DBMaintenance.run) for display.
+
+    Returns a list of lines.
+    """
+    lines = [
+        "Database size before: {:,} bytes".format(report['size before'])
+    ]
+    for step in report['steps']:
+        lines.append("{:<10} {:>8.3f}s  {}".format(
+            step['step'], step['seconds'], step['outcome']
+        ))
+    lines.append(
+        "Database size after: {:,} bytes".format(report['size after'])
+    )
+    return lines
+
+# ---------------------------
+
+if __name__ == "__main__":
+
+    maintenance = DBMaintenance()
+    for line in report_lines(maintenance.run(force='--force' in sys.argv)):
+        print(line)
@@ -5,17 +5,85 @@ All the database-related functionality.
 Communicates with the rest of the application using OrderDicts
 
 Created: 2018
-Last Update: 2018-06-05
+Last Update: 2026-10-19
 Author: Alex Koumparos
 """
 from collections import OrderedDict
+import atexit
+import csv
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import zlib
 
 from peewee import *
+from playhouse.hybrid import hybrid_property
+from playhouse.migrate import SqliteMigrator, migrate
+from playhouse.sqlite_ext import AutoIncrementField
 
+from migrations import (Migration, MigrationRunner, backfill_step, chunked,
+                        id_ranges, sql_step)
+from name_index import NameBKTree, NameTrie
 import wl_settings as settings
 
 
-db = SqliteDatabase(settings.DATABASE_NAME)
+class MemoryDatabase(SqliteDatabase):
+    """An in-memory SQLite database backed by a database file at `path`.
+
+    The file is loaded into memory when the database connects and written
+    back by flush(), which DBManager calls every FLUSH_INTERVAL seconds as
+    entries are written. The database is also flushed when it's closed and
+    when the program exits.
+
+    Crash safety: the file is only ever changed by a flush, which copies the
+    whole database with sqlite's backup API inside a single transaction on
+    the file. So after a crash (even one part way through a flush) the file
+    holds the database exactly as it was at the last completed flush, and
+    everything written since then is lost.
+    """
+    def __init__(self, path, *args, **kwargs):
+        self.path = path
+        self.last_flush = None
+        super().__init__(':memory:', *args, **kwargs)
+        atexit.register(self.flush)
+
+    def _connect(self):
+        connection = super()._connect()
+        if os.path.exists(self.path):
+            source = sqlite3.connect(self.path)
+            try:
+                source.backup(connection)
+            finally:
+                source.close()
+        self.last_flush = time.monotonic()
+        return connection
+
+    def _close(self, connection):
+        self.write_back(connection)
+        super()._close(connection)
+
+    def flush(self):
+        """Writes the in-memory database back to its file (if connected)."""
+        if not self.is_closed():
+            self.write_back(self.connection())
+
+    def write_back(self, connection):
+        """Copies the database on `connection` over the file."""
+        target = sqlite3.connect(self.path)
+        try:
+            connection.backup(target)
+        finally:
+            target.close()
+        self.last_flush = time.monotonic()
+
+
+if settings.DATABASE_MODE == 'memory':
+    db = MemoryDatabase(settings.DATABASE_NAME)
+else:
+    db = SqliteDatabase(settings.DATABASE_NAME)
 
 
 class DBManager:
@@ -24,6 +92,21 @@ class DBManager:
     application in the form of OrderDicts so the nature and implementation of
     the database itself is abstracted away.
     """
+    # CACHES
+    # ------
+    # in-process structures derived from the database, shared by every
+    # DBManager, and the database each one was built from (switching to a
+    # different database invalidates them)
+    name_trie = None
+    name_trie_database = None
+    name_tree = None
+    name_tree_database = None
+    # name -> id of the employees and tasks written by upsert_entries (see
+    # name_ids)
+    employee_ids = None
+    task_ids = None
+    name_ids_database = None
+
     def __init__(self):
         """Create the database and the table if they don't already exist.
 
@@ -38,74 +121,271 @@ class DBManager:
             print("operational error!")
             print("detailed error information:")
             print(err)
+        # for searching the compressed notes (see entry_text_match)
+        db.register_function(decompress_notes, 'decompress_notes', 1,
+                             deterministic=True)
+        self.upgrade_schema()
         db.create_tables(tables, safe=True)
+        self.create_trigram_indexes()
+        for statement in (CHANGE_LOG_SQL + DURATION_HISTOGRAM_SQL +
+                          NOTE_TEXT_SQL):
+            db.execute_sql(statement)
+
+    def upgrade_schema(self):
+        """Bring a database created by an earlier version of the application
+        up to date with the current models by running the MIGRATIONS it
+        hasn't had yet (see migrations.py).
+
+        `create_tables(safe=True)` only creates missing tables, it never adds
+        columns to tables that already exist, so each change to an existing
+        table needs a migration. The upgrade runs before `create_tables` so
+        that the new columns exist by the time their indexes are created. A
+        new database is created by `create_tables` with the current schema,
+        so it's just marked as up to date.
+
+        Returns the report of the migration steps run (see
+        MigrationRunner.run).
+        """
+        runner = MigrationRunner(db, MIGRATIONS)
+        if not db.table_exists('logentry'):
+            runner.set_version(runner.latest_version())
+            return []
+        if not runner.pending():
+            return []
+        print("upgrading the database to version {}".format(
+            runner.latest_version()
+        ))
+        return runner.run(progress=print_migration_step)
+
+    def create_trigram_indexes(self):
+        """Create any missing trigram indexes (see TRIGRAM_INDEXES) along
+        with the triggers that keep them up to date, and fill them from the
+        rows already in the database.
+        """
+        for table, column in TRIGRAM_INDEXES:
+            if db.table_exists(trigram_index_name(table, column)):
+                continue
+            with db.atomic():
+                for statement in trigram_index_sql(table, column):
+                    db.execute_sql(statement)
+                self.rebuild_trigram_index(table, column)
+
+    def rebuild_trigram_index(self, table, column):
+        """Regenerate the trigram index on `table`.`column` from scratch."""
+        index_name = trigram_index_name(table, column)
+        if USE_FTS5_TRIGRAMS:
+            statements = [FTS5_TRIGRAM_REBUILD_SQL]
+        else:
+            statements = TABLE_TRIGRAM_REBUILD_SQL
+        for statement in statements:
+            db.execute_sql(statement.format(table=table,
+                                            column=column,
+                                            index=index_name))
 
     def add_entry(self, entry):
         """Add an entry. Writes the specified entry to the database.
 
         The entry should be in the form of a dict or OrderedDict.
+
+        Adding an entry that is already in the database does nothing.
+        Returns True if the entry was written, False if it already existed.
         """
-        try:
-            employee_record = Employee.get(Employee.name == entry["name"])
-        except DoesNotExist:
-            # right now we can handle DoesNotExist cleanly because the only
-            # value we need to know to create a new Employee instance is
-            # provided as part of the entry.
-            # If ever Employee ever becomes a more sophisticated model, we'll
-            # need to go back to the user to get them to provide more info
-            employee_record = Employee.create(name=entry["name"])
-        LogEntry.create(
-            employee=employee_record,
-            date=entry["date"],
-            task_name=entry["task_name"],
-            duration=entry["duration"],
-            notes=entry["notes"],
-        )
+        return self.upsert_entry(entry)
+
+    def upsert_entry(self, entry):
+        """Writes the specified entry to the database unless an identical
+        entry already exists.
+
+        Returns True if the entry was written, False if it already existed.
+        """
+        return self.upsert_entries([entry]) == 1
+
+    def upsert_entries(self, entries, batch_size=100):
+        """Writes every entry in `entries` (an iterable of dicts or
+        OrderedDicts) that isn't already in the database.
+
+        Entries are identified by their content hash so importing the same
+        data twice leaves the database unchanged. They're all written in
+        one transaction, one row per run of the same prepared
+        `INSERT ... ON CONFLICT DO NOTHING` statement (see
+        UPSERT_ENTRY_SQL), so there's no limit on query parameters to stay
+        under. `batch_size` is only the number of rows passed to each
+        executemany call, which is as closely as the entries written can be
+        told apart from those skipped when updating the name indexes. The
+        employees and tasks named are looked up (and any new ones added) a
+        set of names at a time in the same transaction (see name_ids).
+
+        Returns the number of entries actually written.
+        """
+        # the notes of listed entries may be LongNotes (see load_notes)
+        entries = [dict(entry, notes=self.load_notes(entry["notes"]))
+                   for entry in entries]
+        names = [entry["name"] for entry in entries]
+        written = 0
+        added_names = []
+        partly_written = False
+        with db.atomic():
+            # right now we can create a missing Employee cleanly because
+            # the only value we need to know to create a new Employee
+            # instance is provided as part of the entry.
+            # If ever Employee ever becomes a more sophisticated model,
+            # we'll need to go back to the user to get them to provide
+            # more info
+            employee_ids = self.name_ids(Employee, names)
+            task_ids = self.name_ids(
+                Task, [entry["task_name"] for entry in entries]
+            )
+            rows = []
+            # content hash -> compressed notes, for the entries with long
+            # notes
+            long_notes = OrderedDict()
+            for entry in entries:
+                content_hash = entry_hash(entry)
+                notes, compressed = split_notes(entry["notes"])
+                if compressed is not None:
+                    long_notes[content_hash] = compressed
+                rows.append((
+                    employee_ids[entry["name"]],
+                    to_date(entry["date"]).isoformat(),
+                    day_number(entry["date"]),
+                    task_ids[entry["task_name"]],
+                    entry["duration"],
+                    notes,
+                    compressed is not None,
+                    content_hash,
+                ))
+            cursor = db.cursor()
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                # building the insert with peewee costs more than running
+                # it, so the same prepared statement is run for every row.
+                # The cursor's rowcount is the number of rows actually
+                # inserted (skipped rows and trigger writes aren't counted)
+                cursor.executemany(UPSERT_ENTRY_SQL, batch)
+                batch_written = cursor.rowcount
+                written += batch_written
+                if batch_written == len(batch):
+                    added_names.extend(names[start:start + batch_size])
+                elif batch_written > 0:
+                    # can't tell which of the batch's rows were written
+                    partly_written = True
+            # entries that were already in the log have their notes already
+            candidates = list(long_notes)
+            for start in range(0, len(candidates), 500):
+                query = (LogEntry
+                         .select(LogEntry.id, LogEntry.content_hash)
+                         .where(LogEntry.content_hash.in_(
+                             candidates[start:start + 500]
+                         ))
+                         .tuples())
+                cursor.executemany(
+                    'INSERT OR IGNORE INTO "notetext" ("entry_id", "text") '
+                    'VALUES (?, ?)',
+                    [(entry_id, long_notes[content_hash])
+                     for entry_id, content_hash in query]
+                )
+        if not db.in_transaction():
+            # only once the new names are committed (an enclosing
+            # transaction could still roll them back)
+            DBManager.employee_ids.update(employee_ids)
+            DBManager.task_ids.update(task_ids)
+        if partly_written:
+            DBManager.name_trie_database = None
+            DBManager.name_tree_database = None
+        else:
+            self.update_name_indexes(added=added_names)
+        self.flush()
+        return written
 
     def edit_entry(self, entry, new_value):
         """Edits an existing entry.
 
         `entry` and `new_value` should be key-value pairs (e.g., dict or
-        OrderedDict).
+        OrderedDict), such as the entries listed by this class, whose notes
+        may be LongNotes (see load_notes).
+
+        Raises IntegrityError if the edited entry would be identical to
+        another entry. The edit is then rolled back whole, so any employee
+        or task it created is removed again.
 
         Returns the new record as an OrderedDict.
         """
-        # first make sure that the Employee exists and can be retrieved
+        # first make sure that the LogEntry record exists and can be retrieved
+        log_entry_record = self.view_entry(entry, return_model=True)
+        old_name = log_entry_record.employee.name
         try:
-            employee_record = Employee.get(Employee.name == entry["name"])
-        except DoesNotExist as err:
-            print("Employee Does not exist error!")
+            with db.atomic():
+                # try to set the employee record to the new employee
+                employee_record = Employee.get_or_create(
+                    name=new_value["name"]
+                )[0]
+                # try to set the log entry record to the new record
+                log_entry_record.employee = employee_record
+                log_entry_record.date = new_value["date"]
+                log_entry_record.task_name = new_value["task_name"]
+                log_entry_record.duration = new_value["duration"]
+                log_entry_record.notes = self.load_notes(new_value["notes"])
+                log_entry_record.save()
+        except IntegrityError as err:
+            print("Duplicate entry error!")
             print("detailed error information:")
             print(err)
             raise
-        # next, make sure that the LogEntry record exists and can be retrieved
-        try:
-            log_entry_record = LogEntry.get(
-                LogEntry.employee == employee_record,
-                LogEntry.date == entry["date"],
-                LogEntry.task_name == entry["task_name"],
-                LogEntry.duration == entry["duration"],
-                LogEntry.notes == entry["notes"]
-            )
-        except DoesNotExist as err:
-            print("Log Entry Does not exist error!")
-            print("detailed error information:")
-            print(err)
-            raise
-        # try to set the employee record to the new employee
-        employee_record = Employee.get_or_create(
-            name=new_value["name"]
-        )[0]
-        employee_record.save()
-        # try to set the log entry record to the new record
-        log_entry_record.employee = employee_record
-        log_entry_record.date = new_value["date"]
-        log_entry_record.task_name = new_value["task_name"]
-        log_entry_record.duration = new_value["duration"]
-        log_entry_record.notes = new_value["notes"]
-        log_entry_record.save()
+        self.update_name_indexes(added=[employee_record.name],
+                                 removed=[old_name])
+        self.flush()
         return self.record_to_dict(log_entry_record)
 
+    def merge_employees(self, src_names, target_name):
+        """Merges the employees named in `src_names` into the employee named
+        `target_name` (who is created if need be), e.g., to combine the
+        different spellings of one person's name.
+
+        All of their entries are moved to the target employee with a single
+        UPDATE, then rehashed (the content hash includes the name) with any
+        entries that become duplicates of another removed, and finally the
+        source employees are deleted. The whole merge is one transaction.
+        The change log and duration histograms follow the moved entries
+        through their triggers.
+
+        Returns an OrderedDict with the number of entries moved, duplicate
+        entries removed and employees removed.
+        """
+        with db.atomic():
+            target = Employee.get_or_create(name=target_name)[0]
+            source_ids = [employee.id for employee in (
+                Employee
+                .select(Employee.id)
+                .where(Employee.name.in_(list(src_names)) &
+                       (Employee.id != target.id))
+            )]
+            moved = (LogEntry
+                     .update(employee=target.id, content_hash=None)
+                     .where(LogEntry.employee.in_(source_ids))
+                     .execute())
+            duplicates = hash_entries(db, '"logentry"."employee_id" = ?',
+                                      (target.id,))
+            (DurationHistogram
+             .delete()
+             .where(DurationHistogram.employee_id.in_(source_ids))
+             .execute())
+            removed = (Employee
+                       .delete()
+                       .where(Employee.id.in_(source_ids))
+                       .execute())
+        # the source employees' ids are no longer valid
+        DBManager.name_ids_database = None
+        if moved:
+            # rebuilt from the database when next needed
+            DBManager.name_trie_database = None
+            DBManager.name_tree_database = None
+        self.flush()
+        return OrderedDict([
+            ('entries moved', moved),
+            ('duplicates removed', duplicates),
+            ('employees removed', removed),
+        ])
+
     def view_employees(self):
         """Get all employees who have made entries.
 
@@ -117,37 +397,75 @@ class DBManager:
         query = Employee.select(Employee.name).join(LogEntry).distinct()
         return [OrderedDict([('name', record.name)]) for record in query]
 
-    def view_dates(self, sorted=True):
-        """get all unique date records.
+    def view_dates(self, sorted=True, start_date=None, end_date=None):
+        """get all unique date records, optionally only those between
+        start_date and end_date (inclusive).
+
+        The dates are read from the day_number index (see DISTINCT_DAYS_SQL)
+        so they always come back sorted; `sorted` is only kept for existing
+        callers.
 
         Returns them as a list of OrderedDicts.
         """
-        query = LogEntry.select(LogEntry.date).distinct()
-        if sorted:
-            query = query.order_by(LogEntry.date)
-        return [OrderedDict([('date', record.date)]) for record in query]
+        first_day = 1 if start_date is None else day_number(start_date)
+        last_day = (datetime.date.max.toordinal() if end_date is None
+                    else day_number(end_date))
+        cursor = db.execute_sql(DISTINCT_DAYS_SQL, (first_day, last_day))
+        return [OrderedDict([('date', datetime.date.fromordinal(row[0]))])
+                for row in cursor]
+
+    def view_months(self):
+        """get every month that has at least one entry, oldest first.
+
+        Returns them as a list of OrderedDicts, where each month is the date
+        of its first day.
+        """
+        cursor = db.execute_sql(DISTINCT_MONTHS_SQL)
+        return [OrderedDict([
+            ('month', datetime.date.fromordinal(row[0]).replace(day=1))
+        ]) for row in cursor]
 
     def view_entries_for_date(self, date):
         """Get all the entries for the given date.
 
         Return the entries as a list of OrderedDicts.
         """
-        query = (LogEntry
-                 .select()
-                 .join(Employee)
-                 .where(LogEntry.date == date))
-        return self.records_to_list(query)
+        query = (self.entries_query()
+                 .where(LogEntry.day_number == day_number(date)))
+        return self.entries_to_list(query)
 
     def view_entries_for_duration(self, duration):
         """Get all the entries with the given duration.
 
         Returns them as a list of OrderedDicts.
         """
-        query = (LogEntry
-                 .select()
-                 .join(Employee)
+        query = (self.entries_query()
                  .where(LogEntry.duration == duration))
-        return self.records_to_list(query)
+        return self.entries_to_list(query)
+
+    def view_entries_for_duration_range(self, min_duration, max_duration,
+                                        buckets=10):
+        """Get all the entries with a duration between min_duration and
+        max_duration (inclusive), read in duration order from the duration
+        index.
+
+        The entries come with a histogram of their durations (see
+        duration_histogram) with up to `buckets` buckets, counted from the
+        entries already read, so showing the distribution doesn't need
+        another query.
+
+        Returns a tuple of the entries, shortest first, as a list of
+        OrderedDicts and the histogram.
+        """
+        query = (self.entries_query()
+                 .where(LogEntry.duration.between(min_duration, max_duration))
+                 .order_by(LogEntry.duration, LogEntry.id))
+        records = self.entries_to_list(query)
+        histogram = duration_histogram(
+            [record['duration'] for record in records],
+            min_duration, max_duration, buckets
+        )
+        return (records, histogram)
 
     def view_entries_for_date_range(self, start_date, end_date):
         """Get all entries with a date is between start_date and
@@ -155,48 +473,57 @@ class DBManager:
 
         Return them as a list of OrderedDicts.
         """
-        query = (LogEntry
-                 .select()
-                 .join(Employee)
+        query = (self.entries_query()
                  .where(
-                     (LogEntry.date >= start_date) &
-                     (LogEntry.date <= end_date)
+                     (LogEntry.day_number >= day_number(start_date)) &
+                     (LogEntry.day_number <= day_number(end_date))
                  )
-                 .order_by(LogEntry.date))
-        return self.records_to_list(query)
+                 .order_by(LogEntry.day_number))
+        return self.entries_to_list(query)
 
-    def view_entries_with_text(self, text_string):
+    def view_entries_with_text(self, text_string, case_sensitive=False):
         """Get all entries where any of the text fields contains the
         specified text string.
+        - Can optionally make the search case sensitive.
 
         Return them as a list of OrderedDicts.
         """
-        query = (LogEntry
-                 .select()
-                 .join(Employee)
-                 .where(
-                     (Employee.name.contains(text_string)) |
-                     (LogEntry.task_name.contains(text_string)) |
-                     (LogEntry.notes.contains(text_string))
-                 ))
-        return self.records_to_list(query)
+        query = (self.entries_query()
+                 .where(entry_text_match(text_string, case_sensitive)))
+        return self.entries_to_list(query)
 
-    def view_names_with_text(self, text_string):
+    def view_names_with_text(self, text_string, case_sensitive=False,
+                             match='contains'):
         """Get all employee names where any of the text in the name matches
         the specified text string.
+        - Can optionally make the search case sensitive;
+        - Can optionally match only names that start with (`match='prefix'`)
+        or are equal to (`match='exact'`) the text string.
 
         Returns them as a list of OrderedDicts.
         """
-        Employee.select(Employee.name).join(LogEntry).distinct()
         query = (Employee
                  .select(Employee.name)
                  .join(LogEntry)
                  .distinct()
                  .where(
-                     Employee.name.contains(text_string)
+                     text_match(Employee.name, text_string,
+                                case_sensitive, match)
                  ))
         return [OrderedDict([('name', record.name)]) for record in query]
 
+    def view_names_like(self, text_string, max_distance=2):
+        """Get the employee names that are within `max_distance` typos
+        (characters inserted, deleted or changed, ignoring case) of the
+        specified text string, from the employee name BK-tree.
+
+        Returns them, closest first, as a list of OrderedDicts with the name
+        and its distance from the text string.
+        """
+        tree = self.employee_name_tree()
+        return [OrderedDict([('name', name), ('distance', distance)])
+                for distance, name in tree.matches(text_string, max_distance)]
+
     def view_everything(self, employee=None, date_sorted=False):
         """Gets every field for every log entry.
         - Can optionally specify a particular employee name to filter by that
@@ -206,15 +533,282 @@ class DBManager:
         Returns a list of OrderedDicts.
         """
         if employee is not None:
-            query = (LogEntry
-                     .select()
-                     .join(Employee)
+            query = (self.entries_query()
                      .where(employee == Employee.name))
         else:
-            query = LogEntry.select().join(Employee)
+            query = self.entries_query()
         if date_sorted:
-            query = query.order_by(LogEntry.date)
-        return self.records_to_list(query)
+            query = query.order_by(LogEntry.day_number)
+        return self.entries_to_list(query)
+
+    def search(self, filters):
+        """Gets every entry matching all of the given filters, using a single
+        query.
+
+        `filters` is a dict (or OrderedDict) with any of the keys:
+        - 'employee': the employee's name;
+        - 'start_date' and/or 'end_date': the date range (inclusive);
+        - 'min_duration' and/or 'max_duration': the duration range in
+          minutes (inclusive);
+        - 'text': text that any of the text fields must contain;
+        - 'case_sensitive': whether matching the employee name and text is
+          case sensitive (defaults to False);
+        - 'top': only the `top` matching entries with the greatest
+          'top_by' (one of TOP_ENTRY_ORDERS, defaults to 'duration'), as
+          returned by top_entries.
+        Missing filters, and filters set to None, don't restrict the search.
+
+        Returns the entries, sorted by date (or greatest first, with 'top'),
+        as a list of OrderedDicts.
+        """
+        return self.entries_to_list(self.ordered_search_query(filters))
+
+    def ordered_search_query(self, filters):
+        """Builds the query for the entries matching `filters` (see search),
+        sorted by date or, with a 'top' filter, limited to the `top`
+        entries with the greatest 'top_by', greatest first.
+
+        Returns the query.
+        """
+        query = self.search_query(filters)
+        if filters.get('top') is None:
+            return query.order_by(LogEntry.day_number, LogEntry.id)
+        by = filters.get('top_by') or 'duration'
+        try:
+            field = TOP_ENTRY_ORDERS[by]
+        except KeyError as err:
+            print("top entries error!")
+            print("detailed error information:")
+            print("unknown order: {}".format(err))
+            raise ValueError("unknown order: {}".format(by))
+        return (query
+                .order_by(field.desc(), LogEntry.id.desc())
+                .limit(filters['top']))
+
+    def top_entries(self, n, by='duration', filters=None):
+        """Gets the `n` entries matching `filters` (see search) with the
+        greatest value of `by` (one of TOP_ENTRY_ORDERS): the longest, or
+        the most recent.
+
+        Unfiltered, or filtered by employee alone, the entries are read in
+        order from the index on `by` (or on the employee and `by`) and the
+        query stops after `n` of them, so it takes time in proportion to
+        `n` rather than to the number of entries. Other filters, such as a
+        date range with by='duration', read every matching entry from the
+        index on their own columns and sort them, taking time in proportion
+        to the number of matching entries.
+
+        Returns the entries, greatest first, as a list of OrderedDicts.
+        """
+        return self.search(dict(filters or {}, top=n, top_by=by))
+
+    def running_totals(self, filters=None):
+        """Gets each employee's minutes for every day they have entries,
+        with their cumulative minutes up to and including that day, for the
+        entries matching `filters` (see search).
+
+        Returns a list of OrderedDicts (name, date, minutes and running
+        total), sorted by employee name and date.
+        """
+        daily = self.daily_minutes_query(filters)
+        running_total = fn.SUM(daily.c.minutes).over(
+            partition_by=[daily.c.employee_id],
+            order_by=[daily.c.day_number]
+        )
+        query = (Select([daily], [daily.c.name, daily.c.day_number,
+                                  daily.c.minutes, running_total])
+                 .order_by(daily.c.name, daily.c.day_number)
+                 .bind(db))
+        return [OrderedDict([
+            ('name', name),
+            ('date', datetime.date.fromordinal(day)),
+            ('minutes', minutes),
+            ('running total', total),
+        ]) for name, day, minutes, total in query.tuples()]
+
+    def moving_averages(self, filters=None, days=7):
+        """Gets each employee's average minutes per day over the `days` days
+        up to and including each day they have entries, for the entries
+        matching `filters` (see search). Days without entries count as zero
+        minutes. With a start_date filter, the averages on its first days
+        still take in the entries from the `days` - 1 days before it, but
+        only the days from start_date on are returned.
+
+        Returns a list of OrderedDicts (name, date, minutes and moving
+        average), sorted by employee name and date.
+        """
+        filters = dict(filters or {})
+        first_day = None
+        if filters.get('start_date') is not None:
+            first_day = day_number(filters['start_date'])
+            filters['start_date'] = datetime.date.fromordinal(
+                max(first_day - (days - 1), 1))
+        daily = self.daily_minutes_query(filters)
+        # a RANGE frame covers the previous days by day number, whether or
+        # not they have entries
+        window_total = fn.SUM(daily.c.minutes).over(
+            partition_by=[daily.c.employee_id],
+            order_by=[daily.c.day_number],
+            start=Window.preceding(days - 1),
+            end=Window.CURRENT_ROW,
+            frame_type=Window.RANGE
+        )
+        averages = Select([daily], [daily.c.name, daily.c.day_number,
+                                    daily.c.minutes,
+                                    window_total.alias('total')])
+        if first_day is not None:
+            # the earlier days are dropped outside the window query, which
+            # would otherwise drop them before summing them
+            averages = averages.alias('averages')
+            query = (Select([averages], [averages.c.name,
+                                         averages.c.day_number,
+                                         averages.c.minutes,
+                                         averages.c.total])
+                     .where(averages.c.day_number >= first_day)
+                     .order_by(averages.c.name, averages.c.day_number))
+        else:
+            query = averages.order_by(daily.c.name, daily.c.day_number)
+        query = query.bind(db)
+        return [OrderedDict([
+            ('name', name),
+            ('date', datetime.date.fromordinal(day)),
+            ('minutes', minutes),
+            ('moving average', total / days),
+        ]) for name, day, minutes, total in query.tuples()]
+
+    def task_rankings(self, filters=None, per_employee=True):
+        """Ranks the tasks by the total minutes spent on them in the entries
+        matching `filters` (see search): each employee's tasks separately,
+        or every task together if `per_employee` is False. Tasks with the
+        same total share a rank.
+
+        Returns a list of OrderedDicts (name, unless ranking every task
+        together, task name, minutes and rank), sorted by employee name and
+        rank.
+        """
+        minutes = fn.SUM(LogEntry.duration)
+        if per_employee:
+            group = [LogEntry.employee, LogEntry.task]
+            columns = [Employee.name]
+            partition = [LogEntry.employee]
+        else:
+            group = [LogEntry.task]
+            columns = []
+            partition = None
+        rank = fn.RANK().over(partition_by=partition,
+                              order_by=[minutes.desc()])
+        query = (self.search_query(filters or {})
+                 .select(*(columns + [Task.name, minutes, rank]))
+                 .group_by(*group)
+                 .order_by(*(columns + [rank, Task.name])))
+        keys = ['task_name', 'minutes', 'rank']
+        if per_employee:
+            keys = ['name'] + keys
+        return [OrderedDict(zip(keys, row)) for row in query.tuples()]
+
+    def duration_quantiles(self, quantiles=(0.5, 0.9, 0.95), employee=None):
+        """Estimates the `quantiles` (fractions from 0 to 1) of the entries'
+        durations, from the duration histograms (see DurationHistogram)
+        rather than the entries themselves: every employee's merged, or just
+        those of the employee named `employee`.
+
+        Returns an OrderedDict of the estimated duration (in minutes) for
+        each quantile, or None for each if there are no entries.
+        """
+        query = (DurationHistogram
+                 .select(DurationHistogram.bucket,
+                         fn.SUM(DurationHistogram.count))
+                 .group_by(DurationHistogram.bucket)
+                 .order_by(DurationHistogram.bucket))
+        if employee is not None:
+            query = (query
+                     .join(Employee, on=(DurationHistogram.employee_id ==
+                                         Employee.id))
+                     .where(Employee.name == employee))
+        return histogram_quantiles(list(query.tuples()), quantiles)
+
+    def employee_duration_quantiles(self, quantiles=(0.5, 0.9, 0.95)):
+        """Estimates the `quantiles` of each employee's durations (see
+        duration_quantiles), in a single query.
+
+        Returns a list of OrderedDicts, sorted by name, with the employee's
+        name and an estimate for each quantile.
+        """
+        query = (DurationHistogram
+                 .select(Employee.name, DurationHistogram.bucket,
+                         DurationHistogram.count)
+                 .join(Employee, on=(DurationHistogram.employee_id ==
+                                     Employee.id))
+                 .where(DurationHistogram.count > 0)
+                 .order_by(Employee.name, Employee.id,
+                           DurationHistogram.bucket))
+        histograms = OrderedDict()
+        for name, bucket, count in query.tuples():
+            histograms.setdefault(name, []).append((bucket, count))
+        rows = []
+        for name, counts in histograms.items():
+            row = OrderedDict([('name', name)])
+            row.update(histogram_quantiles(counts, quantiles))
+            rows.append(row)
+        return rows
+
+    def rebuild_duration_histograms(self):
+        """Recounts the duration histograms from the log entries."""
+        with db.atomic():
+            for statement in DURATION_HISTOGRAM_REBUILD_SQL:
+                db.execute_sql(statement)
+
+    def export(self, filters, fmt, path):
+        """Writes every entry matching `filters` (see search), in the order
+        search returns them, to the file at `path`.
+
+        `fmt` is one of EXPORT_FORMATS:
+        - 'csv': a header row of the settings.HEADERS column names (so the
+          file can be imported again with csv_manager) then one row per
+          entry;
+        - 'jsonl': JSON Lines, one object per entry.
+
+        Rows are streamed from the database cursor straight into a buffered
+        file, so exporting the whole log takes the same memory as exporting
+        one entry.
+
+        Returns the number of entries written.
+        """
+        if fmt not in EXPORT_FORMATS:
+            print("Export format error!")
+            print("detailed error information:")
+            print("{} is not one of {}".format(fmt, EXPORT_FORMATS))
+            raise ValueError("{} is not one of {}".format(fmt,
+                                                          EXPORT_FORMATS))
+        query = (self.ordered_search_query(filters)
+                 .select(Employee.name,
+                         LogEntry.date,
+                         Task.name,
+                         LogEntry.duration,
+                         LogEntry.notes,
+                         NoteText.text)
+                 .switch(LogEntry)
+                 .join(NoteText, JOIN.LEFT_OUTER,
+                       on=(NoteText.entry == LogEntry.id))
+                 .tuples())
+        columns = list(settings.HEADERS.values())
+        written = 0
+        with open(path, 'w', newline='', encoding='utf-8',
+                  buffering=EXPORT_BUFFER_SIZE) as export_file:
+            if fmt == 'csv':
+                writer = csv.writer(export_file)
+                writer.writerow(columns)
+            # iterator() stops peewee keeping every row it has read
+            for row in query.iterator():
+                notes = row[4] if row[5] is None else decompress_notes(row[5])
+                row = (row[0], str(row[1]), row[2], row[3], notes)
+                if fmt == 'csv':
+                    writer.writerow(row)
+                else:
+                    export_file.write(json.dumps(dict(zip(columns, row))))
+                    export_file.write('\n')
+                written += 1
+        return written
 
     def view_entry(self, entry, return_model=False):
         """Gets a single entry from the database that matches the
@@ -223,24 +817,16 @@ class DBManager:
         Returns a single entry:
         - if return_model is set to True, returns a model instance,
         - otherwise returns OrderedDict
+
+        The entry is looked up by its content hash, so this is a single
+        unique-index lookup however many entries the database holds.
         """
-        # first make sure that the Employee exists and can be retrieved
+        entry = dict(entry, notes=self.load_notes(entry['notes']))
         try:
-            employee_record = Employee.get(Employee.name == entry["name"])
-        except DoesNotExist as err:
-            print("Employee Does not exist error!")
-            print("detailed error information:")
-            print(err)
-            raise err
-        # next, make sure that the LogEntry record exists and can be retrieved
-        try:
-            log_entry_record = LogEntry.get(
-                LogEntry.employee == employee_record,
-                LogEntry.date == entry["date"],
-                LogEntry.task_name == entry["task_name"],
-                LogEntry.duration == entry["duration"],
-                LogEntry.notes == entry["notes"]
-            )
+            log_entry_record = (self.entries_query()
+                                .where(LogEntry.content_hash ==
+                                       entry_hash(entry))
+                                .get())
         except DoesNotExist as err:
             print("Log Entry Does not exist error!")
             print("detailed error information:")
@@ -251,13 +837,334 @@ class DBManager:
         else:
             return self.record_to_dict(log_entry_record)
 
+    def load_notes(self, notes):
+        """Reads an entry's notes in full, given the notes from one of the
+        listed entries: long notes (see LongNotes) are read from the
+        notetext table and decompressed, others are already complete.
+
+        Returns the notes.
+        """
+        if isinstance(notes, LongNotes):
+            return decompress_notes(NoteText.get_by_id(notes.entry_id).text)
+        return notes
+
     def delete_entry(self, entry):
         """Delete the specified entry from the database."""
         log_entry = self.view_entry(entry, return_model=True)
         log_entry.delete_instance()
+        self.update_name_indexes(removed=[log_entry.employee.name])
+        self.flush()
         return True
 
+    def changes_since(self, seq=0, limit=100):
+        """Gets the changes (entries added, edited or deleted) made after
+        the change numbered `seq`, oldest first, up to `limit` of them.
+
+        A consumer keeping a copy of the work log in step passes the `seq`
+        of the last change it has seen (or 0 the first time) and repeats
+        until no changes are returned. Starting from 0 gets every entry in
+        the log: the entries written before the change log existed are
+        logged as added when the database is upgraded (see
+        log_existing_entries).
+
+        Returns the changes as a list of OrderedDicts with the keys:
+        - 'seq': the change's number (these only ever increase);
+        - 'action': 'add', 'edit' or 'delete';
+        - 'id': the id of the entry that changed;
+        - 'entry': the entry as it is now, as an OrderedDict (or None if it
+          has been deleted since).
+        """
+        query = (ChangeLog
+                 .select(ChangeLog.seq, ChangeLog.action, ChangeLog.entry_id,
+                         Employee.name, LogEntry.date, Task.name,
+                         LogEntry.duration, LogEntry.notes, NoteText.text)
+                 .join(LogEntry, JOIN.LEFT_OUTER,
+                       on=(ChangeLog.entry_id == LogEntry.id))
+                 .join(Employee, JOIN.LEFT_OUTER,
+                       on=(LogEntry.employee == Employee.id))
+                 .switch(LogEntry)
+                 .join(Task, JOIN.LEFT_OUTER,
+                       on=(LogEntry.task == Task.id))
+                 .switch(LogEntry)
+                 .join(NoteText, JOIN.LEFT_OUTER,
+                       on=(NoteText.entry == LogEntry.id))
+                 .where(ChangeLog.seq > seq)
+                 .order_by(ChangeLog.seq)
+                 .limit(limit)
+                 .tuples())
+        changes = []
+        for seq, action, entry_id, name, date, task_name, duration, notes, \
+                compressed in query:
+            if name is None:
+                entry = None
+            else:
+                if compressed is not None:
+                    notes = decompress_notes(compressed)
+                entry = OrderedDict([
+                    ('name', name),
+                    ('date', date),
+                    ('task_name', task_name),
+                    ('duration', duration),
+                    ('notes', notes)
+                ])
+            changes.append(OrderedDict([
+                ('seq', seq),
+                ('action', action),
+                ('id', entry_id),
+                ('entry', entry)
+            ]))
+        return changes
+
+    def backup(self, directory=None, count=None, pages=None, pause=None,
+               progress=None):
+        """Backs the database up while it stays in use, using sqlite's
+        online backup API.
+
+        The database is copied `pages` pages at a time, pausing for `pause`
+        seconds after each step so writers aren't locked out for the whole
+        backup. If the database is written to mid-backup sqlite restarts the
+        copy, so the backup is always a consistent snapshot.
+
+        Backups are kept in `directory`, numbered from 1 (the newest) to
+        `count` (the oldest); when there are already `count` backups the
+        oldest is deleted. The copy is made to a separate file that is only
+        moved into place once complete, so a failed backup never replaces a
+        good one. The defaults for the arguments come from wl_settings.
+
+        `progress`, if given, is called after every step with the number of
+        pages copied so far and the total number of pages.
+
+        Returns the path of the new backup.
+        """
+        if directory is None:
+            directory = settings.BACKUP_DIRECTORY
+        if count is None:
+            count = settings.BACKUP_COUNT
+        if pages is None:
+            pages = settings.BACKUP_PAGES_PER_STEP
+        if pause is None:
+            pause = settings.BACKUP_STEP_PAUSE
+        os.makedirs(directory, exist_ok=True)
+        if isinstance(db, MemoryDatabase):
+            name = os.path.splitext(os.path.basename(db.path))[0]
+        else:
+            name = os.path.splitext(os.path.basename(db.database))[0]
+
+        def backup_path(number):
+            return os.path.join(directory, "{}.{}.db".format(name, number))
+
+        def step(status, remaining, total):
+            if progress is not None:
+                progress(total - remaining, total)
+            time.sleep(pause)
+
+        partial_path = backup_path('partial')
+        target = sqlite3.connect(partial_path)
+        try:
+            db.connection().backup(target, pages=pages, progress=step)
+        finally:
+            target.close()
+        if os.path.exists(backup_path(count)):
+            os.remove(backup_path(count))
+        for number in range(count - 1, 0, -1):
+            if os.path.exists(backup_path(number)):
+                os.replace(backup_path(number), backup_path(number + 1))
+        os.replace(partial_path, backup_path(1))
+        return backup_path(1)
+
+    def flush(self, force=False):
+        """When running on an in-memory database (see MemoryDatabase),
+        writes it back to its file if FLUSH_INTERVAL seconds have passed
+        since the last flush, or straight away if `force` is True.
+
+        Does nothing for file databases, or inside a transaction (only
+        committed data is flushed).
+        """
+        if not isinstance(db, MemoryDatabase) or db.in_transaction():
+            return
+        elapsed = time.monotonic() - db.last_flush
+        if force or elapsed >= settings.FLUSH_INTERVAL:
+            db.flush()
+
+    def employee_name_trie(self):
+        """Get a prefix trie (see name_index.NameTrie) of the names of all
+        employees who have made entries, for finding an employee by typing
+        the start of their name.
+
+        The trie is built from a single scan the first time it's needed and
+        kept up to date by this class's write methods after that.
+
+        Returns the NameTrie.
+        """
+        if DBManager.name_trie_database is not db:
+            query = (Employee
+                     .select(Employee.name,
+                             fn.COUNT(LogEntry.id).alias('entries'))
+                     .join(LogEntry)
+                     .group_by(Employee.id))
+            DBManager.name_trie = NameTrie(
+                (record.name, record.entries) for record in query
+            )
+            DBManager.name_trie_database = db
+        return DBManager.name_trie
+
+    def employee_name_tree(self):
+        """Get a BK-tree (see name_index.NameBKTree) of the names of all
+        employees who have made entries, for finding an employee whose name
+        has been mistyped.
+
+        Like the name trie, the tree is built from a single scan the first
+        time it's needed and kept up to date by this class's write methods
+        after that.
+
+        Returns the NameBKTree.
+        """
+        if DBManager.name_tree_database is not db:
+            query = (Employee
+                     .select(Employee.name,
+                             fn.COUNT(LogEntry.id).alias('entries'))
+                     .join(LogEntry)
+                     .group_by(Employee.id))
+            DBManager.name_tree = NameBKTree(
+                (record.name, record.entries) for record in query
+            )
+            DBManager.name_tree_database = db
+        return DBManager.name_tree
+
     # Helper Methods
+    def search_query(self, filters):
+        """Builds the query for the entries matching `filters` (see search).
+
+        Each filter adds one condition to the WHERE clause, written so that
+        it can use an index: the employee (looked up to its id) and date
+        range together match the (employee, day_number) index.
+
+        Returns the (unsorted) query.
+        """
+        case_sensitive = filters.get('case_sensitive', False)
+        conditions = []
+        if filters.get('employee') is not None:
+            # looked up to ids first: Employee.name isn't unique, so a
+            # condition on the name can match several employees and the
+            # (employee, ...) indexes can't give the entries in order
+            employee_ids = [row[0] for row in (
+                Employee
+                .select(Employee.id)
+                .where(text_match(Employee.name, filters['employee'],
+                                  case_sensitive, match='exact'))
+                .tuples()
+            )]
+            if len(employee_ids) == 1:
+                conditions.append(LogEntry.employee == employee_ids[0])
+            else:
+                conditions.append(LogEntry.employee.in_(employee_ids))
+        if filters.get('start_date') is not None:
+            conditions.append(
+                LogEntry.day_number >= day_number(filters['start_date'])
+            )
+        if filters.get('end_date') is not None:
+            conditions.append(
+                LogEntry.day_number <= day_number(filters['end_date'])
+            )
+        if filters.get('min_duration') is not None:
+            conditions.append(LogEntry.duration >= filters['min_duration'])
+        if filters.get('max_duration') is not None:
+            conditions.append(LogEntry.duration <= filters['max_duration'])
+        if filters.get('text'):
+            conditions.append(
+                entry_text_match(filters['text'], case_sensitive)
+            )
+        query = self.entries_query()
+        if conditions:
+            query = query.where(*conditions)
+        return query
+
+    def entries_query(self):
+        """Builds the query for every entry along with its employee and
+        task, so that neither has to be fetched separately for each entry.
+
+        Returns the (unfiltered, unsorted) query.
+        """
+        return (LogEntry
+                .select(LogEntry, Employee, Task)
+                .join(Employee)
+                .switch(LogEntry)
+                .join(Task))
+
+    def daily_minutes_query(self, filters):
+        """Builds the query for each employee's total minutes on each day,
+        from the entries matching `filters` (see search).
+
+        Returns the query, aliased as a subquery named 'daily' with the
+        columns name, employee_id, day_number and minutes.
+        """
+        return (self.search_query(filters or {})
+                .select(Employee.name, LogEntry.employee, LogEntry.day_number,
+                        fn.SUM(LogEntry.duration).alias('minutes'))
+                .group_by(LogEntry.employee, LogEntry.day_number)
+                .alias('daily'))
+
+    def name_ids(self, model, names):
+        """Looks up the ids of the `model` (Employee or Task) rows with the
+        given names, adding a row for each name that isn't in the table yet.
+        Call it inside a transaction, so the new rows are only kept if
+        whatever they were added for is written too.
+
+        Names already seen by upsert_entries are looked up in its cache of
+        ids (see the class attributes); the rest are read with one
+        `WHERE name IN (...)` select per few hundred names. Where more than
+        one row has the same name, the oldest is used (as get_or_create
+        would).
+
+        Returns a dict of the id for each name.
+        """
+        if DBManager.name_ids_database is not db:
+            DBManager.employee_ids = {}
+            DBManager.task_ids = {}
+            DBManager.name_ids_database = db
+        if model is Employee:
+            known = DBManager.employee_ids
+        else:
+            known = DBManager.task_ids
+        ids = {}
+        missing = []
+        for name in set(names):
+            if name in known:
+                ids[name] = known[name]
+            else:
+                missing.append(name)
+        # a few hundred at a time, to stay well inside sqlite's limit on
+        # query parameters
+        for start in range(0, len(missing), 500):
+            query = (model
+                     .select(model.id, model.name)
+                     .where(model.name.in_(missing[start:start + 500]))
+                     .order_by(model.id.desc())
+                     .tuples())
+            for row_id, name in query:
+                ids[name] = row_id
+        for name in missing:
+            if name not in ids:
+                ids[name] = model.insert(name=name).execute()
+        return ids
+
+    def update_name_indexes(self, added=(), removed=()):
+        """Records new entries for the `added` names and removed entries for
+        the `removed` names in the employee name trie and BK-tree, if they
+        have been built.
+        """
+        indexes = [
+            (DBManager.name_trie, DBManager.name_trie_database),
+            (DBManager.name_tree, DBManager.name_tree_database),
+        ]
+        for index, database in indexes:
+            if database is not db:
+                continue
+            for name in removed:
+                index.remove(name)
+            for name in added:
+                index.add(name)
+
     def record_to_dict(self, record):
         """Converts a value representing DB record into an OrderedDict.
 
@@ -268,9 +1175,37 @@ class DBManager:
             ('date', record.date),
             ('task_name', record.task_name),
             ('duration', record.duration),
-            ('notes', record.notes)
+            ('notes', record.full_notes())
         ])
 
+    def entries_to_list(self, query):
+        """Runs a query for log entries (see entries_query) and converts
+        the entries into a list of OrderedDicts, like records_to_list.
+
+        Only the five columns returned are read, as tuples, rather than
+        building model instances for each entry, its employee and its task.
+        Compressed notes aren't read at all: the entries with long notes
+        have a LongNotes instead.
+
+        Returns that list of OrderedDicts.
+        """
+        rows = query.select(Employee.name, LogEntry.date, Task.name,
+                            LogEntry.duration, LogEntry.notes, LogEntry.id,
+                            LogEntry.notes_compressed).tuples()
+        entries = []
+        for name, date, task_name, duration, notes, entry_id, compressed \
+                in rows:
+            if compressed:
+                notes = LongNotes(entry_id, notes)
+            entries.append(OrderedDict([
+                ('name', name),
+                ('date', date),
+                ('task_name', task_name),
+                ('duration', duration),
+                ('notes', notes)
+            ]))
+        return entries
+
     def records_to_list(self, records):
         """Converts a value representing a collection of DB records into a
         list of OrderedDicts.
@@ -282,12 +1217,458 @@ class DBManager:
             list.append(self.record_to_dict(record))
         return list
 
+# -- Helper Functions --
+
+
+def entry_hash(entry):
+    """Calculates the content hash of an entry (a dict or OrderedDict with
+    the same keys as the records returned by DBManager).
+
+    Two entries have the same hash if and only if they have the same
+    employee name, date, task name, duration and notes.
+
+    Returns the hash as a 40 character hex string.
+    """
+    content = "\x1f".join([
+        entry["name"],
+        to_date(entry["date"]).isoformat(),
+        entry["task_name"],
+        str(int(entry["duration"])),
+        entry["notes"],
+    ])
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def split_notes(notes):
+    """Splits an entry's notes into what's kept in the logentry table and
+    what's kept in the notetext table (see NoteText): notes longer than
+    settings.NOTES_COMPRESS_SIZE characters are cut down to their first
+    settings.NOTES_PREVIEW_LENGTH characters and compressed in full.
+
+    Returns a tuple of the notes for the logentry table and the compressed
+    notes (or None if they're short enough to keep as they are).
+    """
+    if len(notes) <= settings.NOTES_COMPRESS_SIZE:
+        return (notes, None)
+    return (notes[:settings.NOTES_PREVIEW_LENGTH],
+            zlib.compress(notes.encode('utf-8')))
+
+
+def decompress_notes(compressed):
+    """Returns the notes compressed by split_notes."""
+    return zlib.decompress(compressed).decode('utf-8')
+
+
+def duration_histogram(durations, min_duration, max_duration, buckets=10):
+    """Counts the `durations` (whole minutes from min_duration to
+    max_duration) in up to `buckets` buckets of equal width, covering the
+    whole range.
+
+    Returns the buckets, shortest first, as a list of OrderedDicts with the
+    first and last duration in the bucket and the number of durations in it.
+    """
+    span = max_duration - min_duration + 1
+    # whole minutes, so a narrow range gets fewer, one minute, buckets
+    width = max(-(-span // buckets), 1)
+    counts = [0] * -(-span // width)
+    for duration in durations:
+        counts[(duration - min_duration) // width] += 1
+    return [OrderedDict([
+        ('from', min_duration + i * width),
+        ('to', min(min_duration + (i + 1) * width - 1, max_duration)),
+        ('count', count),
+    ]) for i, count in enumerate(counts)]
+
+
+def duration_bucket_bounds(exact=16, growth=1.1, limit=100000):
+    """Calculates the lower bounds of the duration histogram's buckets: one
+    bucket per minute below `exact` minutes, then buckets that are each
+    `growth` times wider than the one before, up to `limit` minutes (the
+    last bucket has no upper bound). Any duration less than one minute goes
+    in the first bucket.
+
+    Returns the bounds as a list of ints.
+    """
+    bounds = list(range(exact))
+    while bounds[-1] < limit:
+        bounds.append(max(bounds[-1] + 1, int(bounds[-1] * growth)))
+    return bounds
+
+
+def duration_bucket_sql(column):
+    """Builds the SQL expression for the number of the duration histogram
+    bucket (see DURATION_BUCKET_BOUNDS) that `column` falls in.
+
+    Returns the expression as a string.
+    """
+    cases = " ".join(
+        "WHEN {} < {} THEN {}".format(column, bound, i)
+        for i, bound in enumerate(DURATION_BUCKET_BOUNDS[1:])
+    )
+    return "CASE {} ELSE {} END".format(cases,
+                                        len(DURATION_BUCKET_BOUNDS) - 1)
+
+
+def histogram_quantiles(counts, quantiles):
+    """Estimates the `quantiles` (fractions from 0 to 1) of the durations
+    counted in `counts`, a list of (bucket number, count) tuples sorted by
+    bucket number, assuming each bucket's durations are spread evenly over
+    it. The estimates are exact below the first growing bucket, and within
+    half a bucket's width (5% by default) above it.
+
+    Returns an OrderedDict of the estimate for each quantile (None for every
+    quantile if nothing has been counted).
+    """
+    total = sum(count for bucket, count in counts)
+    estimates = OrderedDict()
+    for quantile in quantiles:
+        if total == 0:
+            estimates[quantile] = None
+            continue
+        # the rank of the duration wanted, counting from 1
+        rank = max(quantile * total, 1)
+        counted = 0
+        for bucket, count in counts:
+            if count and counted + count >= rank:
+                break
+            counted += count
+        lowest = DURATION_BUCKET_BOUNDS[bucket]
+        if bucket + 1 < len(DURATION_BUCKET_BOUNDS):
+            highest = DURATION_BUCKET_BOUNDS[bucket + 1] - 1
+        else:
+            highest = lowest
+        # each of the bucket's durations is taken to be at the middle of
+        # its share of the bucket
+        estimates[quantile] = (lowest + (highest - lowest) *
+                               (rank - counted - 0.5) / count)
+    return estimates
+
+
+def print_migration_step(step):
+    """Prints the report of one migration step (see MigrationRunner.run)."""
+    print("  version {} ({}): {} {:.3f}s".format(
+        step['version'], step['description'], step['step'], step['seconds']
+    ))
+
+
+def to_date(value):
+    """Converts a date, a datetime or an iso 8601 date string (optionally
+    followed by a time, as sqlite's DATE columns sometimes hold) into a
+    date.
+
+    Returns the date.
+    """
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.datetime.strptime(value[:10], '%Y-%m-%d').date()
+
+
+def day_number(value):
+    """Converts a date (or anything else to_date accepts) into its day
+    number: the number of days since 0000-12-31, so 0001-01-01 is day 1.
+
+    Dates are stored alongside their day numbers so that date comparisons
+    are integer comparisons on an index rather than comparisons of date
+    strings.
+
+    Returns the day number as an int.
+    """
+    return to_date(value).toordinal()
+
+
+def text_match(field, text_string, case_sensitive=False, match='contains'):
+    """Builds the expression that matches a text field against
+    `text_string`:
+    - `match='exact'`: the whole value equals the text string;
+    - `match='prefix'`: the value starts with the text string;
+    - `match='contains'`: the text string appears anywhere in the value.
+
+    Case insensitive exact and prefix matches compare using the NOCASE
+    collation and case sensitive ones using the default BINARY collation,
+    so either way they can be answered from an index on the field (see the
+    `*_nocase` indexes below the models). Prefix matches are written as a
+    range rather than a LIKE/GLOB pattern so that wildcard characters in
+    the text string don't need escaping.
+
+    Substring matches can't use a b-tree index, but on fields with a
+    trigram index (see TRIGRAM_INDEXES) they only scan the rows the
+    trigram index says might match.
+
+    Returns the expression, for use in a `where()` clause.
+    """
+    if match == 'exact':
+        if not case_sensitive:
+            field = field.collate('NOCASE')
+        return field == text_string
+    elif match == 'prefix':
+        if not case_sensitive:
+            field = field.collate('NOCASE')
+        return ((field >= text_string) &
+                (field < text_string + MAX_CHARACTER))
+    if case_sensitive:
+        # `%` is GLOB in sqlite, which (unlike LIKE) is case sensitive
+        expression = field % "*{}*".format(glob_escape(text_string))
+    else:
+        # sqlite's LIKE is case insensitive
+        expression = field.contains(text_string)
+    candidates = trigram_candidates(field, text_string)
+    if candidates is not None:
+        # the trigram index narrows the search down to a handful of rows,
+        # the LIKE/GLOB then only has to check those
+        expression = candidates & expression
+    return expression
+
+
+def entry_text_match(text_string, case_sensitive=False):
+    """Builds the expression that matches the entries where any of the text
+    fields (the employee name, task name and notes) contains `text_string`
+    (see text_match).
+
+    Employee and task names are matched in their own (small) tables first,
+    so each entry is only checked by its employee and task ids rather than
+    by reading their names. Long notes are matched by decompressing them
+    (see NoteText), so a search reads every one of them.
+
+    Returns the expression, for use in a `where()` clause.
+    """
+    employees = (Employee
+                 .select(Employee.id)
+                 .where(text_match(Employee.name, text_string,
+                                   case_sensitive)))
+    tasks = (Task
+             .select(Task.id)
+             .where(text_match(Task.name, text_string, case_sensitive)))
+    long_notes = (NoteText
+                  .select(NoteText.entry)
+                  .where(text_match(fn.decompress_notes(NoteText.text),
+                                    text_string, case_sensitive)))
+    return (LogEntry.employee.in_(employees) |
+            LogEntry.task.in_(tasks) |
+            text_match(LogEntry.notes, text_string, case_sensitive) |
+            LogEntry.id.in_(long_notes))
+
+
+def glob_escape(text_string):
+    """Escapes the GLOB wildcard characters in `text_string` so that they
+    match literally.
+
+    Returns the escaped string.
+    """
+    return "".join(
+        "[{}]".format(character) if character in "[*?" else character
+        for character in text_string
+    )
+
+
+# Sorts after every other character, so a value starts with prefix if and
+# only if prefix <= value < prefix + MAX_CHARACTER
+MAX_CHARACTER = chr(0x10ffff)
+
+
+def ascii_lower(text_string):
+    """Lower-cases only the ASCII letters in `text_string`, the same way
+    sqlite's built-in lower() function does.
+
+    Returns the lower-cased string.
+    """
+    return "".join(
+        character.lower() if character < "\x80" else character
+        for character in text_string
+    )
+
+# -- Trigram Indexes --
+# A b-tree index can't help with substring (LIKE '%text%') searches, so the
+# text fields that are searched that way also get a trigram index: every
+# three character sequence in the field, pointing back at its row. Where
+# sqlite has the FTS5 trigram tokenizer the index is an external content
+# FTS5 table, otherwise it is a plain table of (trigram, row id) pairs.
+# Either way it is kept up to date by triggers on the indexed table, so
+# every write path (including the ones that bypass DBManager) maintains it.
+
+
+# (table, column) pairs to maintain a trigram index for
+TRIGRAM_INDEXES = [
+    ('employee', 'name'),
+    ('task', 'name'),
+]
+
+
+def has_fts5_trigram():
+    """Checks whether the sqlite library supports FTS5 tables with the
+    trigram tokenizer (sqlite 3.34 onwards, when compiled with FTS5).
+
+    Returns True if it does, otherwise False.
+    """
+    connection = sqlite3.connect(':memory:')
+    try:
+        connection.execute(
+            "CREATE VIRTUAL TABLE probe USING fts5(text, tokenize='trigram')"
+        )
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        connection.close()
+    return True
+
+
+USE_FTS5_TRIGRAMS = has_fts5_trigram()
+
+FTS5_TRIGRAM_SQL = [
+    """CREATE VIRTUAL TABLE "{index}" USING fts5(
+        "{column}", content='{table}', content_rowid='id',
+        tokenize='trigram'
+    )""",
+    """CREATE TRIGGER "{index}_insert" AFTER INSERT ON "{table}" BEGIN
+        INSERT INTO "{index}" (rowid, "{column}")
+        VALUES (new."id", new."{column}");
+    END""",
+    """CREATE TRIGGER "{index}_delete" AFTER DELETE ON "{table}" BEGIN
+        INSERT INTO "{index}" ("{index}", rowid, "{column}")
+        VALUES ('delete', old."id", old."{column}");
+    END""",
+    """CREATE TRIGGER "{index}_update"
+    AFTER UPDATE OF "{column}" ON "{table}" BEGIN
+        INSERT INTO "{index}" ("{index}", rowid, "{column}")
+        VALUES ('delete', old."id", old."{column}");
+        INSERT INTO "{index}" (rowid, "{column}")
+        VALUES (new."id", new."{column}");
+    END""",
+]
+
+FTS5_TRIGRAM_REBUILD_SQL = """INSERT INTO "{index}" ("{index}")
+    VALUES ('rebuild')"""
+
+# The plain table version generates the trigrams of a value by joining it
+# against `trigram_position`, a table of the character positions 1..1024
+TABLE_TRIGRAM_SQL = [
+    """CREATE TABLE IF NOT EXISTS "trigram_position" (
+        "n" INTEGER NOT NULL PRIMARY KEY
+    )""",
+    """WITH RECURSIVE "positions" ("n") AS (
+        SELECT 1 UNION ALL SELECT "n" + 1 FROM "positions" WHERE "n" < 1024
+    )
+    INSERT OR IGNORE INTO "trigram_position" ("n")
+    SELECT "n" FROM "positions"
+    """,
+    """CREATE TABLE "{index}" (
+        "gram" TEXT NOT NULL,
+        "ref_id" INTEGER NOT NULL,
+        PRIMARY KEY ("gram", "ref_id")
+    ) WITHOUT ROWID""",
+    """CREATE TRIGGER "{index}_insert" AFTER INSERT ON "{table}" BEGIN
+        INSERT OR IGNORE INTO "{index}" ("gram", "ref_id")
+        SELECT lower(substr(new."{column}", "n", 3)), new."id"
+        FROM "trigram_position"
+        WHERE "n" <= length(new."{column}") - 2;
+    END""",
+    """CREATE TRIGGER "{index}_delete" AFTER DELETE ON "{table}" BEGIN
+        DELETE FROM "{index}"
+        WHERE "ref_id" = old."id" AND "gram" IN (
+            SELECT lower(substr(old."{column}", "n", 3))
+            FROM "trigram_position"
+            WHERE "n" <= length(old."{column}") - 2
+        );
+    END""",
+    """CREATE TRIGGER "{index}_update"
+    AFTER UPDATE OF "{column}" ON "{table}" BEGIN
+        DELETE FROM "{index}"
+        WHERE "ref_id" = old."id" AND "gram" IN (
+            SELECT lower(substr(old."{column}", "n", 3))
+            FROM "trigram_position"
+            WHERE "n" <= length(old."{column}") - 2
+        );
+        INSERT OR IGNORE INTO "{index}" ("gram", "ref_id")
+        SELECT lower(substr(new."{column}", "n", 3)), new."id"
+        FROM "trigram_position"
+        WHERE "n" <= length(new."{column}") - 2;
+    END""",
+]
+
+TABLE_TRIGRAM_REBUILD_SQL = [
+    'DELETE FROM "{index}"',
+    """INSERT OR IGNORE INTO "{index}" ("gram", "ref_id")
+    SELECT lower(substr("{table}"."{column}", "n", 3)), "{table}"."id"
+    FROM "{table}"
+    JOIN "trigram_position" ON "n" <= length("{table}"."{column}") - 2""",
+]
+
+
+def trigram_index_name(table, column):
+    """Returns the name of the table holding the trigram index for
+    `table`.`column`.
+    """
+    if USE_FTS5_TRIGRAMS:
+        return "{}_{}_fts".format(table, column)
+    else:
+        return "{}_{}_trigram".format(table, column)
+
+
+def trigram_index_sql(table, column):
+    """Returns the list of SQL statements that create the trigram index for
+    `table`.`column` and the triggers that maintain it.
+    """
+    if USE_FTS5_TRIGRAMS:
+        statements = FTS5_TRIGRAM_SQL
+    else:
+        statements = TABLE_TRIGRAM_SQL
+    index_name = trigram_index_name(table, column)
+    return [statement.format(table=table, column=column, index=index_name)
+            for statement in statements]
+
+
+def trigram_candidates(field, text_string):
+    """Uses the trigram index on `field` to find the rows whose value might
+    contain `text_string` (ignoring case).
+
+    Returns an expression restricting the field's table to those rows, or
+    None if the field isn't a model field (e.g., it's a function of one),
+    has no trigram index or the text string is too short to have any
+    trigrams.
+    """
+    if not isinstance(field, Field):
+        return None
+    table = field.model._meta.table_name
+    column = field.column_name
+    if (table, column) not in TRIGRAM_INDEXES or len(text_string) < 3:
+        return None
+    index_name = trigram_index_name(table, column)
+    if USE_FTS5_TRIGRAMS:
+        # a quoted phrase matches rows containing it as a substring
+        phrase = '"{}"'.format(text_string.replace('"', '""'))
+        subquery = SQL(
+            '(SELECT rowid FROM "{0}" WHERE "{0}" MATCH ?)'.format(index_name),
+            [phrase]
+        )
+    else:
+        grams = list({ascii_lower(text_string[i:i + 3])
+                      for i in range(len(text_string) - 2)})
+        subquery = SQL(
+            '(SELECT "ref_id" FROM "{}" WHERE "gram" IN ({}) '
+            'GROUP BY "ref_id" HAVING count(*) = ?)'.format(
+                index_name, ", ".join("?" * len(grams))
+            ),
+            grams + [len(grams)]
+        )
+    return field.model.id.in_(subquery)
+
 # -- Database Model Classes --
 
 
 class Employee(Model):
     """This is the class to represent an employee"""
-    name = CharField(max_length=255)
+    name = CharField(max_length=255, index=True)
+
+    class Meta:
+        database = db
+
+
+class Task(Model):
+    """This is the class to represent a task name. Each distinct task name
+    is stored once and the log entries refer to it by id.
+    """
+    name = CharField(max_length=255, unique=True)
 
     class Meta:
         database = db
@@ -297,15 +1678,629 @@ class LogEntry(Model):
     """This is the class to represent the log entry database table"""
     employee = ForeignKeyField(Employee, backref='log_entries')
     date = DateField()
-    task_name = CharField(max_length=255)
-    duration = IntegerField()
-    notes = CharField(max_length=255)
+    task = ForeignKeyField(Task, backref='log_entries')
+    duration = IntegerField(index=True)
+    # the notes, or just the start of them if they're long enough to be
+    # compressed into the notetext table (see NoteText)
+    notes = TextField()
+    notes_compressed = BooleanField(default=False)
+    content_hash = CharField(max_length=40, null=True, unique=True)
+    # shadows `date` (see day_number()), for indexed date range queries
+    day_number = IntegerField(null=True, index=True)
 
     class Meta:
         database = db
+        indexes = (
+            # for searches by employee and date range
+            (('employee', 'day_number'), False),
+            # for an employee's longest entries
+            (('employee', 'duration'), False),
+        )
 
+    @hybrid_property
+    def task_name(self):
+        """The name of the entry's task. Setting it looks the task up by
+        name, creating it if it's new.
+
+        In queries `LogEntry.task_name` stands for a subquery looking the
+        name up, so it works without joining Task; the queries that read
+        many entries join Task instead (see DBManager.entries_query).
+        """
+        return self.task.name
+
+    @task_name.setter
+    def task_name(self, name):
+        self.task = Task.get_or_create(name=name)[0]
+
+    @task_name.expression
+    def task_name(cls):
+        return Task.select(Task.name).where(Task.id == cls.task)
+
+    def save(self, *args, **kwargs):
+        """Keeps the day number and content hash in step with the record's
+        values, and compresses long notes into the notetext table.
+        """
+        notes = self.full_notes()
+        self.date = to_date(self.date)
+        self.day_number = day_number(self.date)
+        self.content_hash = entry_hash({
+            'name': self.employee.name,
+            'date': self.date,
+            'task_name': self.task_name,
+            'duration': self.duration,
+            'notes': notes,
+        })
+        self.notes, compressed = split_notes(notes)
+        self.notes_compressed = compressed is not None
+        with self._meta.database.atomic():
+            result = super().save(*args, **kwargs)
+            NoteText.delete().where(NoteText.entry == self.id).execute()
+            if compressed is not None:
+                NoteText.create(entry=self.id, text=compressed)
+        return result
+
+    def full_notes(self):
+        """Returns the entry's notes in full, reading and decompressing them
+        from the notetext table if that's where they're kept.
+        """
+        dirty = [field.name for field in self.dirty_fields]
+        if self.notes_compressed and 'notes' not in dirty:
+            return decompress_notes(NoteText.get_by_id(self.id).text)
+        return self.notes
+
+
+class NoteText(Model):
+    """This is the class to represent the notes too long to keep in the
+    logentry table (longer than settings.NOTES_COMPRESS_SIZE characters),
+    zlib compressed. The entry keeps the start of the notes, for listing
+    and searching, and has `notes_compressed` set.
+    """
+    entry = ForeignKeyField(LogEntry, primary_key=True, backref='note_text')
+    text = BlobField()
+
+    class Meta:
+        database = db
+
+
+class LongNotes:
+    """Stands in for an entry's notes, in the entries listed by DBManager,
+    when the notes are kept in the notetext table, so listing entries never
+    reads or decompresses them. It shows as the start of the notes followed
+    by "..."; DBManager.load_notes reads the notes in full.
+    """
+    def __init__(self, entry_id, preview):
+        self.entry_id = entry_id
+        self.preview = preview
+
+    def __str__(self):
+        return self.preview + "..."
+
+    def __repr__(self):
+        return "LongNotes({!r}, {!r})".format(self.entry_id, self.preview)
+
+    def __eq__(self, other):
+        return (isinstance(other, LongNotes) and
+                self.entry_id == other.entry_id)
+
+
+class ChangeLog(Model):
+    """This is the class to represent the change log table: one row for each
+    log entry added, edited or deleted, in the order the changes were made.
+    The rows are written by triggers (see CHANGE_LOG_SQL), not by the
+    application.
+    """
+    # AUTOINCREMENT, so numbers are never reused even after a delete
+    seq = AutoIncrementField()
+    action = CharField(max_length=6)
+    entry_id = IntegerField()
+
+    class Meta:
+        database = db
+
+
+class DurationHistogram(Model):
+    """This is the class to represent the duration histograms: how many of
+    each employee's log entries have a duration in each bucket (see
+    DURATION_BUCKET_BOUNDS). The counts are kept up to date by triggers (see
+    DURATION_HISTOGRAM_SQL) and can be rebuilt with
+    DBManager.rebuild_duration_histograms.
+
+    Histograms with the same buckets are merged by adding their counts, so
+    any group of employees' quantiles come from the same table.
+    """
+    employee_id = IntegerField()
+    bucket = IntegerField()
+    count = IntegerField()
+
+    class Meta:
+        database = db
+        primary_key = CompositeKey('employee_id', 'bucket')
+
+
+# The triggers that write the change log. Edits are only logged when the
+# entry's content changes, not when derived columns (the content hash, day
+# number, etc.) are recalculated. Long notes are only partly kept in the
+# entry (see NoteText), so a change to the notes is spotted by the change to
+# the content hash (a hash that is being recalculated is NULL first).
+CHANGE_LOG_SQL = [
+    """CREATE TRIGGER IF NOT EXISTS "changelog_add"
+    AFTER INSERT ON "logentry" BEGIN
+        INSERT INTO "changelog" ("action", "entry_id")
+        VALUES ('add', new."id");
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS "changelog_edit"
+    AFTER UPDATE ON "logentry"
+    WHEN old."employee_id" IS NOT new."employee_id"
+        OR old."date" IS NOT new."date"
+        OR old."task_id" IS NOT new."task_id"
+        OR old."duration" IS NOT new."duration"
+        OR old."content_hash" != new."content_hash"
+    BEGIN
+        INSERT INTO "changelog" ("action", "entry_id")
+        VALUES ('edit', new."id");
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS "changelog_delete"
+    AFTER DELETE ON "logentry" BEGIN
+        INSERT INTO "changelog" ("action", "entry_id")
+        VALUES ('delete', old."id");
+    END""",
+]
+
+# The trigger that removes an entry's compressed notes along with it
+NOTE_TEXT_SQL = [
+    """CREATE TRIGGER IF NOT EXISTS "notetext_delete"
+    AFTER DELETE ON "logentry" BEGIN
+        DELETE FROM "notetext" WHERE "entry_id" = old."id";
+    END""",
+]
+
+# The lower bound of each duration histogram bucket (see
+# duration_bucket_bounds). Changing them means rebuilding the histograms.
+DURATION_BUCKET_BOUNDS = duration_bucket_bounds()
+
+# The triggers that keep the duration histograms' counts up to date (edits
+# move an entry from one count to another only if its employee or duration
+# changes), and the statements that recount them from scratch.
+DURATION_HISTOGRAM_SQL = [
+    """CREATE TRIGGER IF NOT EXISTS "durationhistogram_add"
+    AFTER INSERT ON "logentry" BEGIN
+        INSERT INTO "durationhistogram" ("employee_id", "bucket", "count")
+        VALUES (new."employee_id", {new_bucket}, 1)
+        ON CONFLICT ("employee_id", "bucket")
+        DO UPDATE SET "count" = "count" + 1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS "durationhistogram_edit"
+    AFTER UPDATE OF "employee_id", "duration" ON "logentry"
+    WHEN old."employee_id" IS NOT new."employee_id"
+        OR old."duration" IS NOT new."duration"
+    BEGIN
+        UPDATE "durationhistogram" SET "count" = "count" - 1
+        WHERE "employee_id" = old."employee_id"
+        AND "bucket" = {old_bucket};
+        INSERT INTO "durationhistogram" ("employee_id", "bucket", "count")
+        VALUES (new."employee_id", {new_bucket}, 1)
+        ON CONFLICT ("employee_id", "bucket")
+        DO UPDATE SET "count" = "count" + 1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS "durationhistogram_delete"
+    AFTER DELETE ON "logentry" BEGIN
+        UPDATE "durationhistogram" SET "count" = "count" - 1
+        WHERE "employee_id" = old."employee_id"
+        AND "bucket" = {old_bucket};
+    END""",
+]
+DURATION_HISTOGRAM_SQL = [
+    statement.format(new_bucket=duration_bucket_sql('new."duration"'),
+                     old_bucket=duration_bucket_sql('old."duration"'))
+    for statement in DURATION_HISTOGRAM_SQL
+]
+DURATION_HISTOGRAM_REBUILD_SQL = [
+    'DELETE FROM "durationhistogram"',
+    """INSERT INTO "durationhistogram" ("employee_id", "bucket", "count")
+    SELECT "employee_id", {bucket}, count(*) FROM "logentry"
+    GROUP BY 1, 2""".format(bucket=duration_bucket_sql('"duration"')),
+]
+
+# The orders DBManager.top_entries can rank entries by, each backed by an
+# index
+TOP_ENTRY_ORDERS = {
+    'duration': LogEntry.duration,
+    'date': LogEntry.day_number,
+}
+
+# The file formats DBManager.export can write, and the size of the buffer
+# rows are written through
+EXPORT_FORMATS = ('csv', 'jsonl')
+EXPORT_BUFFER_SIZE = 1024 * 1024
+
+# The insert run by DBManager.upsert_entries for each row (the parameters are
+# in column order); entries whose content hash is already in the log are
+# skipped.
+UPSERT_ENTRY_SQL = """INSERT INTO "logentry"
+    ("employee_id", "date", "day_number", "task_id", "duration", "notes",
+     "notes_compressed", "content_hash")
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT ("content_hash") DO NOTHING"""
+
+# The distinct dates (as day numbers) between two day numbers, in order.
+# Rather than reading every entry, each step jumps along the day_number
+# index to the next day with any entries, so it takes one index lookup per
+# date listed however many entries there are.
+DISTINCT_DAYS_SQL = """WITH RECURSIVE "days" ("day_number") AS (
+        SELECT min("day_number") FROM "logentry" WHERE "day_number" >= ?1
+        UNION ALL
+        SELECT (SELECT min("day_number") FROM "logentry"
+                WHERE "day_number" > "days"."day_number")
+        FROM "days" WHERE "days"."day_number" < ?2
+    )
+    SELECT "day_number" FROM "days" WHERE "day_number" <= ?2"""
+
+# The first day number in each month with any entries, in order, jumping
+# along the day_number index from one month to the next in the same way
+# (julianday counts from noon, 4714 BC; see the day numbers migration).
+DISTINCT_MONTHS_SQL = """WITH RECURSIVE "months" ("day_number") AS (
+        SELECT min("day_number") FROM "logentry"
+        UNION ALL
+        SELECT (SELECT min("day_number") FROM "logentry"
+                WHERE "day_number" >= CAST(
+                    julianday("months"."day_number" + 1721424.5,
+                              'start of month', '+1 month') - 1721424.5
+                    AS INTEGER))
+        FROM "months" WHERE "months"."day_number" IS NOT NULL
+    )
+    SELECT "day_number" FROM "months" WHERE "day_number" IS NOT NULL"""
+
+# case insensitive counterparts of the (BINARY) indexes on the text fields
+Employee.add_index(Employee.index(Employee.name.collate('NOCASE'),
+                                  name='employee_name_nocase'))
+Task.add_index(Task.index(Task.name.collate('NOCASE'),
+                          name='task_name_nocase'))
 
 tables = [
     Employee,
+    Task,
     LogEntry,
+    NoteText,
+    ChangeLog,
+    DurationHistogram,
+]
+
+
+# -- Schema Migrations --
+# Each migration upgrades the databases created by earlier versions of the
+# application (see DBManager.upgrade_schema). Add a new one, with the next
+# version number, for every change to an existing table. The steps have to
+# be safe to run again (see migrations.py).
+
+
+def column_names(database, table):
+    """Returns the list of the names of the columns in `table`."""
+    return [column.name for column in database.get_columns(table)]
+
+
+def add_content_hash_column(database):
+    """Adds the content_hash column to the logentry table (if missing)."""
+    if 'content_hash' not in column_names(database, 'logentry'):
+        migrate(SqliteMigrator(database).add_column(
+            'logentry', 'content_hash', CharField(max_length=40, null=True)
+        ))
+
+
+def hash_entries(database, where, params=()):
+    """Hashes the entries matching `where` (an SQL condition on the
+    logentry table, with `params` as its parameters) that haven't got a
+    content hash, oldest first, and removes the exact duplicates of an older
+    entry (which the unique index would otherwise reject). Entries that
+    already have a hash count as older.
+
+    Returns the number of duplicates removed.
+    """
+    # only select the original columns, later ones may not exist yet, and
+    # read the task name from wherever this version of the schema keeps it
+    columns = column_names(database, 'logentry')
+    if 'task_name' in columns:
+        task_name = '"logentry"."task_name"'
+    else:
+        task_name = ('(SELECT "name" FROM "task" '
+                     'WHERE "task"."id" = "logentry"."task_id")')
+    if 'notes_compressed' in columns:
+        compressed = ('(SELECT "text" FROM "notetext" '
+                      'WHERE "notetext"."entry_id" = "logentry"."id")')
+    else:
+        compressed = 'NULL'
+    cursor = database.execute_sql(
+        'SELECT "logentry"."id", "employee"."name", "logentry"."date", '
+        '{}, "logentry"."duration", "logentry"."notes", {} '
+        'FROM "logentry" '
+        'JOIN "employee" ON "employee"."id" = "logentry"."employee_id" '
+        'WHERE ({}) AND "logentry"."content_hash" IS NULL '
+        'ORDER BY "logentry"."id"'.format(task_name, compressed, where),
+        params
+    )
+    hashes = OrderedDict()
+    duplicates = []
+    for entry_id, name, date, task_name, duration, notes, compressed \
+            in cursor:
+        if compressed is not None:
+            notes = decompress_notes(compressed)
+        content_hash = entry_hash({
+            'name': name,
+            'date': date,
+            'task_name': task_name,
+            'duration': duration,
+            'notes': notes,
+        })
+        if content_hash in hashes:
+            duplicates.append(entry_id)
+        else:
+            hashes[content_hash] = entry_id
+    # a few hundred at a time, to stay well inside sqlite's limit on
+    # query parameters
+    candidates = list(hashes)
+    for start in range(0, len(candidates), 500):
+        older = (LogEntry
+                 .select(LogEntry.content_hash)
+                 .where(LogEntry.content_hash.in_(
+                     candidates[start:start + 500]
+                 )))
+        for record in older:
+            duplicates.append(hashes.pop(record.content_hash))
+    for start in range(0, len(duplicates), 500):
+        (LogEntry
+         .delete()
+         .where(LogEntry.id.in_(duplicates[start:start + 500]))
+         .execute())
+    database.cursor().executemany(
+        'UPDATE "logentry" SET "content_hash" = ? WHERE "id" = ?',
+        list(hashes.items())
+    )
+    return len(duplicates)
+
+
+@chunked
+def hash_log_entries(database):
+    """Hashes every entry that hasn't got a content hash (see hash_entries),
+    a chunk of entries at a time.
+    """
+    duplicate_count = 0
+    for start, end in id_ranges(database, 'logentry',
+                                settings.MIGRATION_CHUNK_SIZE):
+        with database.atomic():
+            duplicate_count += hash_entries(database,
+                                            '"logentry"."id" BETWEEN ? AND ?',
+                                            (start, end))
+    if duplicate_count:
+        print("removed {} duplicate entries".format(duplicate_count))
+
+
+def add_day_number_column(database):
+    """Adds the day_number column to the logentry table (if missing)."""
+    if 'day_number' not in column_names(database, 'logentry'):
+        migrate(SqliteMigrator(database).add_column(
+            'logentry', 'day_number', IntegerField(null=True)
+        ))
+
+
+def add_duration_histograms(database):
+    """Creates the duration histogram table and its triggers, and counts
+    the existing entries' durations.
+    """
+    DurationHistogram.create_table(safe=True)
+    for statement in DURATION_HISTOGRAM_SQL + DURATION_HISTOGRAM_REBUILD_SQL:
+        database.execute_sql(statement)
+
+
+def add_task_column(database):
+    """Creates the task table and adds the task_id column to the logentry
+    table (if missing).
+    """
+    Task.create_table(safe=True)
+    if 'task_id' not in column_names(database, 'logentry'):
+        database.execute_sql(
+            'ALTER TABLE "logentry" '
+            'ADD COLUMN "task_id" INTEGER REFERENCES "task" ("id")'
+        )
+
+
+@chunked
+def link_tasks(database):
+    """Points every entry at the task with its task name, adding the task
+    names to the task table as they're found, a chunk of entries at a time.
+    """
+    if 'task_name' not in column_names(database, 'logentry'):
+        return
+    for start, end in id_ranges(database, 'logentry',
+                                settings.MIGRATION_CHUNK_SIZE):
+        with database.atomic():
+            database.execute_sql(
+                'INSERT OR IGNORE INTO "task" ("name") '
+                'SELECT DISTINCT "task_name" FROM "logentry" '
+                'WHERE "id" BETWEEN ? AND ? AND "task_id" IS NULL',
+                (start, end)
+            )
+            database.execute_sql(
+                'UPDATE "logentry" SET "task_id" = ('
+                'SELECT "id" FROM "task" '
+                'WHERE "task"."name" = "logentry"."task_name") '
+                'WHERE "id" BETWEEN ? AND ? AND "task_id" IS NULL',
+                (start, end)
+            )
+
+
+def drop_task_name_column(database):
+    """Drops the logentry table's task_name column (if it's still there),
+    with the indexes and triggers that use it. The triggers and trigram
+    index that replace them are created by DBManager.__init__.
+
+    Unlike the other steps this can't be done a chunk at a time: sqlite
+    drops a column by rewriting the whole table in one transaction,
+    holding the write lock throughout (a second or two per million
+    entries). Nor can it be put off until the database is idle, as the
+    column is NOT NULL and new entries no longer have a task name to put
+    in it. So it's the last step of its migration, and databases with
+    millions of entries are best upgraded while no one is using them.
+    """
+    if 'task_name' not in column_names(database, 'logentry'):
+        return
+    index_name = trigram_index_name('logentry', 'task_name')
+    for action in ['insert', 'delete', 'update']:
+        database.execute_sql(
+            'DROP TRIGGER IF EXISTS "{}_{}"'.format(index_name, action)
+        )
+    for statement in [
+        'DROP TABLE IF EXISTS "{}"'.format(index_name),
+        'DROP TRIGGER IF EXISTS "changelog_edit"',
+        'DROP INDEX IF EXISTS "logentry_task_name"',
+        'DROP INDEX IF EXISTS "logentry_task_name_nocase"',
+    ]:
+        database.execute_sql(statement)
+    migrate(SqliteMigrator(database).drop_column('logentry', 'task_name'))
+
+
+def add_note_text_table(database):
+    """Creates the notetext table and adds the notes_compressed column to
+    the logentry table (if missing).
+    """
+    NoteText.create_table(safe=True)
+    if 'notes_compressed' not in column_names(database, 'logentry'):
+        database.execute_sql(
+            'ALTER TABLE "logentry" '
+            'ADD COLUMN "notes_compressed" INTEGER NOT NULL DEFAULT 0'
+        )
+    # recreated by DBManager.__init__ to spot changes to long notes
+    database.execute_sql('DROP TRIGGER IF EXISTS "changelog_edit"')
+
+
+@chunked
+def compress_long_notes(database):
+    """Moves the notes longer than settings.NOTES_COMPRESS_SIZE into the
+    notetext table (see split_notes), a chunk of entries at a time.
+    """
+    for start, end in id_ranges(database, 'logentry',
+                                settings.MIGRATION_CHUNK_SIZE):
+        with database.atomic():
+            cursor = database.execute_sql(
+                'SELECT "id", "notes" FROM "logentry" '
+                'WHERE "id" BETWEEN ? AND ? AND NOT "notes_compressed" '
+                'AND length("notes") > ?',
+                (start, end, settings.NOTES_COMPRESS_SIZE)
+            )
+            for entry_id, notes in cursor.fetchall():
+                preview, compressed = split_notes(notes)
+                database.execute_sql(
+                    'INSERT OR REPLACE INTO "notetext" ("entry_id", "text") '
+                    'VALUES (?, ?)',
+                    (entry_id, compressed)
+                )
+                database.execute_sql(
+                    'UPDATE "logentry" '
+                    'SET "notes" = ?, "notes_compressed" = 1 '
+                    'WHERE "id" = ?',
+                    (preview, entry_id)
+                )
+
+
+def add_change_log_table(database):
+    """Creates the change log table (the triggers that write it are
+    created by DBManager.__init__).
+    """
+    ChangeLog.create_table(safe=True)
+
+
+@chunked
+def log_existing_entries(database):
+    """Logs an 'add' for every entry that has no change logged yet, a chunk
+    of entries at a time, so a consumer reading the change log from the
+    start (see DBManager.changes_since) gets the entries that were written
+    before the change log existed.
+
+    The entries already logged are looked up through an index on
+    changelog.entry_id that only lasts as long as this step.
+    """
+    database.execute_sql(
+        'CREATE INDEX IF NOT EXISTS "changelog_entry_id" '
+        'ON "changelog" ("entry_id")'
+    )
+    for start, end in id_ranges(database, 'logentry',
+                                settings.MIGRATION_CHUNK_SIZE):
+        with database.atomic():
+            database.execute_sql(
+                'INSERT INTO "changelog" ("action", "entry_id") '
+                'SELECT \'add\', "id" FROM "logentry" '
+                'WHERE "id" BETWEEN ? AND ? AND NOT EXISTS ('
+                'SELECT 1 FROM "changelog" '
+                'WHERE "changelog"."entry_id" = "logentry"."id") '
+                'ORDER BY "id"',
+                (start, end)
+            )
+    database.execute_sql('DROP INDEX "changelog_entry_id"')
+
+
+MIGRATIONS = [
+    Migration(1, "content hashes", [
+        ("add column", add_content_hash_column),
+        ("hash entries", hash_log_entries),
+        ("index hashes", sql_step(
+            'CREATE UNIQUE INDEX IF NOT EXISTS "logentry_content_hash" '
+            'ON "logentry" ("content_hash")'
+        )),
+    ]),
+    Migration(2, "day numbers", [
+        ("add column", add_day_number_column),
+        # dates that were saved with a time part (e.g., '2018-05-01
+        # 00:00:00') are normalised to plain iso 8601 dates
+        ("normalise dates", backfill_step(
+            'logentry',
+            'UPDATE "logentry" SET "date" = date("date") '
+            'WHERE "id" BETWEEN ? AND ? '
+            'AND date("date") IS NOT NULL AND "date" != date("date")',
+            settings.MIGRATION_CHUNK_SIZE
+        )),
+        # julianday counts from noon, 4714 BC; the day numbers count from
+        # 0001-01-01 (day 1)
+        ("number days", backfill_step(
+            'logentry',
+            'UPDATE "logentry" '
+            'SET "day_number" = CAST(julianday("date") - 1721424.5 '
+            'AS INTEGER) '
+            'WHERE "id" BETWEEN ? AND ? AND "day_number" IS NULL',
+            settings.MIGRATION_CHUNK_SIZE
+        )),
+        ("index day numbers", sql_step(
+            'CREATE INDEX IF NOT EXISTS "logentry_day_number" '
+            'ON "logentry" ("day_number")',
+            'CREATE INDEX IF NOT EXISTS "logentry_employee_id_day_number" '
+            'ON "logentry" ("employee_id", "day_number")'
+        )),
+    ]),
+    Migration(3, "duration indexes", [
+        ("index durations", sql_step(
+            'CREATE INDEX IF NOT EXISTS "logentry_duration" '
+            'ON "logentry" ("duration")',
+            'CREATE INDEX IF NOT EXISTS "logentry_employee_id_duration" '
+            'ON "logentry" ("employee_id", "duration")'
+        )),
+    ]),
+    Migration(4, "duration histograms", [
+        ("count durations", add_duration_histograms),
+    ]),
+    Migration(5, "task dictionary", [
+        ("add column", add_task_column),
+        ("link tasks", link_tasks),
+        ("index tasks", sql_step(
+            'CREATE INDEX IF NOT EXISTS "logentry_task_id" '
+            'ON "logentry" ("task_id")'
+        )),
+        # rewrites the whole table under one lock (see
+        # drop_task_name_column)
+        ("drop task names", drop_task_name_column),
+    ]),
+    Migration(6, "compressed notes", [
+        ("add table", add_note_text_table),
+        ("compress notes", compress_long_notes),
+    ]),
+    Migration(7, "change log", [
+        ("add table", add_change_log_table),
+        ("log existing entries", log_existing_entries),
+    ]),
 ]
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+"""Migrations
+Upgrades the schema of existing databases one numbered version at a time.
+
+A database's version is kept in sqlite's `PRAGMA user_version` (0 for a
+database that has never been migrated). Each Migration takes a database
+from the version before it to its own version through a list of steps, and
+the version is only recorded once every step has finished, so a migration
+that is interrupted part way is simply run again from the start. Steps
+therefore have to be safe to repeat: add a column only if it's missing,
+create indexes with IF NOT EXISTS, only backfill rows that still need it.
+
+Long backfills are run in chunks of rows (see backfill_step), each in its
+own short transaction, so they don't lock a large database for minutes at
+a time and pick up where they left off if they're interrupted.
+
+Created: 2026
+Last Update: 2026-10-19
+Author: Alex Koumparos
+"""
+from collections import OrderedDict
+import time
+
+
+class Migration:
+    """The changes that take a database's schema to version `version`.
+
+    `steps` is a list of (name, function) pairs, run in order, where each
+    function takes the database. A step runs inside a transaction unless
+    its function has been marked with `chunked`, in which case it manages
+    its own transactions.
+    """
+    def __init__(self, version, description, steps):
+        self.version = version
+        self.description = description
+        self.steps = steps
+
+
+class MigrationRunner:
+    """Applies the migrations that a database hasn't had yet."""
+    def __init__(self, database, migrations):
+        """`migrations` is the list of every Migration, in version order."""
+        self.database = database
+        self.migrations = migrations
+
+    def version(self):
+        """Returns the database's current schema version."""
+        return self.database.execute_sql('PRAGMA user_version').fetchone()[0]
+
+    def set_version(self, version):
+        """Records `version` as the database's schema version."""
+        # pragmas can't take query parameters
+        self.database.execute_sql('PRAGMA user_version = {:d}'.format(version))
+
+    def latest_version(self):
+        """Returns the version of the last migration."""
+        if not self.migrations:
+            return 0
+        return self.migrations[-1].version
+
+    def pending(self):
+        """Returns the list of migrations the database hasn't had yet."""
+        version = self.version()
+        return [migration for migration in self.migrations
+                if migration.version > version]
+
+    def run(self, progress=None):
+        """Runs every pending migration, recording the new version after
+        each one.
+
+        `progress`, if given, is called with each step's report as soon as
+        the step finishes.
+
+        Returns a list of OrderedDicts, one per step run, with the
+        migration's version and description, the step's name and the time
+        it took (in seconds).
+        """
+        report = []
+        for migration in self.pending():
+            for name, step in migration.steps:
+                start = time.perf_counter()
+                if getattr(step, 'chunked', False):
+                    step(self.database)
+                else:
+                    with self.database.atomic():
+                        step(self.database)
+                step_report = OrderedDict([
+                    ('version', migration.version),
+                    ('description', migration.description),
+                    ('step', name),
+                    ('seconds', time.perf_counter() - start),
+                ])
+                report.append(step_report)
+                if progress is not None:
+                    progress(step_report)
+            self.set_version(migration.version)
+        return report
+
+
+# -- Helper Functions --
+
+
+def chunked(function):
+    """Marks the migration step `function` as one that runs its own
+    transactions (see Migration).
+
+    Returns the function.
+    """
+    function.chunked = True
+    return function
+
+
+def sql_step(*statements):
+    """Returns a migration step that runs the SQL `statements`, e.g., to
+    add an index (with IF NOT EXISTS).
+    """
+    def step(database):
+        for statement in statements:
+            database.execute_sql(statement)
+    return step
+
+
+def id_ranges(database, table, chunk_size):
+    """Splits the ids of the rows in `table` into ranges of `chunk_size`
+    ids.
+
+    Yields an (first id, last id) tuple for each range, lowest first.
+    """
+    first, last = database.execute_sql(
+        'SELECT min("id"), max("id") FROM "{}"'.format(table)
+    ).fetchone()
+    if first is None:
+        return
+    for start in range(first, last + 1, chunk_size):
+        yield (start, start + chunk_size - 1)
+
+
+def backfill_step(table, update_sql, chunk_size):
+    """Returns a chunked migration step that runs `update_sql` for each
+    range of `chunk_size` ids in `table`, each in its own transaction.
+
+    `update_sql` takes the first and last id of the range as its two
+    parameters, and should only change rows that still need it (e.g.,
+    `WHERE ... IS NULL`), so that an interrupted backfill carries on where
+    it left off.
+    """
+    @chunked
+    def step(database):
+        for start, end in id_ranges(database, table, chunk_size):
+            with database.atomic():
+                database.execute_sql(update_sql, (start, end))
+    return step
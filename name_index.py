@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+
+"""Name Index
+In-memory indexes over employee names, so that the menus can look names up
+as the user types without going back to the database every time.
+
+Created: 2026
+Last Update: 2026-10-19
+Author: Alex Koumparos
+"""
+import bisect
+
+
+class TrieNode:
+    """A single node of a NameTrie, representing one prefix"""
+    def __init__(self):
+        # the next character of the (lower-cased) key -> TrieNode
+        self.children = {}
+        # names whose key ends at this node -> number of entries
+        self.names = {}
+        # the first `limit` (key, name) pairs in this node's subtree, in
+        # alphabetical order
+        self.top = []
+
+
+class NameTrie:
+    """A prefix tree of employee names.
+
+    Names are matched ignoring case. Every node keeps the alphabetically
+    first `limit` names below it, so finding the top matches for a prefix
+    is just a walk down the tree, and extending the prefix by one character
+    (see TrieCursor) takes constant time.
+
+    Each name carries a count (the number of log entries for that employee)
+    and stops being a match when its count drops to zero.
+    """
+    def __init__(self, names=(), limit=10):
+        """Builds the trie.
+
+        `names` is an iterable of (name, count) pairs.
+        """
+        self.root = TrieNode()
+        self.limit = limit
+        for name, count in names:
+            self.add(name, count)
+
+    def add(self, name, count=1):
+        """Adds `count` entries for `name`, adding the name if it isn't
+        already in the trie.
+        """
+        key = name.lower()
+        path = self.path(key, create=True)
+        node = path[-1]
+        if name in node.names:
+            node.names[name] += count
+            return
+        node.names[name] = count
+        for node in path:
+            bisect.insort(node.top, (key, name))
+            if len(node.top) > self.limit:
+                node.top.pop()
+
+    def remove(self, name, count=1):
+        """Removes `count` entries for `name`, removing the name once it has
+        no entries left.
+        """
+        key = name.lower()
+        path = self.path(key)
+        if path is None or name not in path[-1].names:
+            return
+        node = path[-1]
+        node.names[name] -= count
+        if node.names[name] > 0:
+            return
+        del node.names[name]
+        for depth, node in enumerate(path):
+            if (key, name) in node.top:
+                # something further down the alphabet may now make the cut
+                node.top = self.collect(node, key[:depth])
+
+    def matches(self, prefix):
+        """Returns a list of the first `limit` names (alphabetically) that
+        start with `prefix`.
+        """
+        path = self.path(prefix.lower())
+        if path is None:
+            return []
+        return [name for key, name in path[-1].top]
+
+    def cursor(self):
+        """Returns a TrieCursor positioned at the root of the trie."""
+        return TrieCursor(self)
+
+    # Helper Methods
+    def path(self, key, create=False):
+        """Returns the list of nodes from the root to the node for `key`.
+
+        If the key isn't in the trie the missing nodes are created when
+        `create` is True, otherwise None is returned.
+        """
+        node = self.root
+        path = [node]
+        for character in key:
+            if character not in node.children:
+                if not create:
+                    return None
+                node.children[character] = TrieNode()
+            node = node.children[character]
+            path.append(node)
+        return path
+
+    def collect(self, node, key):
+        """Returns the first `limit` (key, name) pairs in the subtree below
+        `node` (the node for `key`), in alphabetical order.
+
+        A preorder walk visiting children alphabetically produces the keys
+        in order, so the walk stops as soon as it has enough names.
+        """
+        collected = []
+        stack = [(key, node)]
+        while stack and len(collected) < self.limit:
+            key, node = stack.pop()
+            for name in sorted(node.names):
+                collected.append((key, name))
+            for character in sorted(node.children, reverse=True):
+                stack.append((key + character, node.children[character]))
+        return collected[:self.limit]
+
+
+class TrieCursor:
+    """Walks a NameTrie one character at a time, as a user types a prefix.
+
+    Each character typed or deleted moves the cursor one node, so the
+    matches can be refreshed after every keystroke in constant time.
+    """
+    def __init__(self, trie):
+        self.trie = trie
+        self.prefix = ""
+        # the node for each prefix typed so far (None once the prefix has
+        # left the trie)
+        self.nodes = [trie.root]
+
+    def push(self, character):
+        """Extends the prefix by `character`."""
+        node = self.nodes[-1]
+        for key_character in character.lower():
+            if node is not None:
+                node = node.children.get(key_character)
+        self.nodes.append(node)
+        self.prefix += character
+
+    def pop(self):
+        """Removes the last character from the prefix."""
+        if self.prefix:
+            self.nodes.pop()
+            self.prefix = self.prefix[:-1]
+
+    def move_to(self, prefix):
+        """Changes the prefix to `prefix`, only moving through the
+        characters that differ from the current prefix.
+        """
+        common = 0
+        for old, new in zip(self.prefix, prefix):
+            if old != new:
+                break
+            common += 1
+        while len(self.prefix) > common:
+            self.pop()
+        for character in prefix[common:]:
+            self.push(character)
+
+    def matches(self):
+        """Returns a list of the first names (alphabetically) that start
+        with the current prefix.
+        """
+        node = self.nodes[-1]
+        if node is None:
+            return []
+        return [name for key, name in node.top]
+
+
+class BKNode:
+    """A single node of a NameBKTree, for one (lower-cased) key"""
+    def __init__(self, key):
+        self.key = key
+        # names with this key -> number of entries
+        self.names = {}
+        # edit distance from this node's key -> BKNode
+        self.children = {}
+
+
+class NameBKTree:
+    """A BK-tree of employee names, for finding the names within a few
+    typos of a search.
+
+    Each node's children are filed under their edit distance from it, and
+    since edit distance obeys the triangle inequality, a search for names
+    within `max_distance` of the text only has to visit the children whose
+    distance is within `max_distance` of the current node's, skipping most
+    of the tree.
+
+    Names are matched ignoring case. As with NameTrie each name carries a
+    count of entries and stops being a match when it drops to zero (the node
+    stays in the tree, since removing it would mean rebuilding its subtree).
+    """
+    def __init__(self, names=(), limit=10):
+        """Builds the tree.
+
+        `names` is an iterable of (name, count) pairs.
+        """
+        self.root = None
+        self.limit = limit
+        for name, count in names:
+            self.add(name, count)
+
+    def add(self, name, count=1):
+        """Adds `count` entries for `name`, adding the name if it isn't
+        already in the tree.
+        """
+        key = name.lower()
+        if self.root is None:
+            self.root = BKNode(key)
+        node = self.root
+        while node.key != key:
+            distance = edit_distance(key, node.key)
+            if distance not in node.children:
+                node.children[distance] = BKNode(key)
+            node = node.children[distance]
+        node.names[name] = node.names.get(name, 0) + count
+
+    def remove(self, name, count=1):
+        """Removes `count` entries for `name`, which stops matching once it
+        has no entries left.
+        """
+        node = self.node(name.lower())
+        if node is None or name not in node.names:
+            return
+        node.names[name] -= count
+        if node.names[name] <= 0:
+            del node.names[name]
+
+    def matches(self, text, max_distance=2):
+        """Returns a list of up to `limit` (distance, name) tuples for the
+        names within `max_distance` edits (insertions, deletions or
+        substitutions of one character) of `text`, closest first then
+        alphabetically.
+        """
+        if self.root is None:
+            return []
+        text = text.lower()
+        found = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            distance = edit_distance(text, node.key)
+            if distance <= max_distance:
+                for name in node.names:
+                    found.append((distance, node.key, name))
+            for child_distance, child in node.children.items():
+                if abs(child_distance - distance) <= max_distance:
+                    stack.append(child)
+        found.sort()
+        return [(distance, name) for distance, key, name in found][:self.limit]
+
+    # Helper Methods
+    def node(self, key):
+        """Returns the node for `key`, or None if it isn't in the tree."""
+        node = self.root
+        while node is not None and node.key != key:
+            node = node.children.get(edit_distance(key, node.key))
+        return node
+
+
+# -- Helper Functions --
+
+
+def edit_distance(first, second):
+    """Calculates the Levenshtein distance between two strings: the fewest
+    single character insertions, deletions and substitutions that turn one
+    into the other.
+
+    Returns the distance as an int.
+    """
+    if len(first) < len(second):
+        first, second = second, first
+    # the distances from each prefix of `second` to the prefix of `first`
+    # handled so far, one row of the usual table at a time
+    previous = list(range(len(second) + 1))
+    for i, first_character in enumerate(first, 1):
+        current = [i]
+        for j, second_character in enumerate(second, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (first_character != second_character),
+            ))
+        previous = current
+    return previous[-1]
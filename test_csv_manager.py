@@ -0,0 +1,335 @@
+"""Test CSV Manager
+Unit Tests for csv_manager.py
+
+Created: 2026
+Last Update: 2026-10-19
+Author: Alex Koumparos
+"""
+import datetime
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from peewee import *
+
+import csv_manager
+import db_manager
+import wl_settings as settings
+
+
+class CsvManagerTests(unittest.TestCase):
+
+    # Helper Methods
+    # --------------
+    def set_test_database(self):
+        """Switch out the regular database and switch in a unittest-only
+        database
+        """
+        db_manager.db = SqliteDatabase(settings.UNITTEST_DATABASE_NAME)
+        for model in db_manager.tables:
+            model._meta.database = db_manager.db
+
+    def revert_database(self):
+        """Switch back to regular database"""
+        # make sure that in unittest database
+        db_manager.db = SqliteDatabase(settings.UNITTEST_DATABASE_NAME)
+        for model in db_manager.tables:
+            model._meta.database = db_manager.db
+
+        # delete all test data (log entries first, deleting them writes to
+        # some of the other tables)
+        q = db_manager.LogEntry.delete()
+        q.execute()
+        for model in db_manager.tables:
+            q = model.delete()
+            q.execute()
+
+        # switch back to live database
+        db_manager.db = SqliteDatabase(settings.LIVE_DATABASE_NAME)
+        for model in db_manager.tables:
+            model._meta.database = db_manager.db
+
+    def write_csv(self, text):
+        """Writes `text` to a temporary CSV file and returns its path"""
+        file_path = os.path.join(self.directory, 'import.csv')
+        with open(file_path, 'w', newline='') as csv_file:
+            csv_file.write(text)
+        return file_path
+
+    # Setup and Teardown
+    # ------------------
+    def setUp(self):
+        self.set_test_database()
+        # creates the tables
+        db_manager.DBManager()
+        self.directory = tempfile.mkdtemp()
+        self.csv_manager = csv_manager.CsvManager(batch_size=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        self.revert_database()
+
+    # Actual tests
+    # ------------
+    # import_file
+    def test_import_file_writes_valid_rows_in_batches(self):
+        """Ensure that every valid row is written, whatever the column order
+        and date format, across several batches
+        """
+        file_path = self.write_csv(
+            "notes,name,date,task_name,duration,extra\n"
+            "first,Alice,2018-01-02,Task A,10,x\n"
+            "second,Bob,03/01/2018,Task B,20,x\n"
+            "third,Alice,2018-01-04,Task C,30,x\n"
+        )
+
+        result = self.csv_manager.import_file(file_path)
+
+        self.assertEqual(result['rows'], 3)
+        self.assertEqual(result['written'], 3)
+        self.assertEqual(result['errors'], [])
+        dbm = db_manager.DBManager()
+        entries = dbm.view_everything(date_sorted=True)
+        self.assertEqual([entry['notes'] for entry in entries],
+                         ['first', 'second', 'third'])
+        self.assertEqual(entries[1]['date'], datetime.date(2018, 1, 3))
+
+    def test_import_file_reports_invalid_rows_by_line(self):
+        """Ensure that invalid rows are skipped and reported with their line
+        numbers
+        """
+        file_path = self.write_csv(
+            "name,date,task_name,duration,notes\n"
+            "Alice,2018-01-02,Task A,10,ok\n"
+            "Alice,2018-13-45,Task A,10,bad date\n"
+            "Alice,2018-01-02,Task A,ten,bad duration\n"
+            "Alice,2018-01-02,Task A,-5,negative duration\n"
+            "Alice,2018-01-02\n"
+        )
+
+        result = self.csv_manager.import_file(file_path)
+
+        self.assertEqual(result['written'], 1)
+        self.assertEqual([line for line, error in result['errors']],
+                         [3, 4, 5, 6])
+
+    def test_import_file_twice_writes_nothing_new(self):
+        """Ensure that importing the same file again doesn't duplicate
+        entries
+        """
+        file_path = self.write_csv(
+            "name,date,task_name,duration,notes\n"
+            "Alice,2018-01-02,Task A,10,\n"
+            "Bob,2018-01-03,Task B,20,\n"
+            "Carol,2018-01-04,Task C,30,\n"
+        )
+        self.csv_manager.import_file(file_path)
+
+        result = self.csv_manager.import_file(file_path)
+
+        self.assertEqual(result['rows'], 3)
+        self.assertEqual(result['written'], 0)
+
+    def test_import_file_missing_column_raises_error(self):
+        """Ensure that a file without one of the settings.HEADERS columns is
+        rejected
+        """
+        file_path = self.write_csv("name,date,task_name,notes\n")
+
+        with patch('sys.stdout', new=io.StringIO()):
+            with self.assertRaises(ValueError):
+                self.csv_manager.import_file(file_path)
+
+    def test_import_file_skips_byte_order_mark(self):
+        """Ensure that a file starting with a byte order mark (as Excel
+        saves them) has its header row found, both in one process and in
+        parallel
+        """
+        file_path = os.path.join(self.directory, 'excel.csv')
+        with open(file_path, 'w', newline='',
+                  encoding='utf-8-sig') as csv_file:
+            csv_file.write("name,date,task_name,duration,notes\n"
+                           "Alice,2018-01-02,Task A,10,\n")
+
+        result = self.csv_manager.import_file(file_path)
+        parallel_result = self.csv_manager.import_file_parallel(
+            file_path, workers=1)
+
+        self.assertEqual(result['written'], 1)
+        self.assertEqual(parallel_result['rows'], 1)
+        self.assertEqual(
+            db_manager.DBManager().view_everything()[0]['name'], 'Alice'
+        )
+
+    def test_import_file_invalid_csv_raises_error(self):
+        """Ensure that a file that isn't valid CSV (a quoted field that runs
+        on past the field size limit) is rejected with its line number,
+        both in one process and in parallel
+        """
+        file_path = self.write_csv(
+            "name,date,task_name,duration,notes\n"
+            "Alice,2018-01-02,Task A,10,\n"
+            "Alice,2018-01-03,Task A,10,\"never closed\n" +
+            "x" * 200000 + "\n"
+        )
+
+        for import_file in (self.csv_manager.import_file,
+                            self.csv_manager.import_file_parallel):
+            with patch('sys.stdout', new=io.StringIO()):
+                with self.assertRaisesRegex(ValueError, '^line 4: '):
+                    import_file(file_path)
+
+    # import_file_parallel
+    def test_import_file_parallel_matches_import_file(self):
+        """Ensure that a parallel import of a file split into many chunks
+        (including a row with a line break inside a quoted field) imports
+        the same entries and reports the same errors as import_file
+        """
+        file_path = self.write_csv(
+            "name,date,task_name,duration,notes\n"
+            "Alice,2018-01-02,Task A,10,first\n"
+            "Bob,2018-01-03,Task B,20,\"second, with\n\"\"two\"\" lines\"\n"
+            "Bob,2018-01-33,Task B,20,bad date\n"
+            "Carol,2018-01-04,Task C,30,third\n"
+            "Carol,2018-01-04,Task C,-1,negative duration\n"
+            "Alice,2018-01-05,Task D,40,fourth\n"
+        )
+        expected_result = self.csv_manager.import_file(file_path)
+        expected_entries = db_manager.DBManager().view_everything()
+        self.revert_database()
+        self.set_test_database()
+
+        result = self.csv_manager.import_file_parallel(file_path, workers=2,
+                                                       chunk_size=40)
+
+        self.assertEqual(result, expected_result)
+        self.assertEqual(result['written'], 4)
+        self.assertEqual(
+            sorted(db_manager.DBManager().view_everything(),
+                   key=lambda entry: entry['notes']),
+            sorted(expected_entries, key=lambda entry: entry['notes'])
+        )
+
+    # chunk_boundaries
+    def test_chunk_boundaries_split_between_rows(self):
+        """Ensure that chunks cover the whole file and only end at line
+        breaks outside quoted fields
+        """
+        file_path = self.write_csv('a,b\n'
+                                   '1,"x\ny"\n'
+                                   '2,"p""\nq"\n'
+                                   '3,z\n')
+
+        with csv_manager.open_mapped(file_path) as mapped_file:
+            chunks = list(csv_manager.chunk_boundaries(mapped_file, 4, 3))
+
+        self.assertEqual(chunks, [(4, 12), (12, 22), (22, 26)])
+
+    # mapped_lines
+    def test_mapped_lines_yields_lines_between_offsets(self):
+        """Ensure that the lines between the offsets are yielded whole,
+        including a last line with no line break, when pages are released
+        along the way
+        """
+        file_path = self.write_csv('skipped\nfirst\r\nsecond\nthird')
+
+        with patch('csv_manager.RELEASE_SIZE', 1):
+            with csv_manager.open_mapped(file_path) as mapped_file:
+                lines = list(csv_manager.mapped_lines(mapped_file, 8,
+                                                      len(mapped_file)))
+
+        self.assertEqual(lines, ['first\r\n', 'second\n', 'third'])
+
+    def test_open_mapped_empty_file_returns_none(self):
+        """Ensure that an empty file (which can't be mapped) gives None,
+        and importing one reads no rows
+        """
+        file_path = self.write_csv('')
+
+        self.assertIsNone(csv_manager.open_mapped(file_path))
+        self.assertEqual(self.csv_manager.import_file(file_path)['rows'], 0)
+        self.assertEqual(
+            self.csv_manager.import_file_parallel(file_path)['rows'], 0
+        )
+
+    # validate_rows
+    def test_validate_rows_returns_error_code_for_each_row(self):
+        """Ensure that every problem with a row is flagged in its error
+        code and only valid rows become entries
+        """
+        validator = csv_manager.CsvManager(
+            allow_future_dates=False,
+            earliest_date=datetime.date(1900, 1, 1)
+        )
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        rows = [
+            ['Alice', '2018-01-02', 'Task', '10', ''],
+            ['Alice', 'yesterday', 'Task', '-10', ''],
+            ['Alice', tomorrow.isoformat(), 'Task', 'ten', ''],
+            ['Alice', '1899-12-31', 'x' * 256, '10', ''],
+            ['Alice', '2018-01-02'],
+        ]
+
+        codes, entries = validator.validate_rows(rows, [0, 1, 2, 3, 4])
+
+        self.assertEqual(codes, [
+            0,
+            csv_manager.INVALID_DATE | csv_manager.NEGATIVE_DURATION,
+            csv_manager.FUTURE_DATE | csv_manager.INVALID_DURATION,
+            csv_manager.EARLY_DATE | csv_manager.FIELD_TOO_LONG,
+            csv_manager.MISSING_VALUES,
+        ])
+        self.assertEqual(entries[0]['date'], datetime.date(2018, 1, 2))
+        self.assertEqual(entries[0]['duration'], 10)
+        self.assertEqual(entries[1:], [None] * 4)
+
+    def test_validate_rows_accepts_long_notes(self):
+        """Ensure that notes of any length are valid (long ones are
+        compressed when they're written)
+        """
+        rows = [['Alice', '2018-01-02', 'Task', '10', 'x' * 5000]]
+
+        codes, entries = self.csv_manager.validate_rows(rows, [0, 1, 2, 3, 4])
+
+        self.assertEqual(codes, [0])
+        self.assertEqual(entries[0]['notes'], 'x' * 5000)
+
+    # describe_errors
+    def test_describe_errors_lists_every_problem(self):
+        """Ensure that each invalid row is described with all of its
+        problems
+        """
+        rows = [['Alice', '2018-01-02', 'Task', '10', ''],
+                ['Alice', 'yesterday', 'Task', '-10', '']]
+        codes = [0, csv_manager.INVALID_DATE | csv_manager.NEGATIVE_DURATION]
+
+        errors = self.csv_manager.describe_errors([2, 3], rows,
+                                                  [0, 1, 2, 3, 4], codes)
+
+        self.assertEqual(errors, [
+            (3, "yesterday is not a valid date; durations can't be negative")
+        ])
+
+    # parse_date
+    def test_parse_date_uses_first_valid_format(self):
+        """Ensure that dates are read in the first format they're valid in
+        """
+        us_first = csv_manager.CsvManager(date_formats=[
+            settings.DATE_FORMATS['us'],
+            settings.DATE_FORMATS['uk'],
+        ])
+
+        self.assertEqual(self.csv_manager.parse_date('01/02/2018'),
+                         (None, datetime.date(2018, 2, 1)))
+        self.assertEqual(us_first.parse_date('01/02/2018'),
+                         (None, datetime.date(2018, 1, 2)))
+        self.assertEqual(us_first.parse_date('13/02/2018'),
+                         (None, datetime.date(2018, 2, 13)))
+        self.assertIsNone(us_first.parse_date('2018-02-01')[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+"""Test DB Maintenance
+Unit Tests for db_maintenance.py
+
+Created: 2026
+Last Update: 2026-10-19
+Author: Alex Koumparos
+"""
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from peewee import *
+
+import db_maintenance
+import db_manager
+import wl_settings as settings
+
+
+class DBMaintenanceTests(unittest.TestCase):
+
+    # Helper Methods
+    # --------------
+    def set_test_database(self):
+        """Switch out the regular database and switch in a throwaway one
+        (the maintenance rewrites the database file)
+        """
+        self.directory = tempfile.mkdtemp()
+        db_manager.db = SqliteDatabase(os.path.join(self.directory,
+                                                    'maintenance.db'))
+        for model in db_manager.tables:
+            model._meta.database = db_manager.db
+
+    def revert_database(self):
+        """Switch back to regular database"""
+        db_manager.db.close()
+        shutil.rmtree(self.directory)
+        db_manager.db = SqliteDatabase(settings.LIVE_DATABASE_NAME)
+        for model in db_manager.tables:
+            model._meta.database = db_manager.db
+
+    def create_entries(self, count):
+        """Writes `count` log entries to the database"""
+        db_manager.DBManager().upsert_entries(
+            {
+                'name': 'Test Employee {}'.format(i % 10),
+                'date': datetime.date(2018, 1, 1),
+                'task_name': 'Test task {}'.format(i),
+                'duration': i,
+                'notes': 'x' * 200,
+            }
+            for i in range(count)
+        )
+
+    def step_outcome(self, report, step):
+        """Returns the outcome of the maintenance step named `step`"""
+        for step_report in report['steps']:
+            if step_report['step'] == step:
+                return step_report['outcome']
+
+    # Setup and Teardown
+    # ------------------
+    def setUp(self):
+        self.set_test_database()
+        self.maintenance = db_maintenance.DBMaintenance()
+
+    def tearDown(self):
+        self.revert_database()
+
+    # Actual tests
+    # ------------
+    # analyze
+    def test_analyze_runs_when_statistics_are_missing_or_stale(self):
+        """Ensure that ANALYZE runs the first time, is skipped while the
+        number of entries hasn't changed much, and runs again once it has
+        """
+        self.create_entries(100)
+
+        self.assertTrue(self.maintenance.analyze().startswith("analyzed"))
+        self.assertEqual(self.maintenance.analyzed_entries(), 100)
+        self.create_entries(105)
+        self.assertTrue(self.maintenance.analyze().startswith("skipped"))
+        self.create_entries(200)
+        self.assertTrue(self.maintenance.analyze().startswith("analyzed"))
+        self.assertEqual(self.maintenance.analyzed_entries(), 200)
+
+    # vacuum
+    def test_vacuum_frees_pages_once_threshold_is_passed(self):
+        """Ensure that free pages are returned once enough of the database
+        is free, switching to incremental auto-vacuum the first time
+        """
+        self.create_entries(2000)
+        self.assertTrue(self.maintenance.vacuum().startswith("skipped"))
+        db_manager.LogEntry.delete().execute()
+        free_pages = self.maintenance.pragma('freelist_count')
+        self.assertGreater(free_pages, 0)
+
+        outcome = self.maintenance.vacuum()
+
+        self.assertIn("switched to incremental", outcome)
+        self.assertEqual(self.maintenance.pragma('freelist_count'), 0)
+        self.assertEqual(self.maintenance.pragma('auto_vacuum'), 2)
+
+        self.create_entries(2000)
+        db_manager.LogEntry.delete().execute()
+        with patch('wl_settings.VACUUM_MAX_PAGES', 5):
+            outcome = self.maintenance.vacuum()
+        self.assertEqual(outcome, "freed 5 pages")
+
+    # checkpoint
+    def test_checkpoint_truncates_large_write_ahead_log(self):
+        """Ensure that the write-ahead log is checkpointed and truncated
+        once it's over the size threshold, and left alone otherwise
+        """
+        self.assertEqual(self.maintenance.checkpoint(),
+                         "skipped, not in WAL mode")
+        db_manager.db.execute_sql('PRAGMA journal_mode = WAL')
+        self.create_entries(100)
+        self.assertGreater(self.maintenance.wal_size(), 0)
+        self.assertTrue(self.maintenance.checkpoint().startswith("skipped"))
+
+        with patch('wl_settings.WAL_CHECKPOINT_SIZE', 0):
+            outcome = self.maintenance.checkpoint()
+
+        self.assertTrue(outcome.startswith("checkpointed"))
+        self.assertEqual(self.maintenance.wal_size(), 0)
+
+    # run
+    def test_run_reports_sizes_and_every_step(self):
+        """Ensure that the report has the sizes before and after and the
+        outcome and timing of every step, and that forcing runs the steps
+        that aren't due
+        """
+        self.create_entries(2000)
+        db_manager.LogEntry.delete().execute()
+
+        report = self.maintenance.run(force=True)
+
+        self.assertEqual([step['step'] for step in report['steps']],
+                         ['analyze', 'vacuum', 'optimize', 'checkpoint'])
+        self.assertLess(report['size after'], report['size before'])
+        self.assertTrue(self.step_outcome(report, 'analyze')
+                        .startswith("analyzed"))
+        lines = db_maintenance.report_lines(report)
+        self.assertEqual(len(lines), 6)
+        self.assertTrue(lines[0].startswith("Database size before"))
+
+
+if __name__ == "__main__":
+    unittest.main()
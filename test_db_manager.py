@@ -2,11 +2,19 @@
 Unit Tests for db_manager.py
 
 Created: 2018
-Last Update: 2018-06-05
+Last Update: 2026-10-19
 Author: Alex Koumparos
 """
 import unittest
+from unittest.mock import patch
+import csv
 import datetime
+import io
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
 from collections import OrderedDict
 
 from peewee import *
@@ -24,26 +32,44 @@ class DBManagerTests(unittest.TestCase):
         database
         """
         db_manager.db = SqliteDatabase(settings.UNITTEST_DATABASE_NAME)
-        db_manager.Employee._meta.database = db_manager.db
-        db_manager.LogEntry._meta.database = db_manager.db
+        for model in db_manager.tables:
+            model._meta.database = db_manager.db
 
     def revert_database(self):
         """Switch back to regular database"""
         # make sure that in unittest database
         db_manager.db = SqliteDatabase(settings.UNITTEST_DATABASE_NAME)
-        db_manager.Employee._meta.database = db_manager.db
-        db_manager.LogEntry._meta.database = db_manager.db
+        for model in db_manager.tables:
+            model._meta.database = db_manager.db
 
-        # delete all test data
+        # delete all test data (log entries first, deleting them writes to
+        # some of the other tables)
         q = db_manager.LogEntry.delete()
         q.execute()
-        q = db_manager.Employee.delete()
-        q.execute()
+        for model in db_manager.tables:
+            q = model.delete()
+            q.execute()
 
         # switch back to live database
         db_manager.db = SqliteDatabase(settings.LIVE_DATABASE_NAME)
-        db_manager.Employee._meta.database = db_manager.db
-        db_manager.LogEntry._meta.database = db_manager.db
+        for model in db_manager.tables:
+            model._meta.database = db_manager.db
+
+    def set_memory_database(self, path):
+        """Switch in an in-memory database backed by the file at `path`"""
+        db_manager.db = db_manager.MemoryDatabase(path)
+        for model in db_manager.tables:
+            model._meta.database = db_manager.db
+        self.addCleanup(db_manager.db.close)
+        return db_manager.DBManager()
+
+    def count_file_entries(self, path):
+        """Returns the number of log entries in the database file at `path`
+        """
+        connection = sqlite3.connect(path)
+        count = connection.execute("SELECT count(*) FROM logentry").fetchone()
+        connection.close()
+        return count[0]
 
     def db_record_to_dict(self, record):
         """Converts a DB record to a dict and returns it"""
@@ -255,7 +281,7 @@ class DBManagerTests(unittest.TestCase):
             'date': datetime.date(2010, 5, 25),
             'task_name': 'test_duration_entry',
             'duration': 20,
-            'notes': 'This is for testing retrieval by duration'
+            'notes': 'This is also for testing retrieval by duration'
         }
         # write the test data to the database
         employee_record = db_manager.Employee.get_or_create(
@@ -334,7 +360,7 @@ class DBManagerTests(unittest.TestCase):
             'date': datetime.date(2010, 5, 25),
             'task_name': 'test_duration_entry',
             'duration': 20,
-            'notes': 'This is for testing retrieval by duration'
+            'notes': 'This is also for testing retrieval by duration'
         }
         # write the test data to the database
         employee_record_1 = db_manager.Employee.get_or_create(
@@ -388,6 +414,26 @@ class DBManagerTests(unittest.TestCase):
             ]
         }
 
+    def create_report_data(self):
+        """Creates log entries for two employees over ten days in June 2018,
+        with two entries on the first day
+        """
+        for name, day, task, duration in [
+            ('report user 1', 1, 'task x', 10),
+            ('report user 1', 1, 'task y', 5),
+            ('report user 1', 3, 'task x', 20),
+            ('report user 1', 10, 'task y', 30),
+            ('report user 2', 2, 'task x', 7),
+            ('report user 2', 4, 'task z', 7),
+        ]:
+            self.dbm.add_entry({
+                'name': name,
+                'date': datetime.date(2018, 6, day),
+                'task_name': task,
+                'duration': duration,
+                'notes': '',
+            })
+
     # Setup and Teardown
     # ------------------
     def setUp(self):
@@ -423,6 +469,321 @@ class DBManagerTests(unittest.TestCase):
         )
         self.assertEqual(test_log_entry_data, retrieved_log_entry_dict)
 
+    def test_add_entry_ignores_duplicate_entry(self):
+        """Adding the same entry twice should only write one record"""
+        test_log_entry_data = {
+            'name': 'test user (add twice)',
+            'date': datetime.date(2018, 1, 1),
+            'task_name': 'test_entry_add_entry',
+            'duration': 17,
+            'notes': 'This is a test of adding an entry twice',
+        }
+
+        self.assertTrue(self.dbm.add_entry(test_log_entry_data))
+        self.assertFalse(self.dbm.add_entry(test_log_entry_data))
+
+        self.assertEqual(len(db_manager.LogEntry.select()), 1)
+
+    # upsert_entries
+    def test_upsert_entries_skips_existing_entries(self):
+        """Re-running an import should only write the entries that are new,
+        and report how many were written.
+        """
+        data = self.create_mixed_test_data()
+        new_entry = {
+            'name': 'test user (upsert)',
+            'date': '2018-06-01',
+            'task_name': 'test_entry_upsert',
+            'duration': 5,
+            'notes': 'This is a test of upserting entries',
+        }
+        entries = [data['test_log_entry_1'],
+                   data['test_log_entry_2'],
+                   new_entry]
+
+        self.assertEqual(self.dbm.upsert_entries(entries), 1)
+        self.assertEqual(self.dbm.upsert_entries(entries), 0)
+
+        self.assertEqual(len(db_manager.LogEntry.select()), 3)
+        self.assertEqual(self.dbm.view_entry(new_entry)['task_name'],
+                         new_entry['task_name'])
+
+    def test_upsert_entries_looks_up_names_once_across_calls(self):
+        """Names written by one call should be remembered, so later calls
+        don't look them up again
+        """
+        entry = {
+            'name': 'test user (upsert)',
+            'date': datetime.date(2018, 6, 1),
+            'task_name': 'test_entry_upsert',
+            'duration': 5,
+            'notes': 'This is a test of upserting entries',
+        }
+        self.dbm.upsert_entries([entry])
+        later_entry = dict(entry, duration=6)
+
+        with patch.object(db_manager.Employee, 'select') as employees, \
+                patch.object(db_manager.Task, 'select') as tasks:
+            self.assertEqual(self.dbm.upsert_entries([later_entry]), 1)
+
+        employees.assert_not_called()
+        tasks.assert_not_called()
+        self.assertEqual(self.dbm.view_entry(later_entry), later_entry)
+
+    def test_upsert_entries_forgets_names_rolled_back(self):
+        """Employees and tasks added in a transaction that is rolled back
+        shouldn't be remembered, they no longer exist
+        """
+        entry = {
+            'name': 'test user (upsert)',
+            'date': datetime.date(2018, 6, 1),
+            'task_name': 'test_entry_upsert',
+            'duration': 5,
+            'notes': 'This is a test of upserting entries',
+        }
+        with self.assertRaises(ValueError):
+            with db_manager.db.atomic():
+                self.dbm.upsert_entries([entry])
+                raise ValueError("roll back")
+
+        self.assertEqual(self.dbm.upsert_entries([entry]), 1)
+        self.assertEqual(self.dbm.view_entry(entry), entry)
+
+    def test_upsert_entries_after_merge_adds_merged_employee_again(self):
+        """An employee merged away (and so deleted) should be added again by
+        later entries in their name
+        """
+        data = self.create_mixed_test_data()
+        self.dbm.upsert_entries([data['test_log_entry_1']])
+        self.dbm.merge_employees(['test user 1 (l.e.)'], 'test user 2 (l.e.)')
+
+        self.assertEqual(self.dbm.upsert_entries([data['test_log_entry_1']]),
+                         1)
+        self.assertEqual(self.dbm.view_entry(data['test_log_entry_1']),
+                         data['test_log_entry_1'])
+
+    def test_upsert_entries_stores_each_task_name_once(self):
+        """Entries with the same task name should share one task record"""
+        data = self.create_mixed_test_data()
+        new_entry = {
+            'name': 'test user (upsert)',
+            'date': '2018-06-01',
+            'task_name': data['test_log_entry_1']['task_name'],
+            'duration': 5,
+            'notes': 'This is a test of sharing task names',
+        }
+
+        self.dbm.upsert_entries([new_entry])
+
+        self.assertEqual(db_manager.Task.select().count(), 1)
+        self.assertEqual(
+            db_manager.LogEntry.select().where(
+                db_manager.LogEntry.task_name == new_entry['task_name']
+            ).count(),
+            3
+        )
+
+    # upgrade_schema
+    def test_upgrade_schema_hashes_and_deduplicates_old_entries(self):
+        """A logentry table from before content hashes existed should get
+        a hash for every row, with exact duplicates removed.
+        """
+        data = self.create_mixed_test_data()
+        db = db_manager.db
+        db.execute_sql('DROP INDEX "logentry_content_hash"')
+        db.execute_sql('DROP TRIGGER "changelog_edit"')
+        db.execute_sql('ALTER TABLE "logentry" DROP COLUMN "content_hash"')
+        db.execute_sql(
+            'INSERT INTO "logentry" '
+            '("employee_id", "date", "task_id", "duration", "notes") '
+            'SELECT "employee_id", "date", "task_id", "duration", "notes" '
+            'FROM "logentry"'
+        )
+        db.execute_sql('PRAGMA user_version = 0')
+
+        self.dbm.upgrade_schema()
+
+        self.assertEqual(len(db_manager.LogEntry.select()), 2)
+        for entry in (data['test_log_entry_1'], data['test_log_entry_2']):
+            self.assertEqual(self.dbm.view_entry(entry), entry)
+        unhashed = db_manager.LogEntry.select().where(
+            db_manager.LogEntry.content_hash.is_null()
+        )
+        self.assertEqual(len(unhashed), 0)
+
+    def test_upgrade_schema_adds_day_numbers_to_old_entries(self):
+        """A logentry table from before day numbers existed should get the
+        right day number for every row, with any dates saved with a time
+        part normalised to plain dates.
+        """
+        data = self.create_test_dates()['test_log_entry_data']
+        db = db_manager.db
+        db.execute_sql('DROP INDEX "logentry_day_number"')
+        db.execute_sql('DROP INDEX "logentry_employee_id_day_number"')
+        db.execute_sql('ALTER TABLE "logentry" DROP COLUMN "day_number"')
+        db.execute_sql(
+            'UPDATE "logentry" SET "date" = "date" || \' 00:00:00\''
+        )
+        db.execute_sql('PRAGMA user_version = 1')
+
+        self.dbm.upgrade_schema()
+
+        for datum in data:
+            records = db_manager.LogEntry.select().where(
+                db_manager.LogEntry.day_number == datum['date'].toordinal()
+            )
+            self.assertIn(datum['date'], [record.date for record in records])
+        dates = db.execute_sql('SELECT DISTINCT "date" FROM "logentry"')
+        for row in dates:
+            self.assertEqual(len(row[0]), len('yyyy-mm-dd'))
+
+    def test_upgrade_schema_removes_duplicates_across_chunks(self):
+        """Duplicates of an entry hashed in an earlier chunk (or an earlier,
+        interrupted run) should be removed too.
+        """
+        data = self.create_mixed_test_data()
+        db = db_manager.db
+        db.execute_sql('DROP INDEX "logentry_content_hash"')
+        db.execute_sql(
+            'INSERT INTO "logentry" '
+            '("employee_id", "date", "day_number", "task_id", "duration", '
+            '"notes") '
+            'SELECT "employee_id", "date", "day_number", "task_id", '
+            '"duration", "notes" FROM "logentry"'
+        )
+        db.execute_sql('PRAGMA user_version = 0')
+
+        with patch('wl_settings.MIGRATION_CHUNK_SIZE', 1):
+            self.dbm.upgrade_schema()
+
+        self.assertEqual(len(db_manager.LogEntry.select()), 2)
+        for entry in (data['test_log_entry_1'], data['test_log_entry_2']):
+            self.assertEqual(self.dbm.view_entry(entry), entry)
+
+    def test_upgrade_schema_moves_task_names_to_task_table(self):
+        """A logentry table from before the task table existed should have
+        its task names moved into the task table, one row per name, with
+        each entry pointing at its task and the old column dropped.
+        """
+        data = self.create_mixed_test_data()
+        db = db_manager.db
+        db.execute_sql(
+            'CREATE TABLE "old_logentry" ('
+            '"id" INTEGER NOT NULL PRIMARY KEY, '
+            '"employee_id" INTEGER NOT NULL, "date" DATE NOT NULL, '
+            '"task_name" VARCHAR(255) NOT NULL, "duration" INTEGER NOT NULL, '
+            '"notes" VARCHAR(255) NOT NULL, "content_hash" VARCHAR(40), '
+            '"day_number" INTEGER)'
+        )
+        db.execute_sql(
+            'INSERT INTO "old_logentry" SELECT "id", "employee_id", "date", '
+            '(SELECT "name" FROM "task" '
+            'WHERE "task"."id" = "logentry"."task_id"), '
+            '"duration", "notes", "content_hash", "day_number" '
+            'FROM "logentry"'
+        )
+        db.execute_sql('DROP TABLE "logentry"')
+        db.execute_sql('ALTER TABLE "old_logentry" RENAME TO "logentry"')
+        db.execute_sql('DELETE FROM "task"')
+        db.execute_sql('PRAGMA user_version = 4')
+
+        with patch('wl_settings.MIGRATION_CHUNK_SIZE', 1):
+            with patch('sys.stdout', new=io.StringIO()):
+                db_manager.DBManager()
+
+        columns = [column.name for column in db.get_columns('logentry')]
+        self.assertNotIn('task_name', columns)
+        self.assertEqual([task.name for task in db_manager.Task.select()],
+                         ['test_entry'])
+        for entry in (data['test_log_entry_1'], data['test_log_entry_2']):
+            self.assertEqual(self.dbm.view_entry(entry), entry)
+        self.assertEqual(len(self.dbm.view_entries_with_text('test_ent')), 2)
+
+    def test_upgrade_schema_logs_existing_entries_as_added(self):
+        """The entries in a database from before the change log existed
+        should be logged as added, so that reading the changes from the
+        start gets all of them.
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        db = SqliteDatabase(os.path.join(directory, 'old.db'))
+        db.execute_sql(
+            'CREATE TABLE "employee" ('
+            '"id" INTEGER NOT NULL PRIMARY KEY, '
+            '"name" VARCHAR(255) NOT NULL)'
+        )
+        db.execute_sql(
+            'CREATE TABLE "logentry" ('
+            '"id" INTEGER NOT NULL PRIMARY KEY, '
+            '"employee_id" INTEGER NOT NULL, "date" DATE NOT NULL, '
+            '"task_name" VARCHAR(255) NOT NULL, "duration" INTEGER NOT NULL, '
+            '"notes" VARCHAR(255) NOT NULL, '
+            'FOREIGN KEY ("employee_id") REFERENCES "employee" ("id"))'
+        )
+        db.execute_sql('INSERT INTO "employee" ("name") VALUES (?)',
+                       ('old user',))
+        for day in range(1, 4):
+            db.execute_sql(
+                'INSERT INTO "logentry" ("employee_id", "date", "task_name", '
+                '"duration", "notes") VALUES (1, ?, ?, 10, ?)',
+                ('2018-05-0{}'.format(day), 'old task', 'old notes')
+            )
+        db_manager.db = db
+        for model in db_manager.tables:
+            model._meta.database = db_manager.db
+        self.addCleanup(db_manager.db.close)
+
+        with patch('wl_settings.MIGRATION_CHUNK_SIZE', 2):
+            with patch('sys.stdout', new=io.StringIO()):
+                dbm = db_manager.DBManager()
+
+        changes = dbm.changes_since(0)
+        self.assertEqual([(change['action'], change['id'])
+                          for change in changes],
+                         [('add', 1), ('add', 2), ('add', 3)])
+        self.assertEqual([change['entry']['date'] for change in changes],
+                         [datetime.date(2018, 5, day) for day in range(1, 4)])
+        self.assertNotIn('changelog_entry_id', [
+            index.name for index in db.get_indexes('changelog')
+        ])
+
+    def test_upgrade_schema_reports_each_step(self):
+        """Each step of each migration run should be reported with the time
+        it took, and the database should end up at the latest version.
+        """
+        db_manager.db.execute_sql('PRAGMA user_version = 0')
+
+        report = self.dbm.upgrade_schema()
+
+        steps = [step for migration in db_manager.MIGRATIONS
+                 for step in migration.steps]
+        self.assertEqual([step['step'] for step in report],
+                         [name for name, function in steps])
+        for step in report:
+            self.assertGreaterEqual(step['seconds'], 0)
+        version = db_manager.db.execute_sql('PRAGMA user_version').fetchone()
+        self.assertEqual(version[0], db_manager.MIGRATIONS[-1].version)
+
+    def test_upgrade_schema_does_nothing_when_up_to_date(self):
+        """A database at the latest version shouldn't be migrated again"""
+        self.assertEqual(self.dbm.upgrade_schema(), [])
+
+    def test_new_database_is_marked_up_to_date(self):
+        """A newly created database already has the current schema, so it
+        should start at the latest version.
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        db_manager.db = SqliteDatabase(os.path.join(directory, 'new.db'))
+        for model in db_manager.tables:
+            model._meta.database = db_manager.db
+        self.addCleanup(db_manager.db.close)
+
+        db_manager.DBManager()
+
+        version = db_manager.db.execute_sql('PRAGMA user_version').fetchone()
+        self.assertEqual(version[0], db_manager.MIGRATIONS[-1].version)
+
     # edit_entry
     def test_edit_entry_correctly_changes_record(self):
         """Test that database records are correctly edited"""
@@ -470,10 +831,216 @@ class DBManagerTests(unittest.TestCase):
         # check changed record == changed entry
         self.assertEqual(edited_log_entry_data, retrieved_log_entry_dict)
 
+    def test_edit_entry_to_new_task_name_adds_task(self):
+        """Ensure that editing an entry's task name to a new one adds the
+        task and leaves the old task to the entries still using it
+        """
+        data = self.create_mixed_test_data()
+        edited = OrderedDict(data['test_log_entry_1'])
+        edited['task_name'] = 'test_entry (edited)'
+
+        self.assertEqual(self.dbm.edit_entry(data['test_log_entry_1'],
+                                             edited), edited)
+
+        self.assertEqual(
+            [task.name for task in
+             db_manager.Task.select().order_by(db_manager.Task.name)],
+            ['test_entry', 'test_entry (edited)']
+        )
+        self.assertEqual(self.dbm.view_entry(data['test_log_entry_2']),
+                         data['test_log_entry_2'])
+
     def test_edit_entry_invalid_employee_raises_doesnotexist(self):
         """Ensure that passing a missing employee raises doesnot exist"""
         pass
 
+    # compressed notes
+    def test_long_notes_are_compressed_and_listed_by_preview(self):
+        """Ensure that notes over the size threshold are kept compressed,
+        that listed entries only have the start of them and that the
+        whole notes can be read back
+        """
+        entry = {
+            'name': 'test user (notes)',
+            'date': datetime.date(2018, 5, 1),
+            'task_name': 'test_entry_long_notes',
+            'duration': 10,
+            'notes': "Lots to say. " * 200,
+        }
+
+        self.dbm.add_entry(entry)
+
+        record = db_manager.LogEntry.get()
+        self.assertTrue(record.notes_compressed)
+        self.assertEqual(record.notes,
+                         entry['notes'][:settings.NOTES_PREVIEW_LENGTH])
+        self.assertLess(len(db_manager.NoteText.get().text),
+                        len(entry['notes']))
+        listed = self.dbm.view_everything()[0]
+        self.assertIsInstance(listed['notes'], db_manager.LongNotes)
+        self.assertEqual(self.dbm.load_notes(listed['notes']),
+                         entry['notes'])
+        self.assertEqual(self.dbm.view_entry(listed), entry)
+
+    def test_listed_long_notes_entry_can_be_added_again_and_edited(self):
+        """Ensure that a listed entry with long notes (a LongNotes) can be
+        written back: adding it again finds the same entry, and editing
+        another field keeps the whole notes
+        """
+        entry = {
+            'name': 'test user (notes)',
+            'date': datetime.date(2018, 5, 1),
+            'task_name': 'test_entry_long_notes',
+            'duration': 10,
+            'notes': "Lots to say. " * 200,
+        }
+        self.dbm.add_entry(entry)
+        listed = self.dbm.view_everything()[0]
+
+        self.assertFalse(self.dbm.add_entry(listed))
+        self.assertEqual(self.dbm.upsert_entries([listed]), 0)
+        edited = self.dbm.edit_entry(listed, dict(listed, duration=5))
+
+        self.assertEqual(edited, dict(entry, duration=5))
+        self.assertEqual(db_manager.LogEntry.select().count(), 1)
+        self.assertEqual(db_manager.NoteText.select().count(), 1)
+
+    def test_short_notes_are_not_compressed(self):
+        """Ensure that notes under the size threshold are kept as they are
+        """
+        data = self.create_mixed_test_data()
+
+        self.assertEqual(db_manager.NoteText.select().count(), 0)
+        self.assertEqual(self.dbm.view_everything(date_sorted=True)[0],
+                         data['test_log_entry_1'])
+
+    def test_edit_entry_to_long_notes_is_logged_and_searchable(self):
+        """Ensure that a change to the end of long notes is written, logged
+        as an edit and found by a text search
+        """
+        data = self.create_mixed_test_data()
+        long_entry = OrderedDict(data['test_log_entry_1'])
+        long_entry['notes'] = "Lots to say. " * 200 + "first ending"
+        self.dbm.edit_entry(data['test_log_entry_1'], long_entry)
+        seq = self.dbm.changes_since(0, limit=1000000)[-1]['seq']
+        edited = OrderedDict(long_entry)
+        edited['notes'] = "Lots to say. " * 200 + "second ending"
+
+        self.dbm.edit_entry(long_entry, edited)
+
+        changes = self.dbm.changes_since(seq)
+        self.assertEqual([change['action'] for change in changes], ['edit'])
+        self.assertEqual(changes[0]['entry']['notes'], edited['notes'])
+        self.assertEqual(db_manager.NoteText.select().count(), 1)
+        found = self.dbm.search({'text': 'SECOND ending'})
+        self.assertEqual([self.dbm.view_entry(entry) for entry in found],
+                         [edited])
+        self.assertEqual(self.dbm.search({'text': 'first ending'}), [])
+
+    def test_delete_entry_removes_compressed_notes(self):
+        """Ensure that deleting an entry deletes its compressed notes"""
+        entry = {
+            'name': 'test user (notes)',
+            'date': datetime.date(2018, 5, 1),
+            'task_name': 'test_entry_long_notes',
+            'duration': 10,
+            'notes': "Lots to say. " * 200,
+        }
+        self.dbm.add_entry(entry)
+
+        self.dbm.delete_entry(entry)
+
+        self.assertEqual(db_manager.NoteText.select().count(), 0)
+
+    def test_upgrade_schema_compresses_existing_long_notes(self):
+        """Notes that were written before compressed notes existed, and are
+        over the size threshold, should be compressed without being logged
+        as edits
+        """
+        data = self.create_mixed_test_data()
+        seq = self.dbm.changes_since(0, limit=1000000)[-1]['seq']
+        db_manager.db.execute_sql('PRAGMA user_version = 5')
+
+        with patch('wl_settings.NOTES_COMPRESS_SIZE', 10):
+            with patch('sys.stdout', new=io.StringIO()):
+                db_manager.DBManager()
+
+        self.assertEqual(db_manager.NoteText.select().count(), 2)
+        for entry in (data['test_log_entry_1'], data['test_log_entry_2']):
+            self.assertEqual(self.dbm.view_entry(entry), entry)
+        self.assertEqual(self.dbm.changes_since(seq), [])
+
+    # merge_employees
+    def test_merge_employees_moves_entries_and_removes_sources(self):
+        """Ensure that every entry of the source employees ends up with the
+        target employee, rehashed, and that the sources are deleted
+        """
+        data = self.create_mixed_test_data()
+
+        result = self.dbm.merge_employees(
+            ['test user 1 (l.e.)', 'test user 3 (no l.e.)'],
+            'test user 2 (l.e.)'
+        )
+
+        self.assertEqual(list(result.values()), [1, 0, 2])
+        moved = dict(data['test_log_entry_1'], name='test user 2 (l.e.)')
+        self.assertEqual(self.dbm.view_entry(moved), moved)
+        names = [employee.name for employee in db_manager.Employee.select()]
+        self.assertCountEqual(names, ['test user 2 (l.e.)',
+                                      'test user 4 (no l.e.)'])
+        unhashed = db_manager.LogEntry.select().where(
+            db_manager.LogEntry.content_hash.is_null()
+        )
+        self.assertEqual(len(unhashed), 0)
+
+    def test_merge_employees_removes_entries_that_become_duplicates(self):
+        """Ensure that entries which only differed by the employee's name
+        are merged into one
+        """
+        entry = {
+            'name': 'Jon',
+            'date': datetime.date(2018, 5, 24),
+            'task_name': 'merge task',
+            'duration': 11,
+            'notes': '',
+        }
+        for name in ['Jon', 'john', 'John']:
+            self.dbm.add_entry(dict(entry, name=name))
+
+        result = self.dbm.merge_employees(['Jon', 'john'], 'John')
+
+        self.assertEqual(list(result.values()), [2, 2, 2])
+        self.assertEqual(len(db_manager.LogEntry.select()), 1)
+        self.assertEqual(self.dbm.view_employees(),
+                         [OrderedDict([('name', 'John')])])
+
+    def test_merge_employees_updates_derived_data(self):
+        """Ensure that the name indexes, duration histograms and change log
+        reflect the merge
+        """
+        data = self.create_mixed_test_data()
+        # built before the merge, which then has to bring it up to date
+        self.dbm.employee_name_trie()
+        seq = self.dbm.changes_since()[-1]['seq']
+
+        self.dbm.merge_employees(['test user 1 (l.e.)'], 'merged user')
+
+        self.assertEqual(self.dbm.employee_name_trie().matches('test'),
+                         ['test user 2 (l.e.)'])
+        self.assertEqual(self.dbm.view_names_like('mreged user'),
+                         [OrderedDict([('name', 'merged user'),
+                                       ('distance', 2)])])
+        self.assertEqual(
+            list(self.dbm.duration_quantiles(
+                (1,), employee='merged user'
+            ).values()),
+            [data['test_log_entry_1']['duration']]
+        )
+        self.assertEqual(
+            [change['action'] for change in self.dbm.changes_since(seq)],
+            ['edit']
+        )
+
     # view_employees
     def test_view_employees_returns_all_employees_who_have_entries(self):
         """Confirm that querying the database gets all the employees
@@ -541,6 +1108,42 @@ class DBManagerTests(unittest.TestCase):
 
         self.assertEqual(len(set(dates)), len(dates))
 
+    def test_view_dates_returns_sorted_dates_in_range(self):
+        """Ensure that only the dates from start_date to end_date (inclusive)
+        are returned, in order
+        """
+        test_data = self.create_test_dates()
+        start_date = datetime.date(2010, 1, 1)
+        end_date = datetime.date(2018, 11, 30)
+        dates = sorted(set(
+            entry['date'] for entry in test_data['test_log_entry_data']
+            if start_date <= entry['date'] <= end_date
+        ))
+
+        records = self.dbm.view_dates(start_date=start_date,
+                                      end_date=end_date)
+
+        self.assertEqual([record['date'] for record in records], dates)
+
+    # view_months
+    def test_view_months_returns_each_month_once_in_order(self):
+        """Ensure that every month with an entry is returned once, as the
+        date of its first day, oldest first
+        """
+        test_data = self.create_test_dates()
+        months = sorted(set(
+            entry['date'].replace(day=1)
+            for entry in test_data['test_log_entry_data']
+        ))
+
+        records = self.dbm.view_months()
+
+        self.assertEqual([record['month'] for record in records], months)
+
+    def test_view_months_of_empty_database_is_empty(self):
+        """Ensure that there are no months when there are no entries"""
+        self.assertEqual(self.dbm.view_months(), [])
+
     # view_entries_for_date
     def test_view_entries_for_date_returns_all_matches(self):
         """Ensure that all the entries with a date matching the query
@@ -569,6 +1172,43 @@ class DBManagerTests(unittest.TestCase):
 
         self.assertCountEqual(matches, records)
 
+    # view_entries_for_duration_range
+    def test_view_entries_for_duration_range_includes_histogram(self):
+        """Ensure that the entries in the range are returned shortest first,
+        with a histogram counting them
+        """
+        self.create_report_data()
+
+        records, histogram = self.dbm.view_entries_for_duration_range(
+            7, 20, buckets=2
+        )
+
+        self.assertEqual([record['duration'] for record in records],
+                         [7, 7, 10, 20])
+        self.assertEqual([tuple(bucket.values()) for bucket in histogram],
+                         [(7, 13, 3), (14, 20, 1)])
+
+    # duration_histogram
+    def test_duration_histogram_buckets_cover_range(self):
+        """Ensure that the buckets are of equal width and cover the range,
+        with the last one cut short at the end of the range
+        """
+        histogram = db_manager.duration_histogram([30, 35, 61, 90], 30, 90,
+                                                  buckets=4)
+
+        self.assertEqual([tuple(bucket.values()) for bucket in histogram],
+                         [(30, 45, 2), (46, 61, 1), (62, 77, 0),
+                          (78, 90, 1)])
+
+    def test_duration_histogram_of_narrow_range_has_minute_buckets(self):
+        """Ensure that a range narrower than the number of buckets gets one
+        bucket per minute
+        """
+        histogram = db_manager.duration_histogram([2, 2], 1, 3)
+
+        self.assertEqual([bucket['count'] for bucket in histogram],
+                         [0, 2, 0])
+
     # view_entries_for_date_range
     def test_view_entries_for_date_range_returns_all_matches(self):
         """Ensure that all the entries with a date in the specified
@@ -625,6 +1265,100 @@ class DBManagerTests(unittest.TestCase):
 
         self.assertCountEqual(matching_data, records)
 
+    def test_view_names_with_text_case_sensitive_matches_case(self):
+        """When case_sensitive=True, ensure that only names containing the
+        test string with the same case are returned
+        """
+        self.create_test_employees()
+
+        insensitive = self.dbm.view_names_with_text('SECOND')
+        sensitive = self.dbm.view_names_with_text('SECOND',
+                                                  case_sensitive=True)
+        sensitive_match = self.dbm.view_names_with_text('second',
+                                                        case_sensitive=True)
+
+        self.assertEqual(len(insensitive), 1)
+        self.assertEqual(sensitive, [])
+        self.assertEqual(len(sensitive_match), 1)
+
+    def test_view_names_with_text_prefix_and_exact_matches(self):
+        """Ensure that prefix matches only return names starting with the
+        test string and exact matches only return the whole name, in both
+        case modes.
+        """
+        self.create_test_employees()
+
+        prefix = self.dbm.view_names_with_text('Third', match='prefix')
+        not_prefix = self.dbm.view_names_with_text('test user',
+                                                   match='prefix')
+        exact = self.dbm.view_names_with_text('THIRD TEST USER',
+                                              match='exact')
+        sensitive_exact = self.dbm.view_names_with_text('THIRD TEST USER',
+                                                        case_sensitive=True,
+                                                        match='exact')
+
+        self.assertEqual(prefix, [OrderedDict([('name', 'third test user')])])
+        self.assertEqual(not_prefix, [])
+        self.assertEqual(exact, prefix)
+        self.assertEqual(sensitive_exact, [])
+
+    def test_view_names_with_text_treats_wildcards_literally(self):
+        """Ensure that LIKE/GLOB wildcard characters in the test string only
+        match themselves
+        """
+        self.create_test_employees()
+
+        for case_sensitive in [False, True]:
+            for pattern in ['%', '_', '*', '?', '[']:
+                records = self.dbm.view_names_with_text(
+                    pattern, case_sensitive=case_sensitive
+                )
+                self.assertEqual(records, [])
+
+    def test_view_names_with_text_follows_renamed_employees(self):
+        """Ensure that the trigram index behind substring searches is kept
+        up to date when a name changes
+        """
+        self.create_test_employees()
+        db_manager.Employee.update(name='renamed employee').where(
+            db_manager.Employee.name == 'third test user'
+        ).execute()
+
+        old_name = self.dbm.view_names_with_text('third')
+        new_name = self.dbm.view_names_with_text('renamed')
+
+        self.assertEqual(old_name, [])
+        self.assertEqual(new_name,
+                         [OrderedDict([('name', 'renamed employee')])])
+
+    def test_view_names_with_text_without_fts5(self):
+        """Ensure that substring searches give the same results using the
+        plain table trigram index as with the FTS5 one
+        """
+        data = self.create_test_employees()['test_employee_data']
+        with patch('db_manager.USE_FTS5_TRIGRAMS', False):
+            self.dbm.create_trigram_indexes()
+            try:
+                for pattern in ['second', 'EMPLOYEE', 'test user', 'xyz']:
+                    matching_data = [datum for datum in data
+                                     if pattern.lower() in datum['name']]
+                    records = self.dbm.view_names_with_text(pattern)
+                    self.assertCountEqual(matching_data, records)
+                sensitive = self.dbm.view_names_with_text(
+                    'EMPLOYEE', case_sensitive=True
+                )
+                self.assertEqual(sensitive, [])
+            finally:
+                for table, column in db_manager.TRIGRAM_INDEXES:
+                    index_name = db_manager.trigram_index_name(table, column)
+                    for trigger in ['insert', 'delete', 'update']:
+                        db_manager.db.execute_sql(
+                            'DROP TRIGGER "{}_{}"'.format(index_name, trigger)
+                        )
+                    db_manager.db.execute_sql(
+                        'DROP TABLE "{}"'.format(index_name)
+                    )
+
     # view_everything
     def test_view_everything_returns_all_records(self):
         """Ensure that all entries are returned."""
@@ -675,6 +1409,341 @@ class DBManagerTests(unittest.TestCase):
         for record in records:
             self.assertEqual(record['name'], employee['name'])
 
+    # search
+    def test_search_combines_all_filters(self):
+        """Ensure that only the entries matching every filter are returned
+        """
+        data = self.create_test_employees()
+
+        records = self.dbm.search({
+            'employee': 'second employee test user',
+            'start_date': datetime.date(2010, 1, 1),
+            'end_date': datetime.date(2010, 12, 31),
+            'min_duration': 20,
+            'max_duration': 20,
+            'text': 'also',
+        })
+
+        self.assertEqual(records, [data['test_log_entry_data'][3]])
+
+    def test_search_without_filters_returns_everything_by_date(self):
+        """Ensure that an empty set of filters returns every entry, sorted
+        by date
+        """
+        data = self.create_test_dates()['test_log_entry_data']
+
+        records = self.dbm.search({'employee': None})
+
+        self.assertEqual([record['date'] for record in records],
+                         sorted(datum['date'] for datum in data))
+
+    def test_search_employee_honours_case_sensitive(self):
+        """Ensure that the employee name only matches the name in a
+        different case when the search isn't case sensitive
+        """
+        self.create_test_employees()
+
+        insensitive = self.dbm.search({'employee': 'THIRD TEST USER'})
+        sensitive = self.dbm.search({'employee': 'THIRD TEST USER',
+                                     'case_sensitive': True})
+
+        self.assertEqual(len(insensitive), 1)
+        self.assertEqual(sensitive, [])
+
+    # top_entries
+    def test_top_entries_returns_n_longest_entries(self):
+        """Ensure that the n longest entries are returned, longest first"""
+        self.create_report_data()
+
+        records = self.dbm.top_entries(3)
+
+        self.assertEqual([record['duration'] for record in records],
+                         [30, 20, 10])
+
+    def test_top_entries_applies_filters_and_order(self):
+        """Ensure that only the matching entries are ranked, and that they
+        can be ranked by date
+        """
+        self.create_report_data()
+
+        records = self.dbm.top_entries(2, by='date',
+                                       filters={'employee': 'report user 2'})
+
+        self.assertEqual([record['date'].day for record in records], [4, 2])
+
+    def test_top_entries_reads_one_employees_entries_in_order(self):
+        """Ensure that an employee's top entries are read in order from the
+        (employee, order) index rather than sorted
+        """
+        self.create_report_data()
+
+        for by in db_manager.TOP_ENTRY_ORDERS:
+            with patch.object(self.dbm, 'entries_to_list',
+                              side_effect=lambda query: query):
+                query = self.dbm.top_entries(
+                    2, by=by, filters={'employee': 'report user 2'})
+            sql, params = query.sql()
+            plan = [row[-1] for row in db_manager.db.execute_sql(
+                "EXPLAIN QUERY PLAN " + sql, params)]
+
+            self.assertTrue(any('(employee_id=?)' in step for step in plan),
+                            plan)
+            self.assertFalse(any('TEMP B-TREE' in step for step in plan),
+                             plan)
+
+    def test_top_entries_rejects_unknown_order(self):
+        """Ensure that ranking by anything but an indexed order is refused
+        """
+        with patch('sys.stdout', new=io.StringIO()):
+            with self.assertRaises(ValueError):
+                self.dbm.top_entries(3, by='notes')
+
+    # running_totals
+    def test_running_totals_accumulate_per_employee(self):
+        """Ensure that each employee's minutes are summed per day and
+        accumulated separately, in date order
+        """
+        self.create_report_data()
+
+        rows = self.dbm.running_totals()
+
+        self.assertEqual(
+            [(row['name'], row['date'].day, row['minutes'],
+              row['running total']) for row in rows],
+            [('report user 1', 1, 15, 15),
+             ('report user 1', 3, 20, 35),
+             ('report user 1', 10, 30, 65),
+             ('report user 2', 2, 7, 7),
+             ('report user 2', 4, 7, 14)]
+        )
+
+    def test_running_totals_only_count_filtered_entries(self):
+        """Ensure that the totals start from the start of the date range"""
+        self.create_report_data()
+
+        rows = self.dbm.running_totals({
+            'employee': 'report user 1',
+            'start_date': datetime.date(2018, 6, 2),
+        })
+
+        self.assertEqual([row['running total'] for row in rows], [20, 50])
+
+    # moving_averages
+    def test_moving_averages_count_days_without_entries_as_zero(self):
+        """Ensure that the average is over the previous `days` calendar
+        days, not the previous `days` days with entries
+        """
+        self.create_report_data()
+
+        rows = self.dbm.moving_averages(days=3)
+
+        self.assertEqual(
+            [(row['name'], row['date'].day, row['moving average'])
+             for row in rows],
+            [('report user 1', 1, 5),
+             ('report user 1', 3, 35 / 3),
+             ('report user 1', 10, 10),
+             ('report user 2', 2, 7 / 3),
+             ('report user 2', 4, 14 / 3)]
+        )
+
+    def test_moving_averages_include_days_before_start_date(self):
+        """Ensure that the averages on the first days from start_date take
+        in the entries before it, and that only the days from start_date on
+        are returned
+        """
+        self.create_report_data()
+
+        rows = self.dbm.moving_averages(
+            filters={'start_date': datetime.date(2018, 6, 3)}, days=3)
+
+        self.assertEqual(
+            [(row['name'], row['date'].day, row['moving average'])
+             for row in rows],
+            [('report user 1', 3, 35 / 3),
+             ('report user 1', 10, 10),
+             ('report user 2', 4, 14 / 3)]
+        )
+
+    # task_rankings
+    def test_task_rankings_rank_each_employees_tasks(self):
+        """Ensure that each employee's tasks are ranked by total minutes,
+        with equal totals sharing a rank
+        """
+        self.create_report_data()
+
+        rows = self.dbm.task_rankings()
+
+        self.assertEqual(
+            [tuple(row.values()) for row in rows],
+            [('report user 1', 'task y', 35, 1),
+             ('report user 1', 'task x', 30, 2),
+             ('report user 2', 'task x', 7, 1),
+             ('report user 2', 'task z', 7, 1)]
+        )
+
+    def test_task_rankings_can_rank_every_task_together(self):
+        """Ensure that with per_employee False, each task's minutes are
+        totalled over every employee
+        """
+        self.create_report_data()
+
+        rows = self.dbm.task_rankings(per_employee=False)
+
+        self.assertEqual(
+            [tuple(row.values()) for row in rows],
+            [('task x', 37, 1), ('task y', 35, 2), ('task z', 7, 3)]
+        )
+
+    # duration_quantiles
+    def test_duration_quantiles_are_exact_for_short_durations(self):
+        """Ensure that durations below the first growing bucket (20 minutes)
+        give exact quantiles, for every employee or just one
+        """
+        self.create_report_data()
+
+        self.assertEqual(
+            list(self.dbm.duration_quantiles((0.5,)).values()), [7]
+        )
+        self.assertEqual(
+            list(self.dbm.duration_quantiles(
+                (0.5,), employee='report user 1'
+            ).values()),
+            [10]
+        )
+        self.assertEqual(
+            list(self.dbm.duration_quantiles(
+                (0.5,), employee='report user 2'
+            ).values()),
+            [7]
+        )
+
+    def test_duration_quantiles_of_long_durations_are_close(self):
+        """Ensure that estimates of long durations are within 5%"""
+        for duration in range(100, 1100, 10):
+            self.dbm.add_entry({
+                'name': 'long user',
+                'date': datetime.date(2018, 6, 1),
+                'task_name': 'task {}'.format(duration),
+                'duration': duration,
+                'notes': '',
+            })
+
+        estimates = self.dbm.duration_quantiles((0.5, 0.95))
+
+        self.assertAlmostEqual(estimates[0.5], 590, delta=30)
+        self.assertAlmostEqual(estimates[0.95], 1040, delta=52)
+
+    def test_duration_quantiles_of_no_entries_are_none(self):
+        """Ensure that there are no estimates without entries"""
+        self.assertEqual(list(self.dbm.duration_quantiles((0.5,)).values()),
+                         [None])
+
+    def test_duration_histograms_follow_edits_and_deletes(self):
+        """Ensure that the triggers move edited entries between buckets and
+        remove deleted ones
+        """
+        data = self.create_mixed_test_data()
+        entry = data['test_log_entry_1']
+        edited = dict(entry, duration=13)
+        self.dbm.edit_entry(entry, edited)
+        self.dbm.delete_entry(data['test_log_entry_2'])
+
+        estimates = self.dbm.duration_quantiles((0, 1))
+
+        self.assertEqual(list(estimates.values()), [13, 13])
+
+    # employee_duration_quantiles
+    def test_employee_duration_quantiles_per_employee(self):
+        """Ensure that each employee gets their own estimates"""
+        self.create_report_data()
+
+        rows = self.dbm.employee_duration_quantiles((0.5, 1))
+
+        # 30 minutes is in the 30-32 minute bucket
+        self.assertEqual([tuple(row.values()) for row in rows],
+                         [('report user 1', 10, 31), ('report user 2', 7, 7)])
+
+    # rebuild_duration_histograms
+    def test_rebuild_duration_histograms_recounts_entries(self):
+        """Ensure that rebuilding recounts histograms that have drifted
+        from the entries (e.g., after writes with the triggers missing)
+        """
+        self.create_report_data()
+        db_manager.db.execute_sql('UPDATE "durationhistogram" SET "count" = 0')
+
+        self.dbm.rebuild_duration_histograms()
+
+        self.assertEqual(
+            list(self.dbm.duration_quantiles((0.5, 1)).values()), [7, 31]
+        )
+
+    def test_upgrade_schema_counts_durations_of_old_entries(self):
+        """A database from before the duration histograms should have them
+        added, with the existing entries counted
+        """
+        self.create_report_data()
+        db = db_manager.db
+        db.execute_sql('DROP TABLE "durationhistogram"')
+        for action in ['add', 'edit', 'delete']:
+            db.execute_sql(
+                'DROP TRIGGER "durationhistogram_{}"'.format(action)
+            )
+        db.execute_sql('PRAGMA user_version = 3')
+
+        self.dbm.upgrade_schema()
+
+        self.assertEqual(
+            list(self.dbm.duration_quantiles((0.5, 1)).values()), [7, 31]
+        )
+
+    # export
+    def test_export_csv_writes_matching_entries_sorted_by_date(self):
+        """Ensure that a CSV export has a header row and one row per
+        matching entry, in date order, which can be imported again
+        """
+        self.create_mixed_test_data()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'export.csv')
+        filters = {'employee': 'test user 1 (l.e.)'}
+
+        written = self.dbm.export(filters, 'csv', path)
+
+        expected = self.dbm.search(filters)
+        with open(path, newline='') as export_file:
+            rows = list(csv.reader(export_file))
+        self.assertEqual(rows[0], list(settings.HEADERS.values()))
+        self.assertEqual(written, len(expected))
+        self.assertEqual(rows[1:], [
+            [entry['name'], entry['date'].isoformat(), entry['task_name'],
+             str(entry['duration']), entry['notes']]
+            for entry in expected
+        ])
+
+    def test_export_jsonl_writes_one_object_per_entry(self):
+        """Ensure that a JSON Lines export has one JSON object per entry"""
+        self.create_mixed_test_data()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'export.jsonl')
+
+        written = self.dbm.export({}, 'jsonl', path)
+
+        with open(path) as export_file:
+            objects = [json.loads(line) for line in export_file]
+        expected = self.dbm.search({})
+        self.assertEqual(written, len(expected))
+        self.assertEqual(objects[0],
+                         dict(expected[0],
+                              date=expected[0]['date'].isoformat()))
+
+    def test_export_unknown_format_raises_error(self):
+        """Ensure that asking for an unsupported format raises ValueError"""
+        with patch('sys.stdout', new=io.StringIO()):
+            with self.assertRaises(ValueError):
+                self.dbm.export({}, 'xml', 'export.xml')
+
     # view_entry
     def test_view_entry_returns_correct_record(self):
         """Ensure that the correct entry is returned."""
@@ -763,6 +1832,238 @@ class DBManagerTests(unittest.TestCase):
                 duration=datum_to_delete['duration']
             )
 
+    # changes_since
+    def test_changes_since_reports_adds_edits_and_deletes_in_order(self):
+        """Ensure that every change is reported, in order, with the entry's
+        current values
+        """
+        start = self.dbm.changes_since(0, limit=1000000)
+        last_seq = start[-1]['seq'] if start else 0
+        data = self.create_mixed_test_data()
+        entry_1 = data['test_log_entry_1']
+        entry_2 = data['test_log_entry_2']
+        edited_entry_2 = dict(entry_2, duration=99)
+        self.dbm.edit_entry(entry_2, edited_entry_2)
+        self.dbm.delete_entry(entry_1)
+
+        changes = self.dbm.changes_since(last_seq)
+
+        self.assertEqual([change['action'] for change in changes],
+                         ['add', 'add', 'edit', 'delete'])
+        seqs = [change['seq'] for change in changes]
+        self.assertEqual(seqs, sorted(seqs))
+        self.assertIsNone(changes[0]['entry'])
+        self.assertEqual(changes[1]['entry'], edited_entry_2)
+        self.assertEqual(changes[2]['id'], changes[1]['id'])
+        self.assertEqual(changes[3]['id'], changes[0]['id'])
+
+    def test_changes_since_pages_with_limit(self):
+        """Ensure that passing the last seq seen gets the next page"""
+        start = self.dbm.changes_since(0, limit=1000000)
+        last_seq = start[-1]['seq'] if start else 0
+        self.create_test_dates()
+
+        first_page = self.dbm.changes_since(last_seq, limit=3)
+        second_page = self.dbm.changes_since(first_page[-1]['seq'], limit=3)
+
+        self.assertEqual(len(first_page), 3)
+        self.assertEqual(len(second_page), 2)
+
+    def test_changes_since_ignores_derived_column_updates(self):
+        """Ensure that recalculating a derived column isn't reported as an
+        edit
+        """
+        self.create_mixed_test_data()
+        start = self.dbm.changes_since(0, limit=1000000)
+
+        db_manager.LogEntry.update(
+            day_number=db_manager.LogEntry.day_number
+        ).execute()
+
+        self.assertEqual(self.dbm.changes_since(start[-1]['seq']), [])
+
+    # flush / MemoryDatabase
+    def test_memory_database_loads_file_and_flushes_on_request(self):
+        """Ensure that an in-memory database starts with the file's entries
+        and only writes new ones back to the file when flushed
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'memory.db')
+        data = self.create_mixed_test_data()
+        self.dbm.backup(directory=directory, pause=0)
+        os.replace(os.path.join(directory, 'unittest.1.db'), path)
+        file_entries = self.count_file_entries(path)
+
+        dbm = self.set_memory_database(path)
+        self.assertEqual(len(dbm.view_everything()), file_entries)
+        dbm.add_entry(dict(data['test_log_entry_1'], notes='in memory'))
+        self.assertEqual(self.count_file_entries(path), file_entries)
+
+        dbm.flush(force=True)
+        self.assertEqual(self.count_file_entries(path), file_entries + 1)
+
+    def test_memory_database_flushes_periodically_and_on_close(self):
+        """Ensure that writes are flushed once FLUSH_INTERVAL has passed and
+        that closing the database flushes it
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'memory.db')
+        data = self.create_mixed_test_data()
+        dbm = self.set_memory_database(path)
+
+        with patch('wl_settings.FLUSH_INTERVAL', 0):
+            dbm.add_entry(data['test_log_entry_1'])
+        self.assertEqual(self.count_file_entries(path), 1)
+
+        dbm.add_entry(data['test_log_entry_2'])
+        self.assertEqual(self.count_file_entries(path), 1)
+        db_manager.db.close()
+        self.assertEqual(self.count_file_entries(path), 2)
+
+    def test_memory_database_crash_loses_only_unflushed_writes(self):
+        """Ensure that after a crash (the in-memory database vanishing
+        without being closed) reopening the file gives the database as it
+        was at the last flush
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'memory.db')
+        data = self.create_mixed_test_data()
+        dbm = self.set_memory_database(path)
+        dbm.add_entry(data['test_log_entry_1'])
+        dbm.flush(force=True)
+        dbm.add_entry(data['test_log_entry_2'])
+
+        # simulate the crash by dropping the connection without closing it
+        db_manager.db._state.reset()
+        dbm = self.set_memory_database(path)
+
+        self.assertEqual(len(dbm.view_everything()), 1)
+        dbm.view_entry(data['test_log_entry_1'])
+
+    # employee_name_trie
+    def test_employee_name_trie_contains_employees_with_entries(self):
+        """Ensure that the trie holds the names of every employee with an
+        entry and no one else
+        """
+        self.create_mixed_test_data()
+
+        trie = self.dbm.employee_name_trie()
+
+        self.assertEqual(trie.matches('test user'),
+                         ['test user 1 (l.e.)', 'test user 2 (l.e.)'])
+
+    def test_employee_name_trie_follows_writes(self):
+        """Ensure that add_entry, edit_entry and delete_entry keep the trie
+        up to date
+        """
+        data = self.create_mixed_test_data()
+        trie = self.dbm.employee_name_trie()
+        new_entry = dict(data['test_log_entry_1'], name='new test user')
+
+        self.dbm.add_entry(new_entry)
+        self.assertEqual(trie.matches('new'), ['new test user'])
+
+        edited_entry = dict(new_entry, name='edited test user')
+        self.dbm.edit_entry(new_entry, edited_entry)
+        self.assertEqual(trie.matches('new'), [])
+        self.assertEqual(trie.matches('edit'), ['edited test user'])
+
+        self.dbm.delete_entry(data['test_log_entry_1'])
+        self.assertEqual(trie.matches('test user'), ['test user 2 (l.e.)'])
+        self.assertIs(self.dbm.employee_name_trie(), trie)
+
+    # employee_name_tree
+    def test_employee_name_tree_follows_writes(self):
+        """Ensure that add_entry, edit_entry and delete_entry keep the
+        BK-tree up to date
+        """
+        data = self.create_mixed_test_data()
+        tree = self.dbm.employee_name_tree()
+        new_entry = dict(data['test_log_entry_1'], name='new test user')
+
+        self.dbm.add_entry(new_entry)
+        self.assertEqual(tree.matches('nwe test user'),
+                         [(2, 'new test user')])
+
+        edited_entry = dict(new_entry, name='edited test user')
+        self.dbm.edit_entry(new_entry, edited_entry)
+        self.assertEqual(tree.matches('nwe test user'), [])
+        self.assertEqual(tree.matches('edted test user'),
+                         [(1, 'edited test user')])
+
+        self.dbm.delete_entry(data['test_log_entry_1'])
+        self.assertEqual(tree.matches('test user 1 (l.e.)', 0), [])
+        self.assertIs(self.dbm.employee_name_tree(), tree)
+
+    # view_names_like
+    def test_view_names_like_ranks_near_matches(self):
+        """Ensure that names within the distance are returned closest first,
+        ignoring case
+        """
+        self.create_mixed_test_data()
+
+        names = self.dbm.view_names_like('TEST USER 1 (L.E)')
+
+        self.assertEqual(names, [
+            OrderedDict([('name', 'test user 1 (l.e.)'), ('distance', 1)]),
+            OrderedDict([('name', 'test user 2 (l.e.)'), ('distance', 2)]),
+        ])
+        self.assertEqual(self.dbm.view_names_like('test user 9', 1), [])
+
+    # backup
+    def test_backup_copies_database_and_reports_progress(self):
+        """Ensure that the backup holds the same entries as the database
+        and that progress is reported until every page is copied
+        """
+        self.create_mixed_test_data()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        progress = []
+
+        def record_progress(pages_done, total_pages):
+            progress.append((pages_done, total_pages))
+
+        backup_path = self.dbm.backup(directory=directory, pages=1, pause=0,
+                                      progress=record_progress)
+
+        connection = sqlite3.connect(backup_path)
+        backed_up = connection.execute(
+            "SELECT task_id FROM logentry ORDER BY id").fetchall()
+        connection.close()
+        expected = [(entry.task_id,) for entry in (
+            db_manager.LogEntry.select().order_by(db_manager.LogEntry.id)
+        )]
+        self.assertEqual(backed_up, expected)
+        self.assertGreater(len(progress), 1)
+        self.assertEqual(progress[-1][0], progress[-1][1])
+
+    def test_backup_rotates_backup_files(self):
+        """Ensure that only `count` backups are kept, numbered newest first
+        """
+        self.create_mixed_test_data()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        first = self.dbm.backup(directory=directory, count=2, pause=0)
+        self.dbm.delete_entry(self.dbm.view_everything()[0])
+        second = self.dbm.backup(directory=directory, count=2, pause=0)
+        self.dbm.delete_entry(self.dbm.view_everything()[0])
+        self.dbm.backup(directory=directory, count=2, pause=0)
+
+        self.assertEqual(first, second)
+        self.assertEqual(sorted(os.listdir(directory)),
+                         ['unittest.1.db', 'unittest.2.db'])
+        counts = []
+        for name in sorted(os.listdir(directory)):
+            connection = sqlite3.connect(os.path.join(directory, name))
+            counts.append(connection.execute(
+                "SELECT count(*) FROM logentry").fetchone()[0])
+            connection.close()
+        self.assertEqual(counts[1] - counts[0], 1)
+
     # record_to_dict
     def test_record_to_dict_returns_orderedDict_matching_record(self):
         """Ensure that the returned object has the same elements as the record.
@@ -817,6 +2118,19 @@ class DBManagerTests(unittest.TestCase):
 
         self.assertIsInstance(ordered_dict, OrderedDict)
 
+    # entries_to_list
+    def test_entries_to_list_matches_record_to_dict(self):
+        """Ensure that each entry is converted to the same OrderedDict as
+        record_to_dict gives for its record
+        """
+        self.create_mixed_test_data()
+        query = self.dbm.entries_query().order_by(db_manager.LogEntry.id)
+
+        self.assertEqual(
+            self.dbm.entries_to_list(query),
+            [self.dbm.record_to_dict(record) for record in query]
+        )
+
     # records_to_list
     def test_records_to_list_returns_list_matching_records(self):
         """Ensure that the list has the same elements as the collection of
@@ -0,0 +1,154 @@
+"""Test Migrations
+Unit Tests for migrations.py
+
+Created: 2026
+Last Update: 2026-10-19
+Author: Alex Koumparos
+"""
+import unittest
+
+from peewee import *
+
+import migrations
+
+
+class MigrationRunnerTests(unittest.TestCase):
+
+    # Helper Methods
+    # --------------
+    def add_column(self, database):
+        """Migration step: adds the `size` column to the item table (if
+        missing)
+        """
+        columns = [column.name for column in database.get_columns('item')]
+        if 'size' not in columns:
+            database.execute_sql(
+                'ALTER TABLE "item" ADD COLUMN "size" INTEGER'
+            )
+
+    def failing_step(self, database):
+        """Migration step: changes the item table, then fails"""
+        database.execute_sql('DELETE FROM "item"')
+        raise OperationalError("step failed")
+
+    def item_sizes(self):
+        """Returns a list of the size of every item, in id order"""
+        cursor = self.db.execute_sql('SELECT "size" FROM "item" ORDER BY "id"')
+        return [row[0] for row in cursor]
+
+    # Setup and Teardown
+    # ------------------
+    def setUp(self):
+        self.db = SqliteDatabase(':memory:')
+        self.db.connect()
+        self.db.execute_sql(
+            'CREATE TABLE "item" ("id" INTEGER PRIMARY KEY, "name" TEXT)'
+        )
+        for name in ['a', 'bb', 'ccc', 'dddd', 'eeeee']:
+            self.db.execute_sql('INSERT INTO "item" ("name") VALUES (?)',
+                                (name,))
+        self.migrations = [
+            migrations.Migration(1, "sizes", [
+                ("add column", self.add_column),
+                ("fill sizes", migrations.backfill_step(
+                    'item',
+                    'UPDATE "item" SET "size" = length("name") '
+                    'WHERE "id" BETWEEN ? AND ? AND "size" IS NULL',
+                    2
+                )),
+            ]),
+            migrations.Migration(2, "size index", [
+                ("index sizes", migrations.sql_step(
+                    'CREATE INDEX IF NOT EXISTS "item_size" '
+                    'ON "item" ("size")'
+                )),
+            ]),
+        ]
+        self.runner = migrations.MigrationRunner(self.db, self.migrations)
+
+    def tearDown(self):
+        self.db.close()
+
+    # Actual tests
+    # ------------
+    # run
+    def test_run_applies_pending_migrations_and_records_version(self):
+        """Ensure that every migration is applied in order and the database
+        ends up at the latest version
+        """
+        self.runner.run()
+
+        self.assertEqual(self.item_sizes(), [1, 2, 3, 4, 5])
+        self.assertIn('item_size',
+                      [index.name for index in self.db.get_indexes('item')])
+        self.assertEqual(self.runner.version(), 2)
+        self.assertEqual(self.runner.pending(), [])
+
+    def test_run_only_applies_migrations_not_yet_run(self):
+        """Ensure that migrations at or below the database's version are
+        skipped
+        """
+        self.runner.run()
+        self.db.execute_sql('DROP INDEX "item_size"')
+        self.runner.set_version(1)
+
+        report = self.runner.run()
+
+        self.assertEqual([step['step'] for step in report], ["index sizes"])
+        self.assertEqual(self.runner.version(), 2)
+
+    def test_run_reports_each_step(self):
+        """Ensure that each step is reported (to `progress` too) with its
+        migration and the time it took
+        """
+        progress = []
+
+        report = self.runner.run(progress=progress.append)
+
+        self.assertEqual(report, progress)
+        self.assertEqual(
+            [(step['version'], step['step']) for step in report],
+            [(1, "add column"), (1, "fill sizes"), (2, "index sizes")]
+        )
+        for step in report:
+            self.assertGreaterEqual(step['seconds'], 0)
+
+    def test_run_rolls_back_failed_step_and_keeps_version(self):
+        """Ensure that a step that fails is rolled back and the migration
+        isn't recorded as done
+        """
+        self.migrations[1].steps.append(("fail", self.failing_step))
+
+        with self.assertRaises(OperationalError):
+            self.runner.run()
+
+        self.assertEqual(len(self.item_sizes()), 5)
+        self.assertEqual(self.runner.version(), 1)
+
+    # backfill_step
+    def test_backfill_step_carries_on_from_interrupted_run(self):
+        """Ensure that a backfill only changes the rows that still need it,
+        so rerunning it after an interruption finishes the job
+        """
+        self.add_column(self.db)
+        self.db.execute_sql('UPDATE "item" SET "size" = 0 WHERE "id" <= 2')
+
+        self.runner.run()
+
+        self.assertEqual(self.item_sizes(), [0, 0, 3, 4, 5])
+
+    # id_ranges
+    def test_id_ranges_cover_every_id(self):
+        """Ensure that the ranges cover the ids from lowest to highest"""
+        self.assertEqual(list(migrations.id_ranges(self.db, 'item', 2)),
+                         [(1, 2), (3, 4), (5, 6)])
+
+    def test_id_ranges_of_empty_table_is_empty(self):
+        """Ensure that an empty table has no ranges"""
+        self.db.execute_sql('DELETE FROM "item"')
+
+        self.assertEqual(list(migrations.id_ranges(self.db, 'item', 2)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+"""Test Name Index
+Unit Tests for name_index.py
+
+Created: 2026
+Last Update: 2026-10-19
+Author: Alex Koumparos
+"""
+import unittest
+
+import name_index
+
+
+class NameTrieTests(unittest.TestCase):
+
+    # Setup and Teardown
+    # ------------------
+    def setUp(self):
+        self.names = [
+            ("Alice", 2),
+            ("Alan", 1),
+            ("albert", 3),
+            ("Bob", 1),
+            ("Bobby", 4),
+        ]
+        self.trie = name_index.NameTrie(self.names, limit=3)
+
+    # Actual tests
+    # ------------
+    # matches
+    def test_matches_returns_names_with_prefix_ignoring_case(self):
+        """Ensure that every name starting with the prefix (in any case) is
+        returned in alphabetical order
+        """
+        self.assertEqual(self.trie.matches("AL"), ["Alan", "albert", "Alice"])
+        self.assertEqual(self.trie.matches("bob"), ["Bob", "Bobby"])
+
+    def test_matches_returns_at_most_limit_names(self):
+        """Ensure that only the first `limit` names are returned"""
+        self.assertEqual(self.trie.matches(""), ["Alan", "albert", "Alice"])
+
+    def test_matches_returns_nothing_for_unknown_prefix(self):
+        """Ensure that a prefix no name starts with has no matches"""
+        self.assertEqual(self.trie.matches("Carol"), [])
+
+    # add
+    def test_add_new_name_appears_in_matches(self):
+        """Ensure that a newly added name is found by its prefixes"""
+        self.trie.add("Aaron")
+
+        self.assertEqual(self.trie.matches("a"), ["Aaron", "Alan", "albert"])
+        self.assertEqual(self.trie.matches("aa"), ["Aaron"])
+
+    # remove
+    def test_remove_keeps_name_until_no_entries_left(self):
+        """Ensure that a name is only removed once its count reaches zero,
+        and that the next name alphabetically takes its place
+        """
+        self.trie.remove("Alan")
+        self.assertEqual(self.trie.matches(""), ["albert", "Alice", "Bob"])
+
+        self.trie.remove("albert", count=2)
+        self.assertEqual(self.trie.matches("alb"), ["albert"])
+        self.trie.remove("albert")
+        self.assertEqual(self.trie.matches("alb"), [])
+        self.assertEqual(self.trie.matches(""), ["Alice", "Bob", "Bobby"])
+
+    def test_remove_ignores_unknown_names(self):
+        """Ensure that removing a name that isn't in the trie does nothing"""
+        self.trie.remove("Carol")
+        self.trie.remove("ali")
+
+        self.assertEqual(self.trie.matches("ali"), ["Alice"])
+
+    # cursor
+    def test_cursor_matches_follow_typed_prefix(self):
+        """Ensure that the cursor's matches are those for the prefix typed
+        so far, as characters are typed and deleted
+        """
+        cursor = self.trie.cursor()
+        cursor.push("B")
+        cursor.push("o")
+        cursor.push("b")
+        cursor.push("b")
+        self.assertEqual(cursor.matches(), ["Bobby"])
+
+        cursor.pop()
+        self.assertEqual(cursor.prefix, "Bob")
+        self.assertEqual(cursor.matches(), ["Bob", "Bobby"])
+
+    def test_cursor_move_to_changes_prefix(self):
+        """Ensure that moving the cursor to a new prefix gives the matches
+        for that prefix, including after leaving the trie
+        """
+        cursor = self.trie.cursor()
+        cursor.move_to("Alx")
+        self.assertEqual(cursor.matches(), [])
+
+        cursor.move_to("Ali")
+        self.assertEqual(cursor.prefix, "Ali")
+        self.assertEqual(cursor.matches(), ["Alice"])
+
+        cursor.move_to("")
+        self.assertEqual(cursor.matches(), self.trie.matches(""))
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+class NameBKTreeTests(unittest.TestCase):
+
+    # Setup and Teardown
+    # ------------------
+    def setUp(self):
+        self.names = [
+            ("John", 2),
+            ("Joan", 1),
+            ("jon", 1),
+            ("Jonathan", 3),
+            ("Bob", 1),
+        ]
+        self.tree = name_index.NameBKTree(self.names, limit=3)
+
+    # Actual tests
+    # ------------
+    # matches
+    def test_matches_returns_closest_names_first_ignoring_case(self):
+        """Ensure that names within the distance are returned closest
+        first, then alphabetically
+        """
+        self.assertEqual(self.tree.matches("JHON"),
+                         [(1, "jon"), (2, "Joan"), (2, "John")])
+        self.assertEqual(self.tree.matches("jhon", max_distance=1),
+                         [(1, "jon")])
+
+    def test_matches_returns_nothing_when_nothing_close(self):
+        """Ensure that a text far from every name has no matches"""
+        self.assertEqual(self.tree.matches("Alice"), [])
+        self.assertEqual(name_index.NameBKTree().matches("Alice"), [])
+
+    # add
+    def test_add_new_name_appears_in_matches(self):
+        """Ensure that a newly added name is found by near misses"""
+        self.tree.add("Alice")
+
+        self.assertEqual(self.tree.matches("Alcie"), [(2, "Alice")])
+
+    # remove
+    def test_remove_keeps_name_until_no_entries_left(self):
+        """Ensure that a name only stops matching once its count reaches
+        zero, and can be added back
+        """
+        self.tree.remove("John")
+        self.assertEqual(self.tree.matches("John", 0), [(0, "John")])
+
+        self.tree.remove("John")
+        self.assertEqual(self.tree.matches("John", 0), [])
+        self.tree.remove("Carol")
+
+        self.tree.add("John")
+        self.assertEqual(self.tree.matches("John", 0), [(0, "John")])
+
+    # edit_distance
+    def test_edit_distance_counts_single_character_edits(self):
+        """Ensure that insertions, deletions and substitutions each count
+        as one edit
+        """
+        self.assertEqual(name_index.edit_distance("kitten", "sitting"), 3)
+        self.assertEqual(name_index.edit_distance("jhon", "john"), 2)
+        self.assertEqual(name_index.edit_distance("", "bob"), 3)
+        self.assertEqual(name_index.edit_distance("bob", "bob"), 0)
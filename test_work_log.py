@@ -2,11 +2,15 @@
 Unit Tests for work_log.py
 
 Created: 2018
-Last Update: 2018-06-05
+Last Update: 2026-10-19
 Author: Alex Koumparos
 """
+import csv
 import io
+import os
+import shutil
 import sys
+import tempfile
 import unittest
 from unittest.mock import patch
 # (see: https://dev.to/patrnk/how-to-test-input-processing-in-python-3)
@@ -36,26 +40,28 @@ class MenuTests(unittest.TestCase):
         database
         """
         db_manager.db = SqliteDatabase(settings.UNITTEST_DATABASE_NAME)
-        db_manager.Employee._meta.database = db_manager.db
-        db_manager.LogEntry._meta.database = db_manager.db
+        for model in db_manager.tables:
+            model._meta.database = db_manager.db
 
     def revert_database(self):
         """Switch back to regular database"""
         # make sure that in unittest database
         db_manager.db = SqliteDatabase(settings.UNITTEST_DATABASE_NAME)
-        db_manager.Employee._meta.database = db_manager.db
-        db_manager.LogEntry._meta.database = db_manager.db
+        for model in db_manager.tables:
+            model._meta.database = db_manager.db
 
-        # delete all test data
+        # delete all test data (log entries first, deleting them writes to
+        # some of the other tables)
         q = db_manager.LogEntry.delete()
         q.execute()
-        q = db_manager.Employee.delete()
-        q.execute()
+        for model in db_manager.tables:
+            q = model.delete()
+            q.execute()
 
         # switch back to live database
         db_manager.db = SqliteDatabase(settings.LIVE_DATABASE_NAME)
-        db_manager.Employee._meta.database = db_manager.db
-        db_manager.LogEntry._meta.database = db_manager.db
+        for model in db_manager.tables:
+            model._meta.database = db_manager.db
 
     def create_mixed_test_data(self):
         """Creates three test users and four test log entries, writes them
@@ -169,6 +175,8 @@ class MenuTests(unittest.TestCase):
         user_inputs = {
             'a': self.menu.add_entry,
             's': self.menu.search_entries,
+            'i': self.menu.import_entries,
+            'r': self.menu.reports,
             'o': self.menu.options,
             'q': self.menu.quit_program,
         }
@@ -232,30 +240,271 @@ class MenuTests(unittest.TestCase):
 
         self.assertEqual(returned_menu, self.menu.main_menu)
 
+    # import_entries
+    def test_import_entries_imports_csv_and_reports_errors(self):
+        """Ensure that the import menu imports the valid rows of a CSV file,
+        reads ambiguous dates in the preferred format, reports the invalid
+        rows and returns main_menu
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        file_path = os.path.join(directory, 'import.csv')
+        with open(file_path, 'w', newline='') as csv_file:
+            csv_file.write("name,date,task_name,duration,notes\n"
+                           "Importer,01/02/2018,Imported task,30,\n"
+                           "Importer,not a date,Imported task,30,\n")
+        self.menu.OPTIONS['date format'] = settings.DATE_FORMATS['us']
+
+        with patch('builtins.input', side_effect=[file_path]):
+            with patch('sys.stdout', new=io.StringIO()) as fake_output:
+                returned_menu = self.menu.import_entries()
+
+        record = db_manager.LogEntry.get(
+            db_manager.LogEntry.task_name == 'Imported task')
+        self.assertEqual(record.date, datetime.date(2018, 1, 2))
+        self.assertIn("added 1 new entries", fake_output.getvalue())
+        self.assertIn("line 3: not a date is not a valid date",
+                      fake_output.getvalue())
+        self.assertEqual(returned_menu, self.menu.main_menu)
+
+    def test_import_entries_reports_file_that_is_not_valid_csv(self):
+        """Ensure that a file that isn't valid CSV is reported as not
+        imported and main_menu is returned
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        file_path = os.path.join(directory, 'import.csv')
+        with open(file_path, 'w', newline='') as csv_file:
+            csv_file.write("name,date,task_name,duration,notes\n"
+                           "Importer,2018-01-02,Imported task,30,\"" +
+                           "x" * 200000)
+
+        with patch('builtins.input', side_effect=[file_path]):
+            with patch('sys.stdout', new=io.StringIO()) as fake_output:
+                returned_menu = self.menu.import_entries()
+
+        self.assertIn("Unable to import {}: line 2: ".format(file_path),
+                      fake_output.getvalue())
+        self.assertEqual(returned_menu, self.menu.main_menu)
+
     # options
-    def test_options_date_format_choice_updates_settings(self):
-        """Ensure that the options menu sets the correct settings in response
+    def test_options_selection_returns_correct_menu(self):
+        """Ensure that the options menu loads the correct menu in response
         to user input.
         """
+        user_inputs = {
+            'd': self.menu.options_date_format,
+            'c': self.menu.options_case_sensitive_search,
+            'k': self.menu.options_backup,
+            'm': self.menu.options_maintenance,
+            'e': self.menu.options_merge_employees,
+            'b': self.menu.main_menu,
+        }
+        results = []
+        expected_results = []
+        for key, value in user_inputs.items():
+            expected_results.append(value)
+            with patch('builtins.input', side_effect=key):
+                results.append(self.menu.options())
+
+        self.assertEqual(expected_results, results)
+
+    # options_date_format
+    def test_options_date_format_choice_updates_settings(self):
+        """Ensure that the date format menu sets the correct settings in
+        response to user input.
+        """
         user_inputs = settings.DATE_FORMATS.keys()
         results = []
         expected_results = list(settings.DATE_FORMATS.values())
         for i in range(1, len(user_inputs) + 1):
             with patch('builtins.input', side_effect=str(i)):
-                self.menu.options()
+                self.menu.options_date_format()
                 results.append(self.menu.OPTIONS['date format'])
 
         self.assertEqual(results, expected_results)
 
-    def test_options_returns_main_menu(self):
-        """Ensure that the options menu finishes by returning main_menu
+    def test_options_date_format_returns_main_menu(self):
+        """Ensure that the date format menu finishes by returning main_menu
         """
         example_input = '1'
         with patch('builtins.input', side_effect=example_input):
-            returned_menu = self.menu.options()
+            returned_menu = self.menu.options_date_format()
 
         self.assertEqual(returned_menu, self.menu.main_menu)
 
+    # options_case_sensitive_search
+    def test_options_case_sensitive_search_updates_settings(self):
+        """Ensure that the case sensitive search menu sets the correct
+        setting in response to user input.
+        """
+        results = []
+        expected_results = [True, True, False]
+        for user_input in ['y', 'x', 'n']:
+            with patch('builtins.input', side_effect=[user_input]):
+                self.menu.options_case_sensitive_search()
+                results.append(self.menu.OPTIONS['case sensitive search'])
+
+        self.assertEqual(results, expected_results)
+
+    # options_backup
+    def test_options_backup_backs_up_and_returns_main_menu(self):
+        """Ensure that the backup menu makes a backup and finishes by
+        returning main_menu
+        """
+        with patch('db_manager.DBManager.backup',
+                   return_value='backups/unittest.1.db') as mock_backup:
+            with patch('sys.stdout', new=io.StringIO()) as fake_output:
+                returned_menu = self.menu.options_backup()
+
+        mock_backup.assert_called_once()
+        self.assertIn('backups/unittest.1.db', fake_output.getvalue())
+        self.assertEqual(returned_menu, self.menu.main_menu)
+
+    # options_maintenance
+    def test_options_maintenance_reports_and_returns_main_menu(self):
+        """Ensure that the maintenance menu runs the maintenance, shows the
+        report and finishes by returning main_menu
+        """
+        with patch('sys.stdout', new=io.StringIO()) as fake_output:
+            returned_menu = self.menu.options_maintenance()
+
+        self.assertIn("Database size before", fake_output.getvalue())
+        self.assertIn("optimize", fake_output.getvalue())
+        self.assertEqual(returned_menu, self.menu.main_menu)
+
+    # reports
+    def test_reports_selection_returns_correct_menu(self):
+        """Ensure that the reports menu loads the correct menu in response
+        to user input.
+        """
+        user_inputs = {
+            'c': self.menu.report_running_totals,
+            'm': self.menu.report_moving_averages,
+            't': self.menu.report_task_rankings,
+            'q': self.menu.report_duration_quantiles,
+            'b': self.menu.main_menu,
+        }
+        results = []
+        expected_results = []
+        for key, value in user_inputs.items():
+            expected_results.append(value)
+            with patch('builtins.input', side_effect=key):
+                results.append(self.menu.reports())
+
+        self.assertEqual(expected_results, results)
+
+    # report_running_totals
+    def test_report_running_totals_shows_cumulative_minutes(self):
+        """Ensure that the report shows each day's minutes and the running
+        total for the selected date range, then returns the reports menu
+        """
+        e = db_manager.Employee.get_or_create(name="Test Employee 1")
+        for day, duration in [(1, 10), (2, 20), (3, 40)]:
+            db_manager.LogEntry.create(
+                employee=e[0],
+                date=datetime.date(2018, 5, day),
+                task_name='Task {}'.format(day),
+                duration=duration,
+                notes='Note'
+            )
+        example_input = ['', '2018-05-02', '']
+
+        with patch('builtins.input', side_effect=example_input):
+            with patch('sys.stdout', new=io.StringIO()) as fake_output:
+                returned_menu = self.menu.report_running_totals()
+
+        lines = fake_output.getvalue().splitlines()
+        self.assertEqual(lines[-2].split(),
+                         ["Test", "Employee", "1", "2018-05-02", "20", "20"])
+        self.assertEqual(lines[-1].split(),
+                         ["Test", "Employee", "1", "2018-05-03", "40", "60"])
+        self.assertEqual(returned_menu, self.menu.reports)
+
+    # report_task_rankings
+    def test_report_task_rankings_ranks_every_task_without_employee(self):
+        """Ensure that with no employee selected every task is ranked
+        together
+        """
+        for name, task, duration in [("Employee 1", "Task A", 10),
+                                     ("Employee 2", "Task A", 10),
+                                     ("Employee 2", "Task B", 15)]:
+            e = db_manager.Employee.get_or_create(name=name)
+            db_manager.LogEntry.create(
+                employee=e[0],
+                date=datetime.date(2018, 5, 1),
+                task_name=task,
+                duration=duration,
+                notes='Note'
+            )
+
+        with patch('builtins.input', side_effect=['', '', '']):
+            with patch('sys.stdout', new=io.StringIO()) as fake_output:
+                returned_menu = self.menu.report_task_rankings()
+
+        lines = fake_output.getvalue().splitlines()
+        self.assertEqual(lines[-2].split(),
+                         ["everyone", "1", "Task", "A", "20"])
+        self.assertEqual(lines[-1].split(),
+                         ["everyone", "2", "Task", "B", "15"])
+        self.assertEqual(returned_menu, self.menu.reports)
+
+    # report_duration_quantiles
+    def test_report_duration_quantiles_shows_each_employee(self):
+        """Ensure that each employee's median, 90th and 95th percentile time
+        spent are shown, then the reports menu is returned
+        """
+        e = db_manager.Employee.get_or_create(name="Employee 1")
+        for duration in range(1, 11):
+            db_manager.LogEntry.create(
+                employee=e[0],
+                date=datetime.date(2018, 5, duration),
+                task_name='Task',
+                duration=duration,
+                notes='Note'
+            )
+
+        with patch('sys.stdout', new=io.StringIO()) as fake_output:
+            returned_menu = self.menu.report_duration_quantiles()
+
+        lines = fake_output.getvalue().splitlines()
+        self.assertEqual(lines[-1].split(), ["Employee", "1", "5", "9", "10"])
+        self.assertEqual(returned_menu, self.menu.reports)
+
+    def test_report_with_no_entries_returns_reports_menu(self):
+        """Ensure that a report with nothing to show says so"""
+        with patch('builtins.input', side_effect=['', '', '']):
+            with patch('sys.stdout', new=io.StringIO()) as fake_output:
+                returned_menu = self.menu.report_moving_averages()
+
+        self.assertIn("No entries", fake_output.getvalue())
+        self.assertEqual(returned_menu, self.menu.reports)
+
+    # options_merge_employees
+    def test_options_merge_employees_moves_entries(self):
+        """Ensure that the entered employees' entries are moved to the
+        target employee and the main menu is returned
+        """
+        for name in ["Jon", "john"]:
+            e = db_manager.Employee.get_or_create(name=name)
+            db_manager.LogEntry.create(
+                employee=e[0],
+                date=datetime.date(2018, 1, 2),
+                task_name='Test task for {}'.format(name),
+                duration=10,
+                notes='Note')
+        example_input = ['Jon', 'john', '', 'John']
+
+        with patch('builtins.input', side_effect=example_input):
+            with patch('sys.stdout', new=io.StringIO()) as fake_output:
+                returned_menu = self.menu.options_merge_employees()
+
+        self.assertIn("Moved 2 entries to John (0 duplicates removed), "
+                      "removed 2 employees", fake_output.getvalue())
+        names = [employee.name for employee in db_manager.Employee.select()]
+        self.assertEqual(names, ["John"])
+        self.assertEqual(returned_menu, self.menu.main_menu)
+
     # search_entries
     def test_search_entries_returns_correct_menu(self):
         """Ensure that the search_entries menu loads the correct menu in
@@ -267,7 +516,9 @@ class MenuTests(unittest.TestCase):
             'd': self.menu.search_exact_date,
             'r': self.menu.search_date_range,
             't': self.menu.search_time_spent,
+            'o': self.menu.search_top_tasks,
             's': self.menu.search_text_search,
+            'c': self.menu.search_combined,
             'b': self.menu.main_menu,
         }
         results = []
@@ -330,6 +581,7 @@ class MenuTests(unittest.TestCase):
                            "v) View detail\n" +
                            "e) Edit\n" +
                            "d) Delete\n" +
+                           "x) eXport results to a file\n" +
                            "m) go back to Main menu\n" +
                            "q) quit\n")
 
@@ -627,6 +879,36 @@ class MenuTests(unittest.TestCase):
 
         self.assertEqual(expected_result, result)
 
+    def test_search_employee_narrows_list_by_name_prefix(self):
+        """Ensure that typing the start of a name narrows the list down and
+        the number entered picks from the narrowed list
+        """
+        test_employees = ["Test Employee 1", "Test Employee 2", "Other"]
+        for name in test_employees:
+            e = db_manager.Employee.get_or_create(name=name)
+            db_manager.LogEntry.create(
+                employee=e[0],
+                date=datetime.date(2018, 1, 2),
+                task_name='Test task for {}'.format(name),
+                duration=1,
+                notes='Note'
+            )
+
+        captured_output = io.StringIO()
+        sys.stdout = captured_output
+        user_inputs = ['test', 'test employee 2', '1']
+        with patch('builtins.input', side_effect=user_inputs):
+            self.menu.search_employee()
+        sys.stdout = sys.__stdout__
+
+        self.assertEqual(len(self.menu.records), 1)
+        self.assertEqual(self.menu.records[0]['name'], "Test Employee 2")
+        self.assertEqual(captured_output.getvalue(),
+                         "\nSEARCH BY EMPLOYEE\n" +
+                         "1) Other\n2) Test Employee 1\n3) Test Employee 2\n" +
+                         "1) Test Employee 1\n2) Test Employee 2\n" +
+                         "1) Test Employee 2\n")
+
     # search_employee_text
     def test_search_employee_text_finds_matching_employees(self):
         """Ensure that all matching employees are displayed and no non-
@@ -675,6 +957,41 @@ class MenuTests(unittest.TestCase):
         # Do any other test code (e.g., asserts)
         self.assertEqual(expected_output, captured_output.getvalue())
 
+    def test_search_employee_text_suggests_names_for_typos(self):
+        """Ensure that when no name contains the text, the closest names are
+        offered instead and can be selected
+        """
+        for name in ["John Smith", "Jane Smith"]:
+            e = db_manager.Employee.get_or_create(name=name)
+            db_manager.LogEntry.create(
+                employee=e[0],
+                date=datetime.date(2018, 1, 2),
+                task_name='Test task for {}'.format(name),
+                duration=10,
+                notes='Note')
+
+        with patch('builtins.input', side_effect=['Jhon Smith', '1']):
+            with patch('sys.stdout', new=io.StringIO()) as fake_output:
+                result = self.menu.search_employee_text()
+
+        # "Jane Smith" is three typos away
+        self.assertTrue(fake_output.getvalue().endswith(
+            "No names contain 'Jhon Smith', did you mean:\n"
+            "1) John Smith\n"
+        ))
+        self.assertEqual(self.menu.search_filters['employee'], "John Smith")
+        self.assertEqual(result, self.menu.present_next_result)
+
+    def test_search_employee_text_without_matches_returns_search_menu(self):
+        """Ensure that when no name is close to the text the search menu is
+        returned
+        """
+        with patch('builtins.input', side_effect=['Nobody']):
+            with patch('sys.stdout', new=io.StringIO()):
+                result = self.menu.search_employee_text()
+
+        self.assertEqual(result, self.menu.search_entries)
+
     def test_search_employees_returns_correct_menu(self):
         """Ensure that the correct next menu is loaded.
         """
@@ -727,12 +1044,16 @@ class MenuTests(unittest.TestCase):
             )
 
         title = "\nSEARCH EXACT DATE" + "\n"
+        month_rows = ("1) January 2018\n"
+                      "2) March 2018\n"
+                      "3) May 2018\n")
         date_rows = ""
-        for i, date in enumerate(test_log_entry_dates):
+        for i, date in enumerate(test_log_entry_dates[3:]):
             date_string = date.strftime("%Y-%m-%d")
             date_rows += "{}) {}\n".format(i + 1, date_string)
 
         expected_output = (title +
+                           month_rows +
                            date_rows)
 
         # Create a StringIO object to be a capture object
@@ -741,7 +1062,7 @@ class MenuTests(unittest.TestCase):
         sys.stdout = captured_output
         # Do anything that's going to have a print statement
         # (these will be accumulated in the captured_output object)
-        example_input = ['1']
+        example_input = ['3', '1']
         with patch('builtins.input', side_effect=example_input):
             self.menu.search_exact_date()
 
@@ -775,7 +1096,7 @@ class MenuTests(unittest.TestCase):
                 notes='Note'
             )
 
-        example_input = ['1']
+        example_input = ['1', '1']
         with patch('builtins.input', side_effect=example_input):
             result = self.menu.search_exact_date()
 
@@ -783,6 +1104,33 @@ class MenuTests(unittest.TestCase):
 
         self.assertEqual(expected_result, result)
 
+    def test_search_exact_date_lists_dates_of_only_month(self):
+        """Ensure that when every entry is in the same month its dates are
+        listed straight away, and the selected date's entries are found
+        """
+        e = db_manager.Employee.get_or_create(name="Test Employee 1")
+        for day in [3, 9]:
+            db_manager.LogEntry.create(
+                employee=e[0],
+                date=datetime.date(2018, 2, day),
+                task_name='Test task for day {}'.format(day),
+                duration=10,
+                notes='Note'
+            )
+
+        captured_output = io.StringIO()
+        sys.stdout = captured_output
+        with patch('builtins.input', side_effect=['2']):
+            self.menu.search_exact_date()
+        sys.stdout = sys.__stdout__
+
+        self.assertEqual(captured_output.getvalue(),
+                         "\nSEARCH EXACT DATE\n"
+                         "1) 2018-02-03\n"
+                         "2) 2018-02-09\n")
+        self.assertEqual([record['task_name'] for record in self.menu.records],
+                         ['Test task for day 9'])
+
     # search_date_range
     def test_search_date_range_retrieves_corect_db_entries(self):
         """Ensure that all entries whose date in the specified range are
@@ -898,29 +1246,29 @@ class MenuTests(unittest.TestCase):
         ]
         e = db_manager.Employee.get_or_create(name=test_employee[0]['name'])
         # create some log entries
-        for duration in test_log_entry_durations:
+        for i, duration in enumerate(test_log_entry_durations):
             db_manager.LogEntry.create(
                 employee=e[0],
                 date=datetime.date(2018, 1, duration),
-                task_name='Test task of {}m'.format(duration),
+                task_name='Test task {} of {}m'.format(i, duration),
                 duration=duration,
                 notes='Note'
             )
         match_duration = 2
 
         expected_results = []
-        for duration in test_log_entry_durations:
+        for i, duration in enumerate(test_log_entry_durations):
             if duration == match_duration:
                 new_record = OrderedDict([
                     ('name', test_employee[0]['name']),
                     ('date', datetime.date(2018, 1, duration)),
-                    ('task_name', 'Test task of {}m'.format(duration)),
+                    ('task_name', 'Test task {} of {}m'.format(i, duration)),
                     ('duration', duration),
                     ('notes', "Note")
                 ])
                 expected_results.append(new_record)
 
-        user_input = str(match_duration)
+        user_input = [str(match_duration), '']
         with patch('builtins.input', side_effect=user_input):
             self.menu.search_time_spent()
 
@@ -942,17 +1290,17 @@ class MenuTests(unittest.TestCase):
         ]
         e = db_manager.Employee.get_or_create(name=test_employee[0]['name'])
         # create some log entries
-        for duration in test_log_entry_durations:
+        for i, duration in enumerate(test_log_entry_durations):
             db_manager.LogEntry.create(
                 employee=e[0],
                 date=datetime.date(2018, 1, duration),
-                task_name='Test task of {}m'.format(duration),
+                task_name='Test task {} of {}m'.format(i, duration),
                 duration=duration,
                 notes='Note'
             )
         match_duration = 2
 
-        user_input = str(match_duration)
+        user_input = [str(match_duration), '']
         with patch('builtins.input', side_effect=user_input):
             result = self.menu.search_time_spent()
 
@@ -960,6 +1308,66 @@ class MenuTests(unittest.TestCase):
 
         self.assertEqual(expected_result, result)
 
+    def test_search_time_spent_finds_range_and_shows_histogram(self):
+        """Ensure that every entry in the duration range is retrieved,
+        shortest first, and the spread of durations is shown
+        """
+        e = db_manager.Employee.get_or_create(name="Test Employee 1")
+        for duration in [20, 30, 45, 90, 91]:
+            db_manager.LogEntry.create(
+                employee=e[0],
+                date=datetime.date(2018, 1, 1),
+                task_name='Test task of {}m'.format(duration),
+                duration=duration,
+                notes='Note'
+            )
+
+        with patch('builtins.input', side_effect=['90', 'x', '30']):
+            with patch('sys.stdout', new=io.StringIO()) as fake_output:
+                self.menu.search_time_spent()
+
+        self.assertEqual([record['duration'] for record in self.menu.records],
+                         [30, 45, 90])
+        self.assertEqual(self.menu.search_filters,
+                         {'min_duration': 30, 'max_duration': 90})
+        self.assertIn("    30-36     " + "#" * 40 + " 1",
+                      fake_output.getvalue())
+
+    # search_top_tasks
+    def test_search_top_tasks_finds_longest_entries(self):
+        """Ensure that the requested number of longest entries are found,
+        longest first, and that the next menu is present_next_result
+        """
+        e = db_manager.Employee.get_or_create(name="Test Employee 1")
+        for duration in [5, 50, 20, 40, 10]:
+            db_manager.LogEntry.create(
+                employee=e[0],
+                date=datetime.date(2018, 5, 1),
+                task_name='Task taking {}'.format(duration),
+                duration=duration,
+                notes='Note'
+            )
+
+        with patch('builtins.input', side_effect=['x', '3']):
+            with patch('sys.stdout', new=io.StringIO()):
+                result = self.menu.search_top_tasks()
+
+        self.assertEqual([record['duration'] for record in self.menu.records],
+                         [50, 40, 20])
+        self.assertEqual(self.menu.search_filters,
+                         {'top': 3, 'top_by': 'duration'})
+        self.assertEqual(result, self.menu.present_next_result)
+
+    def test_search_top_tasks_without_entries_returns_search_menu(self):
+        """Ensure that when there are no entries the search menu is
+        returned
+        """
+        with patch('builtins.input', side_effect=['']):
+            with patch('sys.stdout', new=io.StringIO()):
+                result = self.menu.search_top_tasks()
+
+        self.assertEqual(result, self.menu.search_entries)
+
     # search_text_search
     def test_search_text_search_retrieves_all_matching_records(self):
         """Ensure that all records matching the specified string (and only)
@@ -982,6 +1390,23 @@ class MenuTests(unittest.TestCase):
 
         self.assertEqual(expected_results, self.menu.records)
 
+    def test_search_text_search_honours_case_sensitive_option(self):
+        """Ensure that the text search only matches text with the same case
+        when the 'case sensitive search' option is set.
+        """
+        self.create_mixed_test_data()
+
+        with patch('builtins.input', side_effect=['ALPHA']):
+            self.menu.search_text_search()
+        self.assertEqual(len(self.menu.records), 1)
+
+        self.menu.OPTIONS['case sensitive search'] = True
+        self.menu.records = []
+        with patch('builtins.input', side_effect=['ALPHA']):
+            returned_menu = self.menu.search_text_search()
+        self.assertEqual(self.menu.records, [])
+        self.assertEqual(returned_menu, self.menu.search_entries)
+
     def test_search_test_search_returns_correct_menu(self):
         """Ensure that the correct next menu is loaded.
         """
@@ -996,6 +1421,36 @@ class MenuTests(unittest.TestCase):
 
         self.assertEqual(expected_result, result)
 
+    # search_combined
+    def test_search_combined_retrieves_entries_matching_all_criteria(self):
+        """Ensure that only the entries matching every criterion entered are
+        retrieved, and that blank criteria are ignored"""
+        self.create_mixed_test_data()
+        user_inputs = [
+            'Test Employee 1 foo',  # employee
+            '2018-02-01',           # start date
+            '',                     # end date
+            '',                     # minimum duration
+            '5',                    # maximum duration
+            'bravo',                # text
+        ]
+        with patch('builtins.input', side_effect=user_inputs):
+            returned_menu = self.menu.search_combined()
+
+        self.assertEqual(len(self.menu.records), 1)
+        self.assertEqual(self.menu.records[0]['date'],
+                         datetime.date(2018, 3, 4))
+        self.assertEqual(returned_menu, self.menu.present_next_result)
+
+    def test_search_combined_with_no_matches_returns_search_menu(self):
+        """Ensure that the search menu is loaded when nothing matches"""
+        self.create_mixed_test_data()
+        user_inputs = ['', '', '', '3', '', 'alpha']
+        with patch('builtins.input', side_effect=user_inputs):
+            returned_menu = self.menu.search_combined()
+
+        self.assertEqual(returned_menu, self.menu.search_entries)
+
     # edit_record
     def test_edit_record_edits_the_correct_record(self):
         """Ensure that the record retrieved from the DB corresponds to the
@@ -1088,6 +1543,37 @@ class MenuTests(unittest.TestCase):
 
         self.assertEqual(result, expected_result)
 
+    def test_edit_record_reports_edit_that_duplicates_an_entry(self):
+        """Ensure that editing an entry to match another entry exactly is
+        reported, leaves both entries as they were and returns to the main
+        menu
+        """
+        dataset = self.create_mixed_test_data()
+        test_log_entries = dataset['test_log_entries']
+        self.menu.records = test_log_entries
+        duplicate = test_log_entries[0]
+        # select the second record, then enter the first one's values
+        user_inputs = [
+            2,
+            duplicate['name'],
+            duplicate['date'].isoformat(),
+            duplicate['task_name'],
+            duplicate['duration'],
+            duplicate['notes'],
+        ]
+        employees = db_manager.Employee.select().count()
+
+        with patch('builtins.input', side_effect=user_inputs):
+            with patch('sys.stdout', new=io.StringIO()) as fake_output:
+                returned_menu = self.menu.edit_record()
+
+        self.assertIn("That entry is already in the work log",
+                      fake_output.getvalue())
+        self.assertEqual(returned_menu, self.menu.main_menu)
+        for entry in test_log_entries[:2]:
+            self.assertEqual(len(self.base_query(entry)), 1)
+        self.assertEqual(db_manager.Employee.select().count(), employees)
+
     # edit_current_record
     def test_edit_current_record_edits_the_correct_record(self):
         """Ensure that the record retrieved from the DB corresponds to the
@@ -1178,6 +1664,36 @@ class MenuTests(unittest.TestCase):
 
         self.assertEqual(result, expected_result)
 
+    def test_edit_current_record_reports_edit_that_duplicates_an_entry(self):
+        """Ensure that editing an entry to match another entry exactly is
+        reported, leaves both entries as they were and returns to the main
+        menu
+        """
+        dataset = self.create_mixed_test_data()
+        test_log_entries = dataset['test_log_entries']
+        self.menu.records = test_log_entries
+        self.menu.current_record = 1
+        duplicate = test_log_entries[0]
+        user_inputs = [
+            duplicate['name'],
+            duplicate['date'].isoformat(),
+            duplicate['task_name'],
+            duplicate['duration'],
+            duplicate['notes'],
+        ]
+        employees = db_manager.Employee.select().count()
+
+        with patch('builtins.input', side_effect=user_inputs):
+            with patch('sys.stdout', new=io.StringIO()) as fake_output:
+                returned_menu = self.menu.edit_current_record()
+
+        self.assertIn("That entry is already in the work log",
+                      fake_output.getvalue())
+        self.assertEqual(returned_menu, self.menu.main_menu)
+        for entry in test_log_entries[:2]:
+            self.assertEqual(len(self.base_query(entry)), 1)
+        self.assertEqual(db_manager.Employee.select().count(), employees)
+
     # select_detail
     def test_select_detail_displays_the_correct_record(self):
         """Ensure that the record chosen by the user is the record that
@@ -1217,6 +1733,66 @@ class MenuTests(unittest.TestCase):
 
         self.assertEqual(result, expected_result)
 
+    # export_results
+    def test_export_results_writes_search_results_to_file(self):
+        """Ensure that the export menu writes the entries matching the
+        current search to a file in the chosen format and returns
+        present_results
+        """
+        self.create_mixed_test_data()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        file_path = os.path.join(directory, 'export.csv')
+        search_inputs = ['Test Employee 1 foo', '', '', '', '', '']
+        with patch('builtins.input', side_effect=search_inputs):
+            self.menu.search_combined()
+
+        with patch('builtins.input', side_effect=['c', file_path]):
+            with patch('sys.stdout', new=io.StringIO()) as fake_output:
+                returned_menu = self.menu.export_results()
+
+        with open(file_path, newline='') as export_file:
+            lines = export_file.read().splitlines()
+        self.assertEqual(lines[0], "name,date,task_name,duration,notes")
+        self.assertEqual(len(lines) - 1, len(self.menu.records))
+        self.assertIn("Exported {} entries".format(len(self.menu.records)),
+                      fake_output.getvalue())
+        self.assertEqual(returned_menu, self.menu.present_results)
+
+    def test_export_results_writes_top_tasks_as_shown(self):
+        """Ensure that exporting the top tasks writes exactly the entries
+        shown, in the order shown, even when others tie with the last one
+        """
+        e = db_manager.Employee.get_or_create(name="Test Employee 1")
+        for number, duration in enumerate([5, 50, 20, 40, 20, 10]):
+            db_manager.LogEntry.create(
+                employee=e[0],
+                date=datetime.date(2018, 5, number + 1),
+                task_name='Task taking {}'.format(duration),
+                duration=duration,
+                notes='Note {}'.format(number)
+            )
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        file_path = os.path.join(directory, 'export.csv')
+        with patch('builtins.input', side_effect=['3']):
+            with patch('sys.stdout', new=io.StringIO()):
+                self.menu.search_top_tasks()
+
+        with patch('builtins.input', side_effect=['c', file_path]):
+            with patch('sys.stdout', new=io.StringIO()):
+                self.menu.export_results()
+
+        with open(file_path, newline='') as export_file:
+            rows = list(csv.DictReader(export_file))
+        self.assertEqual(
+            [(row['date'], row['duration']) for row in rows],
+            [(str(record['date']), str(record['duration']))
+             for record in self.menu.records]
+        )
+        self.assertEqual([row['duration'] for row in rows],
+                         ['50', '40', '20'])
+
     # delete_record
     def test_delete_record_deletes_the_specified_record(self):
         """Ensure the specified record is no longer available after deletion
@@ -1381,6 +1957,27 @@ class MenuTests(unittest.TestCase):
 
         self.assertEqual(expected_result, result)
 
+    def test_display_entry_reads_long_notes_only_when_verbose(self):
+        """Makes sure that a listed entry with long notes shows the start
+        of them in the short form and all of them in the verbose form"""
+        notes = "Long notes. " * 200
+        db_manager.DBManager().add_entry({
+            'name': 'Test Employee',
+            'date': datetime.date(2018, 5, 1),
+            'task_name': 'Task with long notes',
+            'duration': 10,
+            'notes': notes,
+        })
+        entry = db_manager.DBManager().view_everything()[0]
+
+        short_form = self.menu.display_entry(entry=entry, return_only=True)
+        with patch('sys.stdout', new=io.StringIO()) as fake_output:
+            self.menu.display_entry(entry=entry, verbose=True)
+
+        preview = notes[:settings.NOTES_PREVIEW_LENGTH]
+        self.assertTrue(short_form.endswith("| {}...".format(preview)))
+        self.assertIn(notes, fake_output.getvalue())
+
     # previous_result
     def test_previous_result_decrements_current_record(self):
         """Make sure that this method reduces the current_record by 1"""
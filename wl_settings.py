@@ -1,6 +1,38 @@
 LIVE_DATABASE_NAME = 'work_log.db'
 UNITTEST_DATABASE_NAME = 'unittest.db'
 DATABASE_NAME = LIVE_DATABASE_NAME
+# 'file' works on DATABASE_NAME directly. 'memory' loads DATABASE_NAME into an
+# in-memory database at start and writes it back every FLUSH_INTERVAL seconds
+# (as entries are written) and at exit -- faster for batch jobs, but a crash
+# loses whatever was written since the last flush (see
+# db_manager.MemoryDatabase)
+DATABASE_MODE = 'file'
+FLUSH_INTERVAL = 60  # seconds
+
+# CSV files bigger than this (in bytes) are imported by a pool of processes
+# (see csv_manager.CsvManager.import_file_parallel)
+PARALLEL_IMPORT_SIZE = 64 * 1024 * 1024
+
+# online backups (see DBManager.backup)
+BACKUP_DIRECTORY = 'backups'
+BACKUP_COUNT = 5  # number of backups kept, oldest are deleted first
+BACKUP_PAGES_PER_STEP = 100
+BACKUP_STEP_PAUSE = 0.01  # seconds to let writers in between steps
+
+# database maintenance (see db_maintenance.py)
+ANALYZE_CHANGE_RATIO = 0.1  # re-analyze once the entries change by 10%
+VACUUM_FREE_RATIO = 0.1  # vacuum once 10% of the database's pages are free
+VACUUM_MAX_PAGES = 10000  # pages freed per incremental vacuum
+WAL_CHECKPOINT_SIZE = 4 * 1024 * 1024  # bytes
+
+# schema upgrades (see migrations.py) backfill this many rows per transaction
+MIGRATION_CHUNK_SIZE = 10000
+
+# notes longer than this (in characters) are stored zlib compressed in a
+# table of their own, and entries are listed with just their first
+# NOTES_PREVIEW_LENGTH characters (see db_manager.NoteText)
+NOTES_COMPRESS_SIZE = 1024
+NOTES_PREVIEW_LENGTH = 100
 
 HEADERS = {
         'user': 'name',
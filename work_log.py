@@ -4,13 +4,17 @@
 Record work activities and store to a sqlite database
 
 Created: 2018
-Last Update: 2018-06-05
+Last Update: 2026-10-19
 Author: Alex Koumparos
 """
 import datetime
+import os
 import re
 
-# from csv_manager import CsvManager
+from peewee import IntegrityError
+
+from csv_manager import CsvManager
+from db_maintenance import DBMaintenance, report_lines
 from db_manager import DBManager
 import wl_settings as settings
 
@@ -41,6 +45,8 @@ class Menu:
         }
         self.current_record = 0
         self.current_page_start = 0
+        # the filters (see DBManager.search) for the current search results
+        self.search_filters = {}
         if load_menu:
             menu = self.main_menu()
             while not self.quit:
@@ -57,6 +63,10 @@ class Menu:
                   'function': self.add_entry},
             's': {'text': 'Search in existing entries',
                   'function': self.search_entries},
+            'i': {'text': 'Import entries from a CSV file',
+                  'function': self.import_entries},
+            'r': {'text': 'Reports',
+                  'function': self.reports},
             'o': {'text': 'Options',
                   'function': self.options},
             'q': {'text': 'Quit program',
@@ -119,14 +129,80 @@ class Menu:
                 settings.HEADERS['duration']: time_spent,
                 settings.HEADERS['notes']: notes
             }
-            dbm.add_entry(file_data)
+            if not dbm.add_entry(file_data):
+                print("That entry is already in the work log")
             return self.main_menu
 
+    def import_entries(self):
+        """This is the menu where the user can import entries from a CSV
+        file (with a header row naming the columns in settings.HEADERS)
+        """
+        print("\nIMPORT ENTRIES")
+        file_path = input("Enter the path of the CSV file > ")
+        # dates that are valid in more than one format (e.g., 01/02/2018)
+        # are read in the user's preferred format
+        date_formats = [self.OPTIONS['date format']]
+        for date_format in settings.DATE_FORMATS.values():
+            if date_format not in date_formats:
+                date_formats.append(date_format)
+        csv_manager = CsvManager(
+            date_formats=date_formats,
+            allow_future_dates=self.OPTIONS['allow future dates'],
+            earliest_date=self.OPTIONS['earliest allowed date'].date()
+        )
+        try:
+            if os.path.getsize(file_path) > settings.PARALLEL_IMPORT_SIZE:
+                result = csv_manager.import_file_parallel(file_path)
+            else:
+                result = csv_manager.import_file(file_path)
+        except (OSError, ValueError) as err:
+            print("Unable to import {}: {}".format(file_path, err))
+            return self.main_menu
+        print("Read {} rows and added {} new entries".format(
+            result['rows'], result['written']
+        ))
+        if result['errors']:
+            print("{} rows could not be imported:".format(
+                len(result['errors'])
+            ))
+            for line_number, error in result['errors'][:10]:
+                print("line {}: {}".format(line_number, error))
+        return self.main_menu
+
     def options(self):
-        """This is the menu where the user can specify user-configurable
-        options
+        """This is the menu where the user selects which user-configurable
+        option to change and then the method returns the function for that
+        option.
+        """
+        inputs = {
+            'd': {'text': 'display Date format',
+                  'function': self.options_date_format},
+            'c': {'text': 'Case sensitive search',
+                  'function': self.options_case_sensitive_search},
+            'k': {'text': 'bacK up the database',
+                  'function': self.options_backup},
+            'm': {'text': 'database Maintenance',
+                  'function': self.options_maintenance},
+            'e': {'text': 'mErge employees',
+                  'function': self.options_merge_employees},
+            'b': {'text': 'Back to main menu',
+                  'function': self.main_menu}
+        }
+        while True:
+            print("\nOPTIONS")
+            print("What would you like to change?")
+            for key, value in inputs.items():
+                print("{}) {}".format(key, value['text']))
+            user_entry = input("> ").lower()
+
+            if user_entry not in inputs.keys():
+                continue
+            return inputs[user_entry]['function']
+
+    def options_date_format(self):
+        """This is the menu where the user can choose the display date format
         """
-        print('OPTIONS')
+        print('DATE FORMAT')
 
         print("Choose a display date format")
         menu_choices = list(settings.DATE_FORMATS.keys())
@@ -145,6 +221,190 @@ class Menu:
 
         return self.main_menu
 
+    def options_case_sensitive_search(self):
+        """This is the menu where the user can turn case sensitive searching
+        on or off
+        """
+        print('CASE SENSITIVE SEARCH')
+
+        if self.OPTIONS['case sensitive search']:
+            print("Text searches are currently case sensitive")
+        else:
+            print("Text searches are currently case insensitive")
+        input_text = input("Make text searches case sensitive? (y/n) ")
+        if input_text.lower() in ['y', 'n']:
+            self.OPTIONS['case sensitive search'] = input_text.lower() == 'y'
+            print('going back to main menu')
+        else:
+            print("Invalid entry, returning to main menu")
+
+        return self.main_menu
+
+    def options_backup(self):
+        """This is the menu where the user can back up the database while
+        it's in use
+        """
+        print('BACK UP DATABASE')
+
+        def show_progress(pages_done, total_pages):
+            print("Backed up {} of {} pages".format(pages_done, total_pages),
+                  end='\r')
+
+        dbm = DBManager()
+        backup_path = dbm.backup(progress=show_progress)
+        print("\nDatabase backed up to {}".format(backup_path))
+        print('going back to main menu')
+
+        return self.main_menu
+
+    def options_maintenance(self):
+        """This is the menu where the user can run the database maintenance
+        (see db_maintenance.py) that's due
+        """
+        print('DATABASE MAINTENANCE')
+        maintenance = DBMaintenance()
+        for line in report_lines(maintenance.run()):
+            print(line)
+        print('going back to main menu')
+
+        return self.main_menu
+
+    def reports(self):
+        """This is the reports menu. The user selects which report to see.
+        """
+        inputs = {
+            'c': {'text': 'Cumulative minutes per employee',
+                  'function': self.report_running_totals},
+            'm': {'text': 'Moving average minutes per day',
+                  'function': self.report_moving_averages},
+            't': {'text': 'Task rankings by time spent',
+                  'function': self.report_task_rankings},
+            'q': {'text': 'Quantiles of time spent per employee',
+                  'function': self.report_duration_quantiles},
+            'b': {'text': 'Back to main menu',
+                  'function': self.main_menu}
+        }
+        while True:
+            print("\nREPORTS")
+            print("Which report would you like to see?")
+            for key, value in inputs.items():
+                print("{}) {}".format(key, value['text']))
+            user_entry = input("> ").lower()
+
+            if user_entry not in inputs.keys():
+                continue
+            return inputs[user_entry]['function']
+
+    def report_running_totals(self):
+        """This is the report of each employee's minutes per day and
+        cumulative minutes over a date range
+        """
+        print('CUMULATIVE MINUTES PER EMPLOYEE')
+        filters = self.report_filters()
+        dbm = DBManager()
+        rows = dbm.running_totals(filters)
+        if not rows:
+            print("\nNo entries, returning to reports menu")
+            return self.reports
+        print("{:<20} {:<10} {:>8} {:>8}".format("Employee", "Date",
+                                                 "Minutes", "Total"))
+        for row in rows:
+            print("{:<20} {:<10} {:>8} {:>8}".format(
+                row['name'], self.date_to_string(row['date']),
+                row['minutes'], row['running total']
+            ))
+        return self.reports
+
+    def report_moving_averages(self):
+        """This is the report of each employee's average minutes per day
+        over the previous week, over a date range
+        """
+        print('MOVING AVERAGE MINUTES PER DAY (7 DAYS)')
+        filters = self.report_filters()
+        dbm = DBManager()
+        rows = dbm.moving_averages(filters, days=7)
+        if not rows:
+            print("\nNo entries, returning to reports menu")
+            return self.reports
+        print("{:<20} {:<10} {:>8} {:>8}".format("Employee", "Date",
+                                                 "Minutes", "Average"))
+        for row in rows:
+            print("{:<20} {:<10} {:>8} {:>8.1f}".format(
+                row['name'], self.date_to_string(row['date']),
+                row['minutes'], row['moving average']
+            ))
+        return self.reports
+
+    def report_task_rankings(self):
+        """This is the report of the tasks each employee spent the most time
+        on over a date range, or of every task if no employee is given
+        """
+        print('TASK RANKINGS BY TIME SPENT')
+        filters = self.report_filters()
+        dbm = DBManager()
+        rows = dbm.task_rankings(filters,
+                                 per_employee='employee' in filters)
+        if not rows:
+            print("\nNo entries, returning to reports menu")
+            return self.reports
+        print("{:<20} {:>4} {:<30} {:>8}".format("Employee", "Rank", "Task",
+                                                 "Minutes"))
+        for row in rows:
+            print("{:<20} {:>4} {:<30} {:>8}".format(
+                row.get('name', 'everyone'), row['rank'], row['task_name'],
+                row['minutes']
+            ))
+        return self.reports
+
+    def report_duration_quantiles(self):
+        """This is the report of the typical (median) and longest (90th and
+        95th percentile) time each employee spends on a task, estimated from
+        the duration histograms
+        """
+        print('QUANTILES OF TIME SPENT PER EMPLOYEE')
+        dbm = DBManager()
+        rows = dbm.employee_duration_quantiles(quantiles=(0.5, 0.9, 0.95))
+        if not rows:
+            print("\nNo entries, returning to reports menu")
+            return self.reports
+        print("{:<20} {:>8} {:>8} {:>8}".format("Employee", "Median",
+                                                "90%", "95%"))
+        for row in rows:
+            print("{:<20} {:>8.0f} {:>8.0f} {:>8.0f}".format(
+                row['name'], row[0.5], row[0.9], row[0.95]
+            ))
+        return self.reports
+
+    def options_merge_employees(self):
+        """This is the menu where the user can merge employees entered under
+        different spellings of the same name
+        """
+        print('MERGE EMPLOYEES')
+        print("Enter the names to merge, one per line (blank line to finish)")
+        src_names = []
+        while True:
+            input_text = input("> ")
+            if not input_text:
+                break
+            src_names.append(input_text)
+        if not src_names:
+            print("No names entered, returning to main menu")
+            return self.main_menu
+        print("Enter the name to merge them into")
+        target_name = ""
+        while not target_name:
+            target_name = input("> ")
+        dbm = DBManager()
+        result = dbm.merge_employees(src_names, target_name)
+        print("Moved {} entries to {} ({} duplicates removed), "
+              "removed {} employees".format(result['entries moved'],
+                                            target_name,
+                                            result['duplicates removed'],
+                                            result['employees removed']))
+        print('going back to main menu')
+
+        return self.main_menu
+
     def search_entries(self):
         """This is the search menu. The user selects how they want to search.
         """
@@ -159,8 +419,12 @@ class Menu:
                   'function': self.search_date_range},
             't': {'text': 'Time spent',
                   'function': self.search_time_spent},
+            'o': {'text': 'tOp tasks by time spent',
+                  'function': self.search_top_tasks},
             's': {'text': 'text Search',
                   'function': self.search_text_search},
+            'c': {'text': 'Combined search',
+                  'function': self.search_combined},
             'b': {'text': 'Back to main menu',
                   'function': self.main_menu}
         }
@@ -194,6 +458,8 @@ class Menu:
                   'function': self.edit_record},
             'd': {'text': 'Delete',
                   'function': self.delete_record},
+            'x': {'text': 'eXport results to a file',
+                  'function': self.export_results},
             'm': {'text': 'go back to Main menu',
                   'function': self.main_menu},
             'q': {'text': 'quit',
@@ -264,42 +530,47 @@ class Menu:
     # Specific Search Menus
     # .....................
     def search_employee(self):
-        """This is the menu where the user is given a list of all employees
-        who have entries, and can select a particular employee to see
-        all their entries
+        """This is the menu where the user picks an employee who has entries
+        from a list, narrowing the list down by typing the start of their
+        name, and then sees all of that employee's entries
         """
         print("\nSEARCH BY EMPLOYEE")
         # load the db manager
         dbm = DBManager()
-        employee_names = dbm.view_employees()
-        for i, value in enumerate(employee_names):
-            print("{}) {}".format(i + 1, value['name']))
+        cursor = dbm.employee_name_trie().cursor()
         selected_employee = None
         while selected_employee is None:
-            user_input = input("> ")
-            # perform input validation
+            employee_names = cursor.matches()
+            if len(employee_names) == 0:
+                print("No employee names start with '{}'".format(
+                    cursor.prefix
+                ))
+            for i, value in enumerate(employee_names):
+                print("{}) {}".format(i + 1, value))
+            user_input = input("Enter a number, or the start of a name > ")
+            # perform input validation: a number picks from the list and
+            # anything else narrows the list down
             try:
                 user_input = int(user_input) - 1
             except ValueError:
-                print("Invalid value, try again")
-                continue
-            if user_input < 0:
-                print("Value out of range. Try again.")
+                cursor.move_to(user_input)
                 continue
-            try:
-                selected_employee = employee_names[user_input]['name']
-            except IndexError:
+            if user_input < 0 or user_input >= len(employee_names):
                 print("Value out of range. Try again.")
                 continue
-            # when an employee is selected, show all the entries with that e'ee
-            matching_records = dbm.view_everything(employee=selected_employee)
+            selected_employee = employee_names[user_input]
+        # when an employee is selected, show all the entries with that e'ee
+        matching_records = dbm.view_everything(employee=selected_employee)
         self.records = matching_records
+        self.search_filters = {'employee': selected_employee,
+                               'case_sensitive': True}
         self.current_record = 0
         return self.present_next_result
 
     def search_employee_text(self):
         """This is the menu where the user enters a text string and is presented
-        with all employee names containing that string
+        with all employee names containing that string, or if there are none,
+        the names closest to it
         """
         print('FIND EMPLOYEE NAME USING TEXT STRING')
         print("Enter the text string to search on")
@@ -307,7 +578,17 @@ class Menu:
         text_string = input_text
         # load db
         dbm = DBManager()
-        employee_names = dbm.view_names_with_text(text_string)
+        employee_names = dbm.view_names_with_text(
+            text_string,
+            case_sensitive=self.OPTIONS['case sensitive search']
+        )
+        if not employee_names:
+            # allow for typos
+            employee_names = dbm.view_names_like(text_string)
+            if not employee_names:
+                print("\nNo matches, returning to search menu")
+                return self.search_entries
+            print("No names contain '{}', did you mean:".format(text_string))
         for i, value in enumerate(employee_names):
             print("{}) {}".format(i + 1, value['name']))
         selected_employee = None
@@ -330,6 +611,8 @@ class Menu:
             # when an employee is selected, show all the entries with that e'ee
             matching_records = dbm.view_everything(employee=selected_employee)
         self.records = matching_records
+        self.search_filters = {'employee': selected_employee,
+                               'case_sensitive': True}
         self.current_record = 0
         return self.present_next_result
 
@@ -340,7 +623,40 @@ class Menu:
         print("\nSEARCH EXACT DATE")
         # load the db manager
         dbm = DBManager()
-        date_records = dbm.view_dates()
+        # with more than a month of entries, pick the month first so that
+        # only that month's dates are listed
+        month_records = dbm.view_months()
+        selected_month = None
+        if len(month_records) > 1:
+            for i, value in enumerate(month_records):
+                print("{}) {}".format(i + 1,
+                                      value['month'].strftime("%B %Y")))
+        elif month_records:
+            selected_month = month_records[0]['month']
+        while selected_month is None and month_records:
+            user_input = input("> ")
+            # perform input validation
+            try:
+                user_input = int(user_input) - 1
+            except ValueError:
+                print("Invalid value, try again")
+                continue
+            if user_input < 0:
+                print("Value out of range. Try again.")
+                continue
+            try:
+                selected_month = month_records[user_input]['month']
+            except IndexError:
+                print("Value out of range. Try again.")
+                continue
+        if selected_month is None:
+            date_records = []
+        else:
+            # the day before the first of the next month
+            next_month = selected_month + datetime.timedelta(days=31)
+            month_end = next_month.replace(day=1) - datetime.timedelta(days=1)
+            date_records = dbm.view_dates(start_date=selected_month,
+                                          end_date=month_end)
         for i, value in enumerate(date_records):
             value = self.date_to_string(value['date'])
             print("{}) {}".format(i + 1, value))
@@ -365,6 +681,8 @@ class Menu:
             # when a date is selected, show all the entries with that date
             matching_records = dbm.view_entries_for_date(selected_date)
         self.records = matching_records
+        self.search_filters = {'start_date': selected_date,
+                               'end_date': selected_date}
         self.current_record = 0
         return self.present_next_result
 
@@ -411,30 +729,87 @@ class Menu:
             print("\nNo matches, returning to search menu")
             return self.search_entries
         self.records = matching_records
+        self.search_filters = {'start_date': start_date,
+                               'end_date': end_date}
         self.current_record = 0
         return self.present_next_result
 
     def search_time_spent(self):
-        """This is the menu where the user enters the number of minutes a task
-        took and be able to choose one to see entries from
+        """This is the menu where the user enters a range of minutes (or a
+        single number of minutes) a task took, is shown how the matching
+        entries are spread over that range and can choose one to see
+        entries from
         """
         print('SEARCH BY TIME SPENT')
-        print("Time spent")
-        time_spent = None
-        while time_spent is None:
+        print("Minimum time spent")
+        min_duration = None
+        while min_duration is None:
             input_text = input("Enter a whole number of minutes (rounded) ")
             try:
-                time_spent = int(input_text)
+                min_duration = int(input_text)
             except ValueError:
                 print("Invalid value")
                 continue
+        print("Maximum time spent (leave blank for exactly {})".format(
+            min_duration
+        ))
+        max_duration = None
+        while max_duration is None:
+            input_text = input("Enter a whole number of minutes (rounded) ")
+            if not input_text:
+                max_duration = min_duration
+                continue
+            try:
+                max_duration = int(input_text)
+            except ValueError:
+                print("Invalid value")
+                continue
+        if max_duration < min_duration:
+            min_duration, max_duration = max_duration, min_duration
         # load db
         dbm = DBManager()
-        matching_records = dbm.view_entries_for_duration(time_spent)
+        matching_records, histogram = dbm.view_entries_for_duration_range(
+            min_duration, max_duration
+        )
         if len(matching_records) == 0:
             print("\nNo matches, returning to search menu")
             return self.search_entries
+        if len(histogram) > 1:
+            self.display_histogram(histogram)
         self.records = matching_records
+        self.search_filters = {'min_duration': min_duration,
+                               'max_duration': max_duration}
+        self.current_record = 0
+        return self.present_next_result
+
+    def search_top_tasks(self):
+        """This is the menu where the user enters how many entries they want
+        to see and is presented with that many of the longest entries
+        """
+        print('TOP TASKS BY TIME SPENT')
+        print("How many entries? (leave blank for 10)")
+        count = None
+        while count is None:
+            input_text = input("> ")
+            if not input_text:
+                count = 10
+                continue
+            try:
+                count = int(input_text)
+            except ValueError:
+                print("Invalid value")
+                continue
+            if count < 1:
+                print("Value out of range. Try again.")
+                count = None
+        # load db
+        dbm = DBManager()
+        matching_records = dbm.top_entries(count, by='duration')
+        if len(matching_records) == 0:
+            print("\nNo matches, returning to search menu")
+            return self.search_entries
+        self.records = matching_records
+        self.search_filters = {'top': count, 'top_by': 'duration'}
         self.current_record = 0
         return self.present_next_result
 
@@ -448,11 +823,58 @@ class Menu:
         text_string = input_text
         # load db
         dbm = DBManager()
-        matching_records = dbm.view_entries_with_text(text_string)
+        matching_records = dbm.view_entries_with_text(
+            text_string,
+            case_sensitive=self.OPTIONS['case sensitive search']
+        )
         if len(matching_records) == 0:
             print("\nNo matches, returning to search menu")
             return self.search_entries
         self.records = matching_records
+        self.search_filters = {
+            'text': text_string,
+            'case_sensitive': self.OPTIONS['case sensitive search'],
+        }
+        self.current_record = 0
+        return self.present_next_result
+
+    def search_combined(self):
+        """This is the menu where the user can search on any combination of
+        employee name, date range, time spent range and text string, and is
+        presented with the entries that match all of them
+        """
+        print('COMBINED SEARCH')
+        print("Leave a criterion blank to not search on it")
+        filters = self.employee_date_filters()
+        duration_prompts = [
+            ('min_duration', "Minimum time spent"),
+            ('max_duration', "Maximum time spent"),
+        ]
+        for key, prompt in duration_prompts:
+            print(prompt)
+            while key not in filters:
+                input_text = input("Enter a whole number of minutes "
+                                   "(rounded) ")
+                if not input_text:
+                    filters[key] = None
+                    continue
+                try:
+                    filters[key] = int(input_text)
+                except ValueError:
+                    print("Invalid value")
+                    continue
+        print("Text string")
+        input_text = input("> ")
+        if input_text:
+            filters['text'] = input_text
+        # load db
+        dbm = DBManager()
+        matching_records = dbm.search(filters)
+        if len(matching_records) == 0:
+            print("\nNo matches, returning to search menu")
+            return self.search_entries
+        self.records = matching_records
+        self.search_filters = filters
         self.current_record = 0
         return self.present_next_result
 
@@ -503,7 +925,10 @@ class Menu:
             'duration': time_spent,
             'notes': notes
         }
-        dbm.edit_entry(record, new_values)
+        try:
+            dbm.edit_entry(record, new_values)
+        except IntegrityError:
+            print("That entry is already in the work log")
         return self.main_menu
 
     def edit_current_record(self):
@@ -523,6 +948,7 @@ class Menu:
                 continue
             else:
                 date = user_entry[1]
+                date_string = self.date_to_string(date, target='file')
         print("New name of the Task")
         input_text = input("Enter the name of the task > ")
         task_name = input_text
@@ -542,12 +968,15 @@ class Menu:
         dbm = DBManager()
         new_values = {
             'name': username,
-            'date': date,
+            'date': date_string,
             'task_name': task_name,
             'duration': time_spent,
             'notes': notes
         }
-        dbm.edit_entry(record, new_values)
+        try:
+            dbm.edit_entry(record, new_values)
+        except IntegrityError:
+            print("That entry is already in the work log")
         return self.main_menu
 
     def select_detail(self):
@@ -558,6 +987,33 @@ class Menu:
         self.current_record = match_index
         return self.present_next_result
 
+    def export_results(self):
+        """This is the menu where the user can save the search results to a
+        CSV or JSON Lines file
+        """
+        print("export results")
+        formats = {
+            'c': {'text': 'CSV', 'format': 'csv'},
+            'j': {'text': 'JSON Lines', 'format': 'jsonl'},
+        }
+        for key, value in formats.items():
+            print('{}) {}'.format(key, value['text']))
+        user_entry = None
+        while user_entry not in formats.keys():
+            user_entry = input("> ").lower()
+        export_format = formats[user_entry]['format']
+        file_path = input("Enter the path of the file to write > ")
+        # load db
+        dbm = DBManager()
+        try:
+            written = dbm.export(self.search_filters, export_format,
+                                 file_path)
+        except OSError as err:
+            print("Unable to write {}: {}".format(file_path, err))
+        else:
+            print("Exported {} entries to {}".format(written, file_path))
+        return self.present_results
+
     def delete_record(self):
         print("delete record")
         print('enter the record number to delete')
@@ -590,6 +1046,9 @@ class Menu:
         - task name
         - time taken
         - any notes
+
+        The short form shows just the start of long notes, so they are only
+        read in full (see DBManager.load_notes) for the verbose form.
         """
         username = entry[settings.HEADERS['user']]
         date_object = entry[settings.HEADERS['date']]
@@ -598,6 +1057,7 @@ class Menu:
         time_taken = entry[settings.HEADERS['duration']]
         notes = entry[settings.HEADERS['notes']]
         if verbose:
+            notes = DBManager().load_notes(notes)
             line0 = username
             print(line0)
             line1 = "{}: {}".format(date, task_name)
@@ -675,13 +1135,66 @@ class Menu:
                     return (error_text.format(**error_args), None)
             return (None, naive_datetime)
 
-    def date_entry(self):
+    def report_filters(self):
+        """This helper function asks for the employee name and date range to
+        report on, any of which can be left blank, and returns them as
+        filters (see DBManager.search)
+        """
+        print("Leave a criterion blank to report on everything")
+        return self.employee_date_filters()
+
+    def employee_date_filters(self):
+        """This helper function asks for an employee name and date range,
+        any of which can be left blank, and returns them as filters (see
+        DBManager.search), along with the case sensitive search option
+        """
+        filters = {
+            'case_sensitive': self.OPTIONS['case sensitive search'],
+        }
+        print("Employee name")
+        input_text = input("> ")
+        if input_text:
+            filters['employee'] = input_text
+        date_prompts = [
+            ('start_date', "Start Date:"),
+            ('end_date', "End Date:"),
+        ]
+        for key, prompt in date_prompts:
+            while key not in filters:
+                print(prompt)
+                user_entry = self.date_entry(optional=True)
+                if user_entry[0] is not None:  # error
+                    print(user_entry[0])
+                    continue
+                else:
+                    filters[key] = user_entry[1]
+        return filters
+
+    def display_histogram(self, histogram, width=40):
+        """This helper function prints a bar chart of a duration histogram
+        (see DBManager.view_entries_for_duration_range), with the longest
+        bar `width` characters long
+        """
+        largest = max(bucket['count'] for bucket in histogram)
+        for bucket in histogram:
+            bar = "#" * -(-bucket['count'] * width // largest)
+            print("{:>6}-{:<6} {:<{width}} {}".format(
+                bucket['from'], bucket['to'], bar, bucket['count'],
+                width=width
+            ))
+
+    def date_entry(self, optional=False):
         """This helper function asks for a date input in the user's preferred
         format and then returns that date as a naive datetime object
+
+        If `optional` is True the user can leave the date blank, in which
+        case the date returned is None
         """
         date_format = self.OPTIONS['date format']
         input_text = "Please use the '{}' date format: "
         user_entry = input(input_text.format(date_format['UI format']))
+        if optional and not user_entry:
+            return (None, None)
         # validate date entry
         validated = self.validate_date_entry(user_entry, date_format)
         return validated